@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark: continuous batching vs. today's serial generation path.
+
+For each concurrency level, N simulated users each ask one question at the
+same time. The serial path pushes them through HealthEngine's single
+create_chat_completion context one after another; the batched path decodes
+them together with BatchedGenerator. Reports aggregate tokens/sec, mean
+time-to-first-token and mean end-to-end latency.
+
+Usage:
+    python scripts/bench_batching.py --model path/to/model.gguf --users 1 4 8 --max-tokens 128
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from llama_cpp import Llama
+
+from batching import BatchedGenerator
+from engine import HealthEngine, SYSTEM_PROMPTS
+
+QUERIES = [
+    ("English", "What are the symptoms of dengue?"),
+    ("English", "How is malaria treated?"),
+    ("Marathi", "मला डोकेदुखी आहे, काय करावे?"),
+    ("English", "What is a common cold?"),
+    ("Marathi", "सर्दीची लक्षणे काय आहेत?"),
+    ("English", "When should I see a doctor for a fever?"),
+    ("English", "What causes migraines?"),
+    ("Marathi", "मधुमेह म्हणजे काय?")
+]
+
+def run_users(stream_fn, engine, users):
+    """Start `users` concurrent requests and collect per-request timings."""
+    results = [None] * users
+    barrier = threading.Barrier(users)
+
+    def user(i):
+        language, query = QUERIES[i % len(QUERIES)]
+        prompt = engine.construct_prompt(query, language)
+        barrier.wait()
+        start = time.perf_counter()
+        first_token_at = None
+        tokens = 0
+        for _ in stream_fn(prompt):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            tokens += 1
+        end = time.perf_counter()
+        results[i] = (start, first_token_at or end, end, tokens)
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    wall = max(r[2] for r in results) - min(r[0] for r in results)
+    tokens = sum(r[3] for r in results)
+    return {
+        "users": users,
+        "tokens": tokens,
+        "wall_s": wall,
+        "tokens_per_sec": tokens / wall if wall > 0 else 0.0,
+        "mean_ttft_s": sum(r[1] - r[0] for r in results) / users,
+        "mean_latency_s": sum(r[2] - r[0] for r in results) / users
+    }
+
+def print_row(label, result):
+    print(f"{label:<8} {result['users']:>5} {result['tokens']:>7} {result['wall_s']:>8.2f} "
+          f"{result['tokens_per_sec']:>9.1f} {result['mean_ttft_s']:>9.2f} {result['mean_latency_s']:>11.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, help="path to a GGUF model file")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--n-ctx-per-sequence", type=int, default=2048)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    print(f"Loading {args.model}...")
+    model = Llama(model_path=args.model, n_ctx=args.n_ctx_per_sequence, n_threads=args.threads, verbose=False)
+    engine = HealthEngine()
+    engine.model = model
+    engine.load_prompt_cache(args.model, progress=lambda message: None)
+
+    def serial_stream(prompt):
+        # Same path as HealthEngine.generate_response_stream, with a benchmark-sized max_tokens
+        with engine.lock:
+            engine.restore_prompt_prefix(prompt)
+            for chunk in model.create_chat_completion(messages=prompt, temperature=0.7,
+                                                      max_tokens=args.max_tokens, stream=True):
+                if chunk['choices'][0]['delta'].get('content'):
+                    yield chunk
+
+    batcher = BatchedGenerator(model, n_parallel=max(args.users), n_ctx_per_sequence=args.n_ctx_per_sequence,
+                               shared_prefixes=SYSTEM_PROMPTS.values())
+
+    def batched_stream(prompt):
+        return batcher.stream(prompt, max_tokens=args.max_tokens, temperature=0.7)
+
+    # Warm both paths so the first row doesn't pay one-off costs
+    run_users(serial_stream, engine, 1)
+    run_users(batched_stream, engine, 1)
+
+    print(f"\n{'path':<8} {'users':>5} {'tokens':>7} {'wall s':>8} {'tok/s':>9} {'ttft s':>9} {'latency s':>11}")
+    for users in args.users:
+        print_row("serial", run_users(serial_stream, engine, users))
+        print_row("batched", run_users(batched_stream, engine, users))
+    batcher.close()
+
+if __name__ == "__main__":
+    main()
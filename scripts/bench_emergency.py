@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the emergency keyword matcher.
+
+Builds a large synthetic corpus of English and Marathi questions from
+benchmarks/corpus.json and the condition names in data/conditions.jsonl,
+with a share of them containing an emergency keyword, then times per query:
+
+    normalize     emergency.fold() alone (shared by every method)
+    aho-corasick  emergency.KeywordMatcher.search, as used by the scheduler
+    regex         one compiled alternation with the same word-boundary rules
+    naive         a substring test per keyword, the obvious loop
+
+and checks that the matcher finds exactly what the regex finds. --extra-keywords
+adds random keywords to show how each method scales with the keyword list.
+
+Usage:
+    python scripts/bench_emergency.py --queries 100000 --extra-keywords 0 500
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import config
+from emergency import INFLECTIONS, KeywordMatcher, fold
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+TEMPLATES = {
+    "English": ["my mother has {}", "what should I do about {} at night", "{} since this morning, please help",
+                "is {} serious", "my child has {} and fever"],
+    "Marathi": ["माझ्या आईला {} आहे", "{} झाल्यास काय करावे", "सकाळपासून {} आहे, मदत करा", "{} गंभीर आहे का"]
+}
+
+def build_corpus(n_queries, emergency_rate, keywords, seed=0):
+    rng = random.Random(seed)
+    with open(os.path.join(ROOT, "benchmarks", "corpus.json"), encoding='utf-8') as f:
+        questions = [(item["language"], item["query"]) for item in json.load(f)]
+    with open(config.KNOWLEDGE["source"], encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            for language, names in record["names"].items():
+                questions.extend((language, f"What is {name}?") for name in names)
+    marathi = [k for k in keywords if any('ऀ' <= ch <= 'ॿ' for ch in k)]
+    english = [k for k in keywords if k not in marathi]
+    corpus = []
+    for _ in range(n_queries):
+        language, query = rng.choice(questions)
+        if rng.random() < emergency_rate:
+            keyword = rng.choice(marathi if language == "Marathi" and marathi else english)
+            query = rng.choice(TEMPLATES[language]).format(keyword)
+        corpus.append(query)
+    return corpus
+
+def random_keywords(count, seed=1):
+    rng = random.Random(seed)
+    return [" ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+                     for _ in range(rng.randint(1, 3))) for _ in range(count)]
+
+def regex_matcher(keywords):
+    """The same rules as KeywordMatcher: word start, and word end (after an inflection) unless the keyword ends in Devanagari."""
+    inflection = f"(?:{'|'.join(INFLECTIONS)})?"
+    alternatives = []
+    for keyword in sorted({fold(k) for k in keywords}, key=len, reverse=True):
+        end = "" if 'ऀ' <= keyword[-1] <= 'ॿ' else f"{inflection}(?= |$)"
+        alternatives.append(re.escape(keyword) + end)
+    pattern = re.compile(f"(?:^| )(?:{'|'.join(alternatives)})")
+    return lambda text: pattern.search(fold(text)) is not None
+
+def naive_matcher(keywords):
+    normalized = [fold(k) for k in keywords]
+    def search(text):
+        text = f" {fold(text)} "
+        return any(f" {keyword}" in text for keyword in normalized)
+    return search
+
+def time_per_query(function, corpus):
+    """Per-query times in microseconds, sorted."""
+    times = []
+    for query in corpus:
+        start = time.perf_counter_ns()
+        function(query)
+        times.append((time.perf_counter_ns() - start) / 1000)
+    times.sort()
+    return times
+
+def report(name, times):
+    n = len(times)
+    mean = sum(times) / n
+    print(f"  {name:<14} mean {mean:7.2f} us   p50 {times[n // 2]:7.2f} us   "
+          f"p99 {times[int(n * 0.99)]:7.2f} us   {1e6 / mean:>10,.0f} queries/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the emergency keyword matcher")
+    parser.add_argument("--queries", type=int, default=100000)
+    parser.add_argument("--emergency-rate", type=float, default=0.02, help="share of queries with an emergency keyword")
+    parser.add_argument("--extra-keywords", type=int, nargs="+", default=[0, 500],
+                        help="random keywords added to the configured ones, one run per value")
+    args = parser.parse_args()
+
+    base = config.SAFETY["emergency_keywords"] + config.SAFETY["emergency_keywords_marathi"]
+    corpus = build_corpus(args.queries, args.emergency_rate, base)
+    print(f"{len(corpus)} queries, {args.emergency_rate:.0%} with an emergency keyword")
+
+    for extra in args.extra_keywords:
+        keywords = base + random_keywords(extra)
+        start = time.perf_counter()
+        matcher = KeywordMatcher(keywords)
+        build_ms = (time.perf_counter() - start) * 1000
+        regex, naive = regex_matcher(keywords), naive_matcher(keywords)
+        print(f"\n{len(keywords)} keywords, automaton of {len(matcher.goto)} states built in {build_ms:.1f} ms")
+        report("normalize", time_per_query(fold, corpus))
+        report("aho-corasick", time_per_query(matcher.search, corpus))
+        report("regex", time_per_query(regex, corpus))
+        report("naive", time_per_query(naive, corpus))
+
+        mismatches = [query for query in corpus if (matcher.search(query) is not None) != regex(query)]
+        hits = sum(matcher.search(query) is not None for query in corpus)
+        print(f"  {hits} matches; {len(mismatches)} disagreements with the regex")
+        for query in mismatches[:5]:
+            print(f"    {query!r}")
+        if mismatches:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Reproducible latency benchmark for the llama.cpp generation path.
+
+Drives HealthEngine.construct_prompt/generate_response_stream headlessly (no
+Tkinter, audio or response cache) over the fixed English+Marathi corpus in
+benchmarks/corpus.json and reports, per request and in aggregate:
+
+    prompt_eval_ms   llama.cpp prompt evaluation time (after the prompt cache restore)
+    ttft_ms          time to first token
+    tokens_per_sec   decode speed after the first token
+    latency_ms       end-to-end time, summarized as p50/p95/p99
+    peak_rss_mb      peak resident memory of the benchmark process
+
+Results are written as JSON and compared against a stored baseline; the exit
+status is 1 when a metric regresses by more than --tolerance. Runs on a
+CPU-only machine with any GGUF model, including a tiny test model:
+
+    python scripts/benchmark.py --model path/to/tiny.gguf --n-gpu-layers 0
+    python scripts/benchmark.py --model path/to/tiny.gguf --save-baseline
+
+Inference profile flags (--profile, --n-ctx, --n-threads, ...) work as for
+server.py. Sampling defaults to temperature 0 so repeated runs generate the
+same tokens. Knowledge notes are left out of the prompts, which keeps them the
+same length as in baselines recorded before the knowledge index; --knowledge
+adds them, and the results record which was used.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import llama_cpp
+
+import config
+from engine import HealthEngine
+from scheduler import summarize
+from settings import ConfigError, add_profile_arguments, profile_from_args
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks")
+
+# Summary metrics checked against the baseline: (metric, statistic, True if higher is better)
+COMPARED_METRICS = [
+    ("prompt_eval_ms", "p50", False),
+    ("ttft_ms", "p50", False),
+    ("ttft_ms", "p95", False),
+    ("latency_ms", "p50", False),
+    ("latency_ms", "p95", False),
+    ("latency_ms", "p99", False),
+    ("tokens_per_sec", "p50", True),
+    ("peak_rss_mb", None, False)
+]
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def run_query(engine, language, query):
+    """Generate one answer and return its timings."""
+    llama_cpp.llama_perf_context_reset(engine.model.ctx)
+    start = time.perf_counter()
+    prompt = engine.construct_prompt(query, language)
+    first_token_at = None
+    tokens = 0
+    for _ in engine.generate_response_stream(prompt):
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        tokens += 1 # Each streamed chunk from llama.cpp carries one token
+    end = time.perf_counter()
+    perf = llama_cpp.llama_perf_context(engine.model.ctx)
+
+    decode_time = end - first_token_at if first_token_at is not None else 0.0
+    return {
+        "language": language,
+        "query": query,
+        "prompt_tokens": perf.n_p_eval,
+        "prompt_eval_ms": perf.t_p_eval_ms,
+        "ttft_ms": (first_token_at - start) * 1000 if first_token_at is not None else None,
+        "tokens": tokens,
+        "tokens_per_sec": (tokens - 1) / decode_time if decode_time > 0 else None,
+        "latency_ms": (end - start) * 1000
+    }
+
+def summarize_requests(requests):
+    summary = {}
+    for metric in ("prompt_eval_ms", "ttft_ms", "tokens_per_sec", "latency_ms"):
+        summary[metric] = summarize(sorted(r[metric] for r in requests if r[metric] is not None))
+    summary["tokens"] = sum(r["tokens"] for r in requests)
+    return summary
+
+def run_benchmark(engine, corpus, repeat, progress=print):
+    # One untimed request pulls the mmap'd weights into memory first
+    run_query(engine, corpus[0]["language"], corpus[0]["query"])
+
+    requests = []
+    for round_index in range(repeat):
+        for i, item in enumerate(corpus, 1):
+            result = run_query(engine, item["language"], item["query"])
+            requests.append(result)
+            progress(f"[{round_index + 1}/{repeat}] {i:>2}/{len(corpus)} {item['language']:<8} "
+                     f"ttft {result['ttft_ms'] or 0:7.1f} ms  total {result['latency_ms']:8.1f} ms  {result['tokens']:>4} tokens")
+
+    summary = summarize_requests(requests)
+    summary["peak_rss_mb"] = peak_rss_mb()
+    by_language = {
+        language: summarize_requests([r for r in requests if r["language"] == language])
+        for language in sorted({r["language"] for r in requests})
+    }
+    return {"summary": summary, "by_language": by_language, "requests": requests}
+
+def metric_value(summary, metric, statistic):
+    value = summary.get(metric)
+    if statistic is not None:
+        value = (value or {}).get(statistic)
+    return value
+
+def compare(results, baseline, tolerance):
+    """Return a list of (name, baseline, current, change, regressed) rows."""
+    rows = []
+    for metric, statistic, higher_is_better in COMPARED_METRICS:
+        old = metric_value(baseline["summary"], metric, statistic)
+        new = metric_value(results["summary"], metric, statistic)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        name = f"{metric}.{statistic}" if statistic else metric
+        rows.append((name, old, new, change, regressed))
+    return rows
+
+def print_summary(summary):
+    print(f"\n{'metric':<16} {'p50':>10} {'p95':>10} {'p99':>10} {'mean':>10}")
+    for metric in ("prompt_eval_ms", "ttft_ms", "tokens_per_sec", "latency_ms"):
+        stats = summary[metric]
+        if stats["count"]:
+            print(f"{metric:<16} {stats['p50']:>10.1f} {stats['p95']:>10.1f} {stats['p99']:>10.1f} {stats['mean']:>10.1f}")
+    if summary["peak_rss_mb"] is not None:
+        print(f"{'peak_rss_mb':<16} {summary['peak_rss_mb']:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="path to a GGUF model file (default: the configured model)")
+    parser.add_argument("--corpus", default=os.path.join(BENCHMARK_DIR, "corpus.json"))
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the corpus")
+    parser.add_argument("--output", default=os.path.join(BENCHMARK_DIR, "latest.json"), help="where to write the JSON results")
+    parser.add_argument("--baseline", default=os.path.join(BENCHMARK_DIR, "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression (0.10 = 10%%)")
+    parser.add_argument("--knowledge", action="store_true", help="add knowledge index notes to the prompts")
+    add_profile_arguments(parser)
+    parser.set_defaults(profile_max_tokens=128, profile_temperature=0.0)
+    args = parser.parse_args()
+
+    try:
+        # Requests run one at a time and the response cache would hide generation
+        profile = profile_from_args(args).replace(batching=False)
+    except ConfigError as e:
+        parser.exit(2, f"Configuration error: {e}\n")
+    if args.model:
+        config.MODEL["path"] = args.model
+    config.MODEL["warmup"] = False # run_benchmark does its own, untimed warm-up
+    config.KNOWLEDGE["enabled"] = args.knowledge # Notes change the prompt length
+
+    corpus = load_corpus(args.corpus)
+    engine = HealthEngine(profile, use_response_cache=False)
+    engine.load_model(progress=lambda message: None)
+    print(f"Model loaded in {sum(engine.startup_timer.phases.values()):.0f} ms; "
+          f"{len(corpus)} queries x {args.repeat} with profile '{profile.name}'")
+
+    results = run_benchmark(engine, corpus, args.repeat)
+    results["meta"] = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model": os.path.basename(config.MODEL["path"] or config.MODEL["filename"]),
+        "profile": vars(profile),
+        "knowledge": engine.knowledge is not None,
+        "startup_ms": dict(engine.startup_timer.phases),
+        "corpus": os.path.basename(args.corpus),
+        "repeat": args.repeat,
+        "host": {
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+            "llama_cpp": llama_cpp.__version__
+        }
+    }
+    print_summary(results["summary"])
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\nResults written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Baseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against; run again with --save-baseline to store one.")
+        return
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline["meta"]["model"] != results["meta"]["model"] or baseline["meta"]["profile"] != results["meta"]["profile"]:
+        print("Warning: the baseline was recorded with a different model or profile.")
+    # Baselines from before the knowledge index ran without notes
+    if baseline["meta"].get("knowledge", False) != results["meta"]["knowledge"]:
+        print("Warning: the baseline was recorded with knowledge notes " +
+              ("on." if baseline["meta"].get("knowledge") else "off."))
+    rows = compare(results, baseline, args.tolerance)
+    print(f"\n{'vs baseline':<20} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, old, new, change, regressed in rows:
+        print(f"{name:<20} {old:>10.1f} {new:>10.1f} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    if any(row[4] for row in rows):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
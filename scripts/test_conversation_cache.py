@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Checks that the response cache keeps working inside a conversation.
+
+The desktop app sends every question with the same session, so only
+questions that point back at the conversation may skip the cache. Runs a
+HealthEngine without a model (generation is replaced by a canned answer)
+against a temporary cache:
+
+    python scripts/test_conversation_cache.py
+
+Exits with status 1 on a failure.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import config
+from conversation import refers_back
+
+STANDALONE = ["symptoms of dengue", "What is malaria?", "how to treat a migraine", "डेंग्यूची लक्षणे काय आहेत"]
+FOLLOW_UPS = ["is it contagious?", "How is it treated?", "what about children?", "and in pregnancy?",
+              "how long?", "Symptoms?", "त्याचे उपचार काय आहेत", "आणि मुलांमध्ये?"]
+
+def language_of(query):
+    return "Marathi" if any('ऀ' <= ch <= 'ॿ' for ch in query) else "English"
+
+def test_refers_back():
+    for query in STANDALONE:
+        assert not refers_back(query, language_of(query)), f"{query!r} taken for a follow-up"
+    for query in FOLLOW_UPS:
+        assert refers_back(query, language_of(query)), f"{query!r} not taken for a follow-up"
+
+def canned_engine(directory):
+    config.RESPONSE_CACHE["path"] = os.path.join(directory, "responses.sqlite3")
+    config.KNOWLEDGE["enabled"] = False # Curated answers would hide the response cache
+    config.OUTPUT_LIMITS["history_file"] = os.path.join(directory, "output_lengths.json")
+    from engine import HealthEngine
+    engine = HealthEngine()
+    engine.generated = []
+
+    def generate_response_stream(prompt_messages, max_tokens=None, language=None, structured=False):
+        engine.generated.append(prompt_messages[-1]["content"])
+        yield f"1. Disease Name: answer {len(engine.generated)}"
+    engine.generate_response_stream = generate_response_stream
+    return engine
+
+def final_event(engine, query, session):
+    for event in engine.stream_answer(query, "English", session=session):
+        pass
+    return event
+
+def test_second_turn_cache_hit():
+    with tempfile.TemporaryDirectory() as directory:
+        engine = canned_engine(directory)
+        first, second = "session-1", "session-2"
+        assert not final_event(engine, "What is influenza?", first)["cached"]
+        # Second turn of the session: a new standalone question is generated and stored...
+        assert not final_event(engine, "symptoms of dengue", first)["cached"]
+        assert engine.response_cache.stats()["entries"] == 2
+        # ...and served from the cache on a later turn, in this or any other session
+        assert final_event(engine, "Symptoms of dengue?", first)["cached"]
+        final_event(engine, "What is influenza?", second)
+        assert final_event(engine, "symptoms of dengue", second)["cached"]
+        # A follow-up is generated with the history and never stored
+        entries = engine.response_cache.stats()["entries"]
+        assert not final_event(engine, "is it contagious?", first)["cached"]
+        assert engine.response_cache.stats()["entries"] == entries
+        assert not final_event(engine, "is it contagious?", first)["cached"]
+        assert len(engine.generated) == 4
+        engine.response_cache.close()
+
+def main():
+    failed = False
+    for test in (test_refers_back, test_second_turn_cache_hit):
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Checks the emergency detector in both directions: questions describing an
+emergency happening now must match, questions about a condition must not.
+
+    python scripts/test_emergency.py
+
+Exits with status 1 on a failure.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from emergency import create_detector
+
+EMERGENCIES = [
+    "my son is having seizures",
+    "he had a seizure an hour ago",
+    "sharp chest pains since morning",
+    "i cant breathe",
+    "I can't breathe",
+    "I can’t breathe properly",
+    "my father is having a heart attack",
+    "she collapsed, I think it is a stroke",
+    "what should I do, my mother is unconscious",
+    "he overdosed on sleeping pills",
+    "my child swallowed rat poison, poisoning",
+    "माझ्या वडिलांना छातीत दुखत आहे",
+    "आई बेशुद्ध झाली",
+    "saap chavla, kay karu",
+    "heat stroke",
+    "my grandfather collapsed with heat stroke",
+    "he has sunstroke and is confused",
+    "sun stroke",
+    "food poisoning, now he is unconscious",
+]
+
+NOT_EMERGENCIES = [
+    "food poisoning",
+    "how to treat food poisoning at home",
+    "symptoms of food poisonings",
+    "what is a stroke",
+    "What is the stroke?",
+    "how to prevent heart attack",
+    "risk of stroke in young adults",
+    "stroke risk factors",
+    "what are the symptoms of dengue",
+    "हृदयविकार म्हणजे काय",
+    "हृदयविकार कसा टाळावा",
+]
+
+def test_emergencies():
+    detector = create_detector()
+    missed = [query for query in EMERGENCIES if detector.check(query) is None]
+    assert not missed, f"missed {missed}"
+
+def test_not_emergencies():
+    detector = create_detector()
+    matched = [(query, detector.check(query)) for query in NOT_EMERGENCIES if detector.check(query) is not None]
+    assert not matched, f"matched {matched}"
+
+def main():
+    failed = False
+    for test in (test_emergencies, test_not_emergencies):
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
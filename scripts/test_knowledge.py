@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Checks which record the knowledge index matches for a question, against
+data/conditions.jsonl: questions about a known condition must find it, and
+questions about a different condition that shares a word with one of its
+names must find nothing (their notes would go into the prompt).
+
+    python scripts/test_knowledge.py
+
+Exits with status 1 on a failure.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import config
+from knowledge import open_index
+
+# (question, language, kind of hit, record id)
+MATCHES = [
+    ("What is dengue?", "English", "exact", "dengue"),
+    ("symptoms of dengue fever", "English", "exact", "dengue"),
+    ("how is malaria treated", "English", "exact", "malaria"),
+    ("type 2 diabetes diet", "English", "near", "type_2_diabetes"),
+    ("high blood pressure in pregnancy", "English", "near", "hypertension"),
+    ("डेंग्यूची लक्षणे काय आहेत", "Marathi", "exact", "dengue"),
+]
+
+MISSES = [
+    ("type 1 diabetes", "English"),
+    ("gestational diabetes", "English"),
+    ("diabetes in cats", "English"),
+    ("cold sore", "English"),
+    ("my hands are always cold", "English"),
+    ("मला ताप आहे", "Marathi"),
+]
+
+def open_test_index(directory):
+    settings = dict(config.KNOWLEDGE, enabled=True, index=os.path.join(directory, "knowledge.idx"))
+    return open_index(settings)
+
+def test_matches():
+    with tempfile.TemporaryDirectory() as directory:
+        index = open_test_index(directory)
+        for query, language, kind, record in MATCHES:
+            match = index.lookup(query, language)
+            found = (match[0], match[1]["id"]) if match else None
+            assert found == (kind, record), f"{query!r} gave {found}, expected {(kind, record)}"
+        index.close()
+
+def test_misses():
+    with tempfile.TemporaryDirectory() as directory:
+        index = open_test_index(directory)
+        for query, language in MISSES:
+            match = index.lookup(query, language)
+            assert match is None, f"{query!r} matched {match[1]['id']} ({match[0]})"
+        index.close()
+
+def main():
+    failed = False
+    for test in (test_matches, test_misses):
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
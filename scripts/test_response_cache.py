@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Checks the response cache's near-duplicate tier against medically different
+questions that score high on trigram similarity, and against the rephrasings
+it is meant to catch:
+
+    python scripts/test_response_cache.py
+
+Exits with status 1 on a failure.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import config
+from response_cache import ResponseCache, cosine_similarity, normalize_query, trigram_profile
+
+# Cached question, different question that scores above the threshold
+DIFFERENT = [
+    ("what is type 1 diabetes", "what is type 2 diabetes"),
+    ("symptoms of hepatitis b", "symptoms of hepatitis c"),
+    ("treatment for influenza a", "treatment for influenza b"),
+    ("symptoms of heart attack in women", "symptoms of heart attack in men"),
+    ("is chickenpox contagious", "is chickenpox not contagious"),
+]
+
+# Cached question, rephrasing that should share its answer
+SAME = [
+    ("what are the symptoms of dengue", "what are symptoms of dengue"),
+    ("symptoms of typhoid", "symptom of typhoid"),
+    ("common symptoms of diabetes", "common symptoms of diabetis"),
+    ("malaria symptoms", "symptoms of malaria"),
+]
+
+def similarity(a, b):
+    return cosine_similarity(trigram_profile(normalize_query(a)), trigram_profile(normalize_query(b)))
+
+def near_duplicate_cache(directory):
+    return ResponseCache(os.path.join(directory, "responses.sqlite3"), near_duplicate=True,
+                         similarity_threshold=config.RESPONSE_CACHE["similarity_threshold"])
+
+def test_off_by_default():
+    assert not config.RESPONSE_CACHE["near_duplicate"], "the near-duplicate tier is enabled in config"
+
+def test_different_questions():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = near_duplicate_cache(directory)
+        for cached, asked in DIFFERENT:
+            assert similarity(cached, asked) >= cache.similarity_threshold, f"{asked!r} no longer scores high"
+            cache.put("English", cached, f"answer to {cached}")
+            response = cache.get("English", asked)
+            assert response is None, f"{asked!r} got the answer to {response[len('answer to '):]!r}"
+        cache.close()
+
+def test_rephrasings():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = near_duplicate_cache(directory)
+        for cached, asked in SAME:
+            cache.put("English", cached, f"answer to {cached}")
+            assert cache.get("English", asked) == f"answer to {cached}", f"{asked!r} missed {cached!r}"
+        cache.close()
+
+def main():
+    failed = False
+    for test in (test_off_by_default, test_different_questions, test_rephrasings):
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
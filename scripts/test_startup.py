@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Startup regression test for the desktop app.
+
+1. Runs `python -X importtime -c "import main"` and fails if importing the
+   app module pulls in any of the heavy libraries, which must only be
+   imported by the background startup tasks. Prints the slowest imports.
+2. When a display is available, launches the app with --startup-report and
+   --exit-when-ready and checks when the window was shown and when startup
+   finished, against fixed limits or a stored baseline:
+
+    python scripts/test_startup.py
+    python scripts/test_startup.py --profile low-latency-laptop --save-baseline
+
+Exits with status 1 on a failure.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks")
+
+# Must not be imported before the window is shown
+HEAVY_MODULES = ("llama_cpp", "numpy", "pygame", "speech_recognition", "vosk", "gtts", "huggingface_hub")
+
+# Milestones checked against the baseline
+COMPARED_MARKS = ("window_shown", "ready")
+
+def import_times():
+    """Return {module: (self_us, cumulative_us)} for `import main`."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=SRC_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr)
+        raise SystemExit("❌ `import main` failed")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            times[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue # Header line
+    return times
+
+def check_imports(top):
+    times = import_times()
+    heavy = sorted(name for name in times if name.split(".")[0] in HEAVY_MODULES)
+    print(f"`import main`: {times.get('main', (0, 0))[1] / 1000:.1f} ms, {len(times)} modules")
+    for name, (_, cumulative) in sorted(times.items(), key=lambda item: -item[1][1])[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    if heavy:
+        print(f"❌ Heavy modules imported at startup: {', '.join(heavy)}")
+        return False
+    print("✅ No heavy modules imported before the window is shown")
+    return True
+
+def measure_startup(app_args, timeout):
+    with tempfile.TemporaryDirectory() as tmp:
+        report_path = os.path.join(tmp, "startup.json")
+        command = [sys.executable, os.path.join(SRC_DIR, "main.py"),
+                   "--startup-report", report_path, "--exit-when-ready"] + app_args
+        subprocess.run(command, timeout=timeout, check=True)
+        with open(report_path, encoding='utf-8') as f:
+            return json.load(f)
+
+def check_timeline(report, args):
+    marks = report["marks"]
+    ok = True
+    for name in COMPARED_MARKS:
+        if name not in marks:
+            print(f"❌ Startup never reached {name}")
+            ok = False
+    if not ok:
+        return False
+    if marks["window_shown"] > args.max_window_ms:
+        print(f"❌ Window shown after {marks['window_shown']:.0f} ms (limit {args.max_window_ms:.0f} ms)")
+        ok = False
+    failed = [name for name, task in report["tasks"].items() if task["error"]]
+    if failed:
+        print(f"⚠️  Startup tasks failed: {', '.join(failed)}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\n{'vs baseline':<20} {'baseline':>10} {'current':>10} {'change':>8}")
+        for name in COMPARED_MARKS:
+            old, new = baseline["marks"].get(name), marks[name]
+            if not old:
+                continue
+            change = (new - old) / old
+            flag = "  REGRESSED" if change > args.tolerance else ""
+            print(f"{name:<20} {old:>10.0f} {new:>10.0f} {change:>+8.1%}{flag}")
+            ok = ok and change <= args.tolerance
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the desktop app starts quickly")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to show")
+    parser.add_argument("--max-window-ms", type=float, default=1500, help="limit for showing the window")
+    parser.add_argument("--baseline", default=os.path.join(BENCHMARK_DIR, "startup_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="store this startup as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression (0.25 = 25%%)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for the app to start")
+    args, app_args = parser.parse_known_args() # Other flags (--profile, --server, ...) go to the app
+
+    ok = check_imports(args.top)
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY"):
+        print("No display; skipping the window startup check.")
+    else:
+        print("\nStarting the app...")
+        report = measure_startup(app_args, args.timeout)
+        for name, at in sorted(report["marks"].items(), key=lambda item: item[1]):
+            print(f"  {at:8.1f} ms  {name}")
+        ok = check_timeline(report, args) and ok
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Pluggable speech recognition for spoken questions.
+
+Two backends share one interface, listen(language, on_partial) -> text, where
+`language` is a key of config.SUPPORTED_LANGUAGES ("English", "Marathi"):
+
+- "google": the speech_recognition package and Google's web API, as before,
+  but the ambient noise level is calibrated once and cached instead of being
+  measured on every click.
+- "vosk": offline recognition with a local Vosk model. Audio is streamed to
+  the recognizer in small chunks, partial transcripts are reported while the
+  user is still speaking, and an energy-based voice activity detector ends
+  the utterance after a short silence instead of waiting out the full
+  phrase time limit. Languages without a configured model fall back to
+  the "google" backend.
+
+The noise calibration (an energy threshold per microphone) is stored in
+ASR["calibration_file"] and reused until it is older than
+ASR["calibration_max_age"].
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import speech_recognition as sr
+
+import tracing
+
+def rms_energy(chunk):
+    """Root mean square amplitude of 16-bit mono PCM, the same measure speech_recognition uses."""
+    samples = np.frombuffer(chunk, dtype=np.int16).astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples))) if len(samples) else 0.0
+
+class NoiseCalibration:
+    """Speech/silence energy threshold per microphone, measured once and cached on disk."""
+
+    def __init__(self, path, max_age, multiplier=1.5, minimum=100.0):
+        self.path = path
+        self.max_age = max_age
+        self.multiplier = multiplier
+        self.minimum = minimum
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def threshold(self, device, measure):
+        """The cached threshold for `device`, or a new one from measure() -> ambient RMS energy."""
+        calibrations = self.load()
+        entry = calibrations.get(device)
+        if entry and time.time() - entry["calibrated"] < self.max_age:
+            return entry["threshold"]
+
+        threshold = max(self.minimum, measure() * self.multiplier)
+        calibrations[device] = {"threshold": threshold, "calibrated": time.time()}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(calibrations, f, indent=2)
+        except OSError as e:
+            print(f"Noise calibration save error: {e}")
+        return threshold
+
+def measure_ambient(source, duration):
+    """Mean RMS energy of `duration` seconds from an open sr.Microphone."""
+    chunks = int(duration * source.SAMPLE_RATE / source.CHUNK) or 1
+    return float(np.mean([rms_energy(source.stream.read(source.CHUNK)) for _ in range(chunks)]))
+
+def device_name(device_index):
+    names = sr.Microphone.list_microphone_names()
+    if device_index is not None and device_index < len(names):
+        return names[device_index]
+    return "default"
+
+class GoogleRecognizer:
+    """Online recognition through speech_recognition.recognize_google."""
+
+    def __init__(self, settings, languages, calibration):
+        self.settings = settings
+        self.languages = languages
+        self.calibration = calibration
+        self.recognizer = sr.Recognizer()
+        self.recognizer.dynamic_energy_threshold = False
+        self.recognizer.pause_threshold = settings["end_silence"]
+        self.microphone = sr.Microphone(device_index=settings["device_index"])
+
+    def listen(self, language, on_partial=None):
+        """Record one utterance and return its transcript ("" if nothing was understood)."""
+        with self.microphone as source:
+            self.recognizer.energy_threshold = self.calibration.threshold(
+                device_name(self.settings["device_index"]),
+                lambda: measure_ambient(source, self.settings["ambient_noise_duration"]))
+            try:
+                with tracing.span("record", backend="google"):
+                    audio = self.recognizer.listen(source, timeout=self.settings["timeout"],
+                                                   phrase_time_limit=self.settings["phrase_time_limit"])
+            except sr.WaitTimeoutError:
+                return ""
+        with tracing.span("recognize", backend="google", language=language) as span:
+            try:
+                text = self.recognizer.recognize_google(audio, language=self.languages[language]["speech_code"])
+            except sr.UnknownValueError:
+                text = ""
+            span.set(chars=len(text), bytes=len(audio.frame_data))
+        return text
+
+class VoskRecognizer:
+    """Offline, streaming recognition with local Vosk models."""
+
+    def __init__(self, settings, languages, calibration, fallback=None):
+        import vosk
+        vosk.SetLogLevel(-1)
+        self.vosk = vosk
+        self.settings = settings
+        self.languages = languages
+        self.calibration = calibration
+        self.fallback = fallback
+        self.models = {} # model path -> vosk.Model
+        self.models_lock = threading.Lock()
+        # Loading a model takes a few seconds; do it before the first click
+        threading.Thread(target=lambda: [self.model(language) for language in languages], daemon=True).start()
+
+    def model(self, language):
+        path = self.settings["vosk_models"].get(language)
+        if not path or not os.path.isdir(path):
+            return None
+        with self.models_lock:
+            if path not in self.models:
+                self.models[path] = self.vosk.Model(path)
+            return self.models[path]
+
+    def listen(self, language, on_partial=None):
+        """Record until the speaker pauses, reporting partial transcripts to on_partial(text)."""
+        model = self.model(language)
+        if model is None:
+            if self.fallback is None:
+                raise Exception(f"No offline speech model configured for {language}")
+            return self.fallback.listen(language, on_partial)
+
+        with tracing.span("recognize", backend="vosk", language=language) as span:
+            text = self.recognize(model, on_partial)
+            span.set(chars=len(text))
+        return text
+
+    def recognize(self, model, on_partial):
+        """Stream microphone audio to Vosk until the end of the utterance."""
+        settings = self.settings
+        sample_rate = settings["sample_rate"]
+        recognizer = self.vosk.KaldiRecognizer(model, sample_rate)
+        with sr.Microphone(device_index=settings["device_index"], sample_rate=sample_rate, chunk_size=1024) as source:
+            chunk_seconds = source.CHUNK / sample_rate
+            threshold = self.calibration.threshold(
+                device_name(settings["device_index"]),
+                lambda: measure_ambient(source, settings["ambient_noise_duration"]))
+
+            segments = []
+            partial = ""
+            waited = speaking = silence = 0.0 # seconds
+            while True:
+                chunk = source.stream.read(source.CHUNK)
+                loud = rms_energy(chunk) > threshold
+                if speaking or loud:
+                    speaking += chunk_seconds
+                    silence = 0.0 if loud else silence + chunk_seconds
+                else:
+                    waited += chunk_seconds
+                    if waited >= settings["timeout"]:
+                        return "" # Nobody started speaking
+
+                if recognizer.AcceptWaveform(chunk):
+                    text = json.loads(recognizer.Result())["text"]
+                    if text:
+                        segments.append(text)
+                    partial = ""
+                else:
+                    partial = json.loads(recognizer.PartialResult())["partial"]
+                if on_partial is not None and partial:
+                    on_partial(" ".join(segments + [partial]))
+
+                if speaking and silence >= settings["end_silence"]:
+                    break # Voice activity detection: the speaker has paused
+                if speaking >= settings["phrase_time_limit"]:
+                    break
+
+        text = json.loads(recognizer.FinalResult())["text"]
+        if text:
+            segments.append(text)
+        return " ".join(segments)
+
+def create_recognizer(settings, languages):
+    """Build the recognizer named by settings["backend"] ("google" or "vosk")."""
+    calibration = NoiseCalibration(settings["calibration_file"], settings["calibration_max_age"],
+                                   multiplier=settings["energy_multiplier"])
+    if settings["backend"] == "google":
+        return GoogleRecognizer(settings, languages, calibration)
+    if settings["backend"] == "vosk":
+        try:
+            fallback = GoogleRecognizer(settings, languages, calibration)
+        except Exception as e:
+            print(f"Online speech recognition unavailable: {e}")
+            fallback = None
+        return VoskRecognizer(settings, languages, calibration, fallback)
+    raise Exception(f"Unknown speech recognition backend '{settings['backend']}'")
@@ -0,0 +1,108 @@
+"""
+Content-addressed cache of synthesized speech.
+
+Each clip is stored as one file named by the SHA-256 of (TTS backend,
+language, normalized sentence), so the disclaimer or a repeated answer is
+synthesized once and then read from disk. Normalization folds Unicode forms,
+case and whitespace but keeps punctuation, which changes how a sentence is
+spoken.
+
+The directory is bounded by `max_bytes`: the least recently used clips are
+deleted first. Use order survives restarts through the files' mtimes.
+"""
+
+import hashlib
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_sentence(text):
+    return ' '.join(unicodedata.normalize('NFKC', text).casefold().split())
+
+
+class AudioCache:
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # file name -> size in bytes, oldest use first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def key(self, backend, language, text):
+        return hashlib.sha256(f"{backend}\0{language}\0{normalize_sentence(text)}".encode('utf-8')).hexdigest()
+
+    def load(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if '.tmp' in name:
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+        self.evict()
+
+    def get(self, key, audio_format):
+        name = f"{key}.{audio_format}"
+        with self.lock:
+            if name not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(name)
+            self.hits += 1
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, 'rb') as f:
+                audio = f.read()
+            os.utime(path) # Record the use for the next start's LRU order
+            return audio
+        except OSError:
+            with self.lock:
+                self.forget(name)
+            return None
+
+    def put(self, key, audio_format, audio):
+        name = f"{key}.{audio_format}"
+        path = os.path.join(self.directory, name)
+        # Synthesis threads and other app instances may write the same clip
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Audio cache write error: {e}")
+            return
+        with self.lock:
+            self.forget(name)
+            self.entries[name] = len(audio)
+            self.total_bytes += len(audio)
+            self.evict()
+
+    def forget(self, name):
+        self.total_bytes -= self.entries.pop(name, 0)
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            name, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,108 @@
+"""
+In-memory audio playback for spoken answers.
+
+Synthesized clips arrive as bytes (MP3 from gTTS, WAV from espeak-ng) and are
+decoded straight from memory into pygame Sounds; nothing touches the disk.
+Clips play back to back on one reserved mixer channel: the next clip is
+decoded while the current one plays and queued on the channel, so the mixer
+starts it without a gap. The player thread then watches the channel (every
+POLL_SECONDS) until the mixer has moved the queued clip to playing, so
+resampling or buffer latency never makes it queue over a clip that has not
+started yet; stop() wakes it early. The clip lengths only give a fallback
+deadline, in case the mixer stops reporting.
+"""
+
+import io
+import queue
+import threading
+import time
+
+import pygame
+
+import tracing
+
+POLL_SECONDS = 0.01
+
+# Past the expected start of a queued clip, stop waiting for the mixer to report it
+FALLBACK_SLACK_SECONDS = 1.0
+
+class AudioPlayer:
+    def __init__(self, volume=0.8):
+        """pygame.mixer must already be initialized."""
+        self.volume = volume
+        pygame.mixer.set_reserved(1)
+        self.channel = pygame.mixer.Channel(0)
+        self.clips = queue.Queue()
+        self.interrupted = threading.Event()
+        self.generation = 0 # Bumped by stop(); clips queued before it are dropped
+        self.playing_until = 0.0 # Expected time.monotonic() when the channel runs out of audio (fallback only)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def play(self, audio, audio_format=None):
+        """Queue a clip (encoded bytes) to play after the ones already queued."""
+        self.clips.put((self.generation, audio, tracing.current_trace(), time.monotonic()))
+
+    def stop(self):
+        """Drop queued clips and silence the current one."""
+        while True:
+            try:
+                clip = self.clips.get_nowait()
+            except queue.Empty:
+                break
+            if clip is None:
+                self.clips.put(None) # Keep the shutdown request
+                break
+        self.generation += 1
+        self.interrupted.set()
+        self.channel.stop() # Also clears a clip queued on the channel
+        self.playing_until = 0.0
+
+    def close(self):
+        self.stop()
+        self.clips.put(None)
+
+    def run(self):
+        while True:
+            clip = self.clips.get()
+            if clip is None:
+                break
+            generation, audio, trace_id, queued_at = clip
+            self.interrupted.clear()
+            try:
+                # Decoded once, while the previous clip is still playing
+                with tracing.span("audio_decode", trace_id, bytes=len(audio)) as span:
+                    sound = pygame.mixer.Sound(file=io.BytesIO(audio))
+                    sound.set_volume(self.volume)
+                    span.set(clip_seconds=sound.get_length())
+            except Exception as e:
+                print(f"Audio playback error: {e}")
+                continue
+            if generation != self.generation:
+                continue
+
+            now = time.monotonic()
+            if self.channel.get_busy():
+                self.channel.queue(sound)
+                if not self.wait_until_started(max(self.playing_until, now)):
+                    continue # Stopped
+            else:
+                self.channel.play(sound)
+            started_at = time.monotonic()
+            self.playing_until = started_at + sound.get_length()
+            # From the clip being ready to it being heard, behind earlier clips
+            tracing.record("audio_queue_wait", (started_at - queued_at) * 1000, trace_id)
+
+    def wait_until_started(self, expected_at):
+        """Wait until the clip queued on the channel is playing, or the fallback deadline passes.
+
+        The channel holds one queued clip, so the next one is only decoded once
+        this one has started. Returns False if stop() was called meanwhile.
+        """
+        deadline = expected_at + FALLBACK_SLACK_SECONDS
+        while self.channel.get_queue() is not None and self.channel.get_busy():
+            if self.interrupted.wait(POLL_SECONDS):
+                return False
+            if time.monotonic() > deadline:
+                break
+        return True
@@ -0,0 +1,314 @@
+"""
+Batch mode: answer a list of questions offline, at full hardware throughput.
+
+Reads JSON Lines questions from a file or stdin, one per line:
+
+    {"id": "dengue-en", "query": "What is dengue?", "language": "English"}
+
+("id" defaults to language + query; "language" to --language.) Every question
+goes through the same path as the GUI and the server: an InferenceScheduler
+in front of a HealthEngine, or a ModelPool of worker processes with
+--workers, each answer built by construct_prompt and generate_response.
+
+Answers are streamed to a JSON Lines file or, for a .db/.sqlite/.sqlite3
+path, an SQLite table, in input order. The output is also the checkpoint:
+a run that is stopped or crashes picks up where it left off when started
+again with the same output, skipping the ids already answered. Failed
+questions are not written, so the next run retries them.
+
+    python src/batch.py diseases.jsonl -o answers.jsonl --workers auto --structured
+    python src/batch.py answers.jsonl --seed-only
+
+--seed-cache copies every answer in the output into the response cache used by
+the app and the server.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+
+import config
+import tracing
+from scheduler import InferenceScheduler, PRIORITY_LOW
+from settings import ConfigError, add_profile_arguments, profile_from_args
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+class JsonlResults:
+    """Answers appended to a JSON Lines file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.unsynced = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        for result in self.results():
+            self.done.add(result["id"])
+        self.drop_partial_line()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def drop_partial_line(self):
+        """Cut a line left half-written by a crash, so appends start on a fresh line."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def results(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue # A partial last line
+
+    def write(self, result):
+        self.file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.done.add(result["id"])
+        self.unsynced += 1
+        if self.unsynced >= config.BATCH["sync_every"]:
+            self.sync()
+
+    def sync(self):
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+class SqliteResults:
+    """Answers stored in an SQLite table, one row per id."""
+
+    COLUMNS = ("id", "language", "query", "response", "record", "cached", "stats", "model", "profile", "created")
+
+    def __init__(self, path):
+        self.path = path
+        self.unsynced = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id TEXT PRIMARY KEY, language TEXT, query TEXT, response TEXT, record TEXT, "
+            "cached INTEGER, stats TEXT, model TEXT, profile TEXT, created REAL)"
+        )
+        self.db.commit()
+        self.done = {row[0] for row in self.db.execute("SELECT id FROM answers")}
+
+    def results(self):
+        for row in self.db.execute(f"SELECT {', '.join(self.COLUMNS)} FROM answers ORDER BY created"):
+            result = dict(zip(self.COLUMNS, row))
+            result["cached"] = bool(result["cached"])
+            result["stats"] = json.loads(result["stats"])
+            if result["record"] is None:
+                del result["record"]
+            else:
+                result["record"] = json.loads(result["record"])
+            yield result
+
+    def write(self, result):
+        record = result.get("record")
+        self.db.execute(
+            "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (result["id"], result["language"], result["query"], result["response"],
+             json.dumps(record, ensure_ascii=False) if record is not None else None,
+             int(result["cached"]), json.dumps(result["stats"]), result["model"], result["profile"],
+             result["created"])
+        )
+        self.done.add(result["id"])
+        self.unsynced += 1
+        if self.unsynced >= config.BATCH["sync_every"]:
+            self.sync()
+
+    def sync(self):
+        self.db.commit()
+        self.unsynced = 0
+
+    def close(self):
+        self.sync()
+        self.db.close()
+
+def open_results(path):
+    if path.lower().endswith(SQLITE_EXTENSIONS):
+        return SqliteResults(path)
+    return JsonlResults(path)
+
+def read_questions(lines, default_language, languages):
+    """Yield {"id", "query", "language"} for each valid input line."""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+            query = str(item["query"]).strip()
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Skipping input line {number}: {e}")
+            continue
+        language = item.get("language", default_language)
+        if not query or language not in languages:
+            print(f"Skipping input line {number}: {'unsupported language ' + repr(language) if query else 'empty query'}")
+            continue
+        yield {"id": str(item.get("id", f"{language}:{query}")), "query": query, "language": language}
+
+def run_batch(scheduler, questions, results, window, model_name, profile_name, progress=print):
+    """Answer every question not already in `results`, keeping `window` requests in flight.
+
+    Returns (answered, failed, skipped).
+    """
+    answered = failed = skipped = 0
+    in_flight = deque()
+    start = time.perf_counter()
+
+    def collect():
+        nonlocal answered, failed
+        question, request = in_flight.popleft()
+        try:
+            event = request.result()
+        except Exception as e:
+            failed += 1
+            print(f"Failed {question['id']}: {e}")
+            return
+        result = dict(question, response=event["response"], cached=event["cached"], stats=event["stats"],
+                      model=model_name, profile=profile_name, created=time.time())
+        if "record" in event:
+            result["record"] = event["record"]
+        results.write(result)
+        answered += 1
+        if answered % config.BATCH["progress_every"] == 0:
+            elapsed = time.perf_counter() - start
+            progress(f"{answered} answered ({answered / elapsed * 60:.1f}/min), {failed} failed, {skipped} already done")
+
+    try:
+        for question in questions:
+            if question["id"] in results.done:
+                skipped += 1
+                continue
+            results.done.add(question["id"]) # Duplicate ids in the input are answered once
+            # Every question is a topic to pre-generate, so the emergency response must not stand in for one
+            request = scheduler.submit(question["query"], question["language"], PRIORITY_LOW, emergency=False)
+            in_flight.append((question, request))
+            if len(in_flight) >= window:
+                collect()
+        while in_flight:
+            collect()
+    except KeyboardInterrupt:
+        scheduler.cancel_all()
+        print("Interrupted; run the same command again to resume.")
+    return answered, failed, skipped
+
+def seed_cache(cache, results):
+    """Copy every answer in `results` into the response cache; returns the number copied."""
+    seeded = 0
+    for result in results.results():
+        if result["response"].strip():
+            cache.put(result["language"], result["query"], result["response"])
+            seeded += 1
+    if seeded > cache.max_entries:
+        print(f"Warning: the response cache keeps {cache.max_entries} entries; "
+              f"the oldest of the {seeded} answers were evicted (see response_cache_entries)")
+    return seeded
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSON Lines file of questions offline",
+                                     epilog="Inference profile flags work as for server.py.")
+    parser.add_argument("input", nargs="?", default="-", help="questions as JSON Lines (default: stdin)")
+    parser.add_argument("-o", "--output", default=config.BATCH["output"],
+                        help="answers as JSON Lines, or SQLite for a .db/.sqlite/.sqlite3 path; "
+                             "answered ids are skipped when the output exists")
+    parser.add_argument("--language", default="English", help="language of questions that do not name one")
+    parser.add_argument("--workers", default=config.WORKER_POOL["workers"],
+                        help='model worker processes: 0 for one in-process model, or "auto" for the tuned layout')
+    parser.add_argument("--threads", type=int, default=config.WORKER_POOL["threads_per_worker"],
+                        help="llama.cpp threads per worker (default: the worker's CPU share)")
+    parser.add_argument("--structured", action="store_true",
+                        help="generate structured answers (see STRUCTURED_OUTPUT) with their parsed records")
+    parser.add_argument("--seed-cache", action="store_true",
+                        help="copy the answers in the output into the response cache")
+    parser.add_argument("--seed-only", action="store_true",
+                        help="only seed the response cache from INPUT, an earlier batch output")
+    add_profile_arguments(parser)
+    tracing.add_tracing_arguments(parser)
+    args = parser.parse_args()
+
+    if args.seed_only:
+        from response_cache import ResponseCache
+        settings = config.RESPONSE_CACHE
+        try:
+            profile = profile_from_args(args)
+        except ConfigError as e:
+            parser.exit(2, f"Configuration error: {e}\n")
+        cache = ResponseCache(settings["path"], max_entries=profile.response_cache_entries,
+                              ttl_seconds=settings["ttl_seconds"], near_duplicate=settings["near_duplicate"],
+                              similarity_threshold=settings["similarity_threshold"])
+        seeded = seed_cache(cache, open_results(args.input))
+        cache.close()
+        print(f"Seeded {seeded} answers into {settings['path']}")
+        return
+
+    try:
+        profile = profile_from_args(args)
+    except ConfigError as e:
+        parser.exit(2, f"Configuration error: {e}\n")
+    if args.structured:
+        config.STRUCTURED_OUTPUT["enabled"] = True
+        profile = profile.replace(batching=False) # Structured output is not available with batching
+    config.MODEL["warmup"] = False
+    profiler = tracing.start_from_args(args)
+
+    from engine import SYSTEM_PROMPTS
+    from server import create_engine
+    if args.language not in SYSTEM_PROMPTS:
+        parser.exit(2, f"Unsupported language {args.language!r}\n")
+    results = open_results(args.output)
+    # Batch answers are generated fresh; cached ones would only be copies
+    engine = create_engine(args.workers, args.threads, profile, use_response_cache=False)
+    engine.load_model(progress=lambda message: None)
+    parallelism = engine.parallelism()
+    window = parallelism * config.BATCH["in_flight_per_worker"]
+    scheduler = InferenceScheduler([engine] * parallelism, max_queue=window)
+    model_name = os.path.basename(config.MODEL["path"] or config.MODEL["filename"])
+    print(f"Answering with profile '{profile.name}', {parallelism} at a time; "
+          f"{len(results.done)} answers already in {args.output}")
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding='utf-8')
+    start = time.perf_counter()
+    try:
+        questions = read_questions(source, args.language, SYSTEM_PROMPTS)
+        answered, failed, skipped = run_batch(scheduler, questions, results, window, model_name, profile.name)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        results.close()
+        scheduler.shutdown()
+        if hasattr(engine, "close"):
+            engine.close()
+        tracing.tracer.close()
+        if profiler is not None:
+            profiler.stop()
+    elapsed = time.perf_counter() - start
+    print(f"Answered {answered} in {elapsed:.1f}s ({answered / elapsed * 60 if elapsed else 0:.1f}/min); "
+          f"{failed} failed, {skipped} already done")
+
+    if args.seed_cache:
+        cache = engine.open_response_cache()
+        if cache is not None:
+            seeded = seed_cache(cache, open_results(args.output))
+            cache.close()
+            print(f"Seeded {seeded} answers into {config.RESPONSE_CACHE['path']}")
+        else:
+            print("The response cache is disabled in this profile; nothing seeded")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Continuous batching across concurrent chat sessions.
+
+BatchedGenerator decodes several independent conversations in the same
+llama.cpp forward pass. It creates its own multi-sequence context on top of
+the weights already loaded by HealthEngine (so no second copy of the model)
+and gives every active request its own sequence id in the KV cache. A single
+decode thread builds one llama_batch per step holding prompt tokens of newly
+admitted requests plus the next token of every request that is generating;
+requests join the batch as soon as a slot frees up, without waiting for the
+others to finish.
+
+The fixed system prompts are evaluated once into reserved sequences and
+shared into each new request's sequence with a KV-cache seq_cp, so
+prompt evaluation only covers the user's turn here as well.
+"""
+
+import codecs
+import queue
+import threading
+
+import numpy as np
+import llama_cpp
+
+from chat_format import render_chat_prompt
+
+def kv_cache_functions(ctx):
+    """Return (seq_rm, seq_cp) for `ctx` across llama.cpp API generations.
+
+    Newer builds expose the KV cache as llama_memory_* on llama_get_memory(ctx);
+    older ones use llama_kv_self_* or llama_kv_cache_* on the context itself.
+    """
+    if hasattr(llama_cpp, "llama_get_memory"):
+        memory = llama_cpp.llama_get_memory(ctx)
+        return (lambda *args: llama_cpp.llama_memory_seq_rm(memory, *args),
+                lambda *args: llama_cpp.llama_memory_seq_cp(memory, *args))
+    prefix = "llama_kv_self_" if hasattr(llama_cpp, "llama_kv_self_seq_rm") else "llama_kv_cache_"
+    seq_rm = getattr(llama_cpp, prefix + "seq_rm")
+    seq_cp = getattr(llama_cpp, prefix + "seq_cp")
+    return (lambda *args: seq_rm(ctx, *args), lambda *args: seq_cp(ctx, *args))
+
+def end_of_generation_check(model):
+    """Return a function telling whether a token ends generation (EOS, or Phi-3's <|end|>)."""
+    if hasattr(llama_cpp, "llama_model_get_vocab"):
+        vocab = llama_cpp.llama_model_get_vocab(model.model)
+        return lambda token: bool(llama_cpp.llama_vocab_is_eog(vocab, token))
+    return lambda token: bool(llama_cpp.llama_token_is_eog(model.model, token))
+
+class Sequence:
+    def __init__(self, tokens, max_tokens, temperature):
+        self.tokens = tokens
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.seq_id = None
+        self.n_past = 0 # Tokens of this sequence already in the KV cache
+        self.generated = 0
+        self.next_token = None
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self.output = queue.Queue() # Text deltas, then None when finished
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+class BatchedGenerator:
+    def __init__(self, model, n_parallel=4, n_ctx_per_sequence=2048, n_batch=512,
+                 shared_prefixes=(), top_k=40, top_p=0.95, seed=None):
+        self.model = model
+        self.n_parallel = n_parallel
+        self.n_ctx_per_sequence = n_ctx_per_sequence
+        self.n_batch = n_batch
+        self.top_k = top_k
+        self.top_p = top_p
+        self.n_vocab = model.n_vocab()
+        self.is_end_of_generation = end_of_generation_check(model)
+        self.rng = np.random.default_rng(seed)
+
+        self.prefixes = []
+        n_seq_max = n_parallel + len(shared_prefixes)
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = n_ctx_per_sequence * n_seq_max
+        params.n_batch = n_batch
+        params.n_seq_max = n_seq_max
+        params.n_threads = model.context_params.n_threads
+        params.n_threads_batch = model.context_params.n_threads_batch
+        if hasattr(params, "kv_unified"):
+            # Sequences must share KV cells for seq_cp of the system prompt prefixes
+            params.kv_unified = True
+        new_context = getattr(llama_cpp, "llama_init_from_model", None) or llama_cpp.llama_new_context_with_model
+        self.ctx = new_context(model.model, params)
+        if not self.ctx:
+            raise Exception("Failed to create batched llama.cpp context")
+        self.batch = llama_cpp.llama_batch_init(n_batch, 0, n_seq_max)
+        self.kv_seq_rm, self.kv_seq_cp = kv_cache_functions(self.ctx)
+
+        self.slots = [None] * n_parallel # slot index == sequence id
+        self.waiting = queue.Queue()
+        self.running = True
+
+        for system_message in shared_prefixes:
+            self.add_shared_prefix(system_message)
+        self.thread = threading.Thread(target=self.decode_loop, daemon=True)
+        self.thread.start()
+
+    def add_shared_prefix(self, system_message):
+        """Evaluate a system prompt once into a reserved sequence that requests copy from."""
+        prompt = render_chat_prompt(self.model, [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": ""}
+        ])
+        tokens = self.tokenize(prompt)
+        seq_id = self.n_parallel + len(self.prefixes)
+        for start in range(0, len(tokens), self.n_batch):
+            chunk = tokens[start:start + self.n_batch]
+            self.clear_batch()
+            for i, token in enumerate(chunk):
+                self.add_to_batch(token, start + i, seq_id, False)
+            self.decode()
+        self.prefixes.append((seq_id, tokens))
+
+    def stream(self, prompt_messages, max_tokens=1024, temperature=0.7):
+        """Generate a response for `prompt_messages`, yielding text deltas as they are decoded."""
+        tokens = self.tokenize(render_chat_prompt(self.model, prompt_messages))
+        max_tokens = min(max_tokens, self.n_ctx_per_sequence - len(tokens))
+        if max_tokens <= 0:
+            raise Exception(f"Prompt of {len(tokens)} tokens does not fit the {self.n_ctx_per_sequence}-token context")
+        sequence = Sequence(tokens, max_tokens, temperature)
+        self.waiting.put(sequence)
+        try:
+            while True:
+                delta = sequence.output.get()
+                if delta is None:
+                    return
+                if isinstance(delta, Exception):
+                    raise delta
+                yield delta
+        finally:
+            # Closing the generator early frees the slot at the next decode step
+            sequence.cancel()
+
+    def close(self):
+        self.running = False
+        self.waiting.put(None)
+        self.thread.join()
+        llama_cpp.llama_batch_free(self.batch)
+        llama_cpp.llama_free(self.ctx)
+
+    # --- Decode thread ---
+
+    def decode_loop(self):
+        while self.running:
+            self.admit()
+            active = [s for s in self.slots if s is not None]
+            if not active:
+                sequence = self.waiting.get()
+                if sequence is None:
+                    break
+                self.waiting.put(sequence) # Admitted on the next pass
+                continue
+            try:
+                self.step(active)
+            except Exception as e:
+                for sequence in active:
+                    sequence.output.put(Exception(f"Model inference error: {e}"))
+                    self.release(sequence)
+
+    def admit(self):
+        """Move waiting requests into free slots."""
+        for seq_id, slot in enumerate(self.slots):
+            if slot is not None:
+                continue
+            try:
+                sequence = self.waiting.get_nowait()
+            except queue.Empty:
+                return
+            if sequence is None:
+                self.running = False
+                return
+            if sequence.cancelled.is_set():
+                sequence.output.put(None)
+                continue
+            sequence.seq_id = seq_id
+            sequence.n_past = self.reuse_prefix(sequence)
+            self.slots[seq_id] = sequence
+
+    def reuse_prefix(self, sequence):
+        """Share the longest matching system prompt prefix into the sequence's KV cells."""
+        best_seq, best_len = None, 0
+        for prefix_seq, prefix_tokens in self.prefixes:
+            common = 0
+            for a, b in zip(prefix_tokens, sequence.tokens):
+                if a != b:
+                    break
+                common += 1
+            if common > best_len:
+                best_seq, best_len = prefix_seq, common
+        # Keep at least one prompt token to evaluate, so there are logits to sample from
+        best_len = min(best_len, len(sequence.tokens) - 1)
+        if best_seq is None or best_len <= 0:
+            return 0
+        self.kv_seq_cp(best_seq, sequence.seq_id, 0, best_len)
+        return best_len
+
+    def step(self, active):
+        """Run one forward pass over all active sequences and sample their next tokens."""
+        self.clear_batch()
+        sampling = []
+        for sequence in active:
+            if sequence.cancelled.is_set():
+                self.finish(sequence)
+                continue
+            if sequence.next_token is not None:
+                self.add_to_batch(sequence.next_token, sequence.n_past, sequence.seq_id, True)
+                sequence.n_past += 1
+                sequence.next_token = None
+                sampling.append((sequence, self.batch.n_tokens - 1))
+                continue
+            # Prefill: feed as much of the prompt as the batch has room for
+            room = self.n_batch - self.batch.n_tokens
+            if room <= 0:
+                continue
+            chunk = sequence.tokens[sequence.n_past:sequence.n_past + room]
+            for i, token in enumerate(chunk):
+                last = sequence.n_past + i == len(sequence.tokens) - 1
+                self.add_to_batch(token, sequence.n_past + i, sequence.seq_id, last)
+            sequence.n_past += len(chunk)
+            if sequence.n_past == len(sequence.tokens):
+                sampling.append((sequence, self.batch.n_tokens - 1))
+
+        if self.batch.n_tokens == 0:
+            return
+        self.decode()
+
+        for sequence, index in sampling:
+            token = self.sample(index, sequence.temperature)
+            if self.is_end_of_generation(token):
+                self.finish(sequence)
+                continue
+            sequence.generated += 1
+            text = sequence.decoder.decode(self.model.detokenize([token]))
+            if text:
+                sequence.output.put(text)
+            if sequence.generated >= sequence.max_tokens:
+                self.finish(sequence)
+            else:
+                sequence.next_token = token
+
+    def sample(self, index, temperature):
+        logits = np.ctypeslib.as_array(llama_cpp.llama_get_logits_ith(self.ctx, index), shape=(self.n_vocab,))
+        if temperature <= 0:
+            return int(np.argmax(logits))
+        logits = logits.astype(np.float64) / temperature
+        top = np.argpartition(logits, -self.top_k)[-self.top_k:]
+        top = top[np.argsort(logits[top])[::-1]]
+        probs = np.exp(logits[top] - logits[top[0]])
+        probs /= probs.sum()
+        keep = int(np.searchsorted(np.cumsum(probs), self.top_p)) + 1
+        probs = probs[:keep] / probs[:keep].sum()
+        return int(top[self.rng.choice(keep, p=probs)])
+
+    def finish(self, sequence):
+        sequence.output.put(None)
+        self.release(sequence)
+
+    def release(self, sequence):
+        self.kv_seq_rm(sequence.seq_id, -1, -1)
+        self.slots[sequence.seq_id] = None
+
+    # --- llama_batch helpers ---
+
+    def tokenize(self, text):
+        return self.model.tokenize(text.encode('utf-8'), add_bos=True, special=True)
+
+    def clear_batch(self):
+        self.batch.n_tokens = 0
+
+    def add_to_batch(self, token, pos, seq_id, logits):
+        i = self.batch.n_tokens
+        self.batch.token[i] = token
+        self.batch.pos[i] = pos
+        self.batch.n_seq_id[i] = 1
+        self.batch.seq_id[i][0] = seq_id
+        self.batch.logits[i] = logits
+        self.batch.n_tokens += 1
+
+    def decode(self):
+        result = llama_cpp.llama_decode(self.ctx, self.batch)
+        if result != 0:
+            raise Exception(f"llama_decode failed with code {result}")
@@ -0,0 +1,23 @@
+"""
+Render chat messages to raw prompt text.
+
+create_chat_completion formats messages internally, but code that drives
+llama.cpp at the token level (batching, speculative prefill, token budgets)
+needs the exact prompt text the model sees.
+"""
+
+from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+def render_chat_prompt(model, messages):
+    """Render `messages` with the model's own chat template, ending with the assistant header.
+
+    The BOS token is left out; add it when tokenizing (add_bos=True).
+    """
+    template = model.metadata.get("tokenizer.chat_template")
+    if template:
+        eos_token = model.detokenize([model.token_eos()], special=True).decode('utf-8', errors='ignore')
+        formatter = Jinja2ChatFormatter(template=template, eos_token=eos_token, bos_token="")
+        return formatter(messages=messages).prompt
+    # Phi-3 instruct format, for GGUF files without an embedded template
+    prompt = "".join(f"<|{message['role']}|>\n{message['content']}<|end|>\n" for message in messages)
+    return prompt + "<|assistant|>\n"
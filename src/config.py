@@ -3,24 +3,251 @@ Configuration file for the AI Health & Wellness Assistant
 Modify these settings to customize the application behavior
 """
 
+import os
+
 # Application Settings
 APP_NAME = "AI Health & Wellness Assistant"
 APP_VERSION = "1.0.0"
 WINDOW_WIDTH = 800
 WINDOW_HEIGHT = 600
+UI_FRAME_INTERVAL = 33  # ms between chat/status updates (about 30 per second)
 
-# AI Model Configuration
-MODEL_NAME = "bigscience/bloomz-560m"
-MAX_INPUT_LENGTH = 512
+# AI Model Configuration (defaults for the inference profiles below)
+MODEL_NAME = "Phi-3-mini-4k-instruct (GGUF, Q4_0)"
 MAX_OUTPUT_LENGTH = 1024
 GENERATION_TEMPERATURE = 0.7
-GENERATION_DO_SAMPLE = True
+
+# Inference Profiles: per-deployment performance settings, validated at startup
+# (see settings.py). Pick one with --profile or HEALTH_ASSISTANT_PROFILE, and
+# override single values with e.g. --n-threads 8 or HEALTH_ASSISTANT_N_THREADS=8.
+DEFAULT_PROFILE = "gpu-offload"
+PROFILES = {
+    # Desktop with a CUDA GPU: offload most layers, full context
+    "gpu-offload": {
+        "n_ctx": 4096,
+        "n_batch": 512,
+        "n_gpu_layers": 25,
+        "max_tokens": MAX_OUTPUT_LENGTH,
+        "response_cache_entries": 2000
+    },
+    # CPU-only laptop or kiosk: small context and batches for a fast first token
+    "low-latency-laptop": {
+        "n_ctx": 2048,
+        "n_batch": 256,
+        "n_gpu_layers": 0,
+        "max_tokens": 768,
+        "response_cache_entries": 500
+    },
+    # Many-core CPU server behind server.py: batch sessions together for throughput
+    # (with batching, n_ctx is per sequence: KV memory grows with n_parallel)
+    "cpu-server-throughput": {
+        "n_ctx": 2048,
+        "n_batch": 512,
+        "n_gpu_layers": 0,
+        "max_tokens": MAX_OUTPUT_LENGTH,
+        "response_cache_entries": 20000,
+        "batching": True,
+        "n_parallel": 4
+    }
+}
+
+# Cache Settings
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "health_assistant")
+
+# GGUF Model Settings (llama.cpp). The model is resolved offline first: an
+# explicit path, then the model directory, then the Hugging Face cache; it is
+# only downloaded if allow_download is set. Set sha256 to verify the file; the
+# computed checksum is cached so it is only hashed once.
+MODEL = {
+    "path": None,
+    "directory": os.path.join(CACHE_DIR, "models"),
+    "repo": "second-state/Phi-3-mini-4k-instruct-GGUF",
+    "filename": "Phi-3-mini-4k-instruct-Q4_0.gguf",
+    "sha256": None,
+    "checksum_cache": os.path.join(CACHE_DIR, "model_checksums.json"),
+    "allow_download": True,
+    "use_mmap": True,
+    "use_mlock": False,  # pin weights in RAM; needs enough memory and privileges
+    "warmup": True
+}
+
+# Saved llama.cpp state for each language's system prompt, restored before a
+# query so only the user's turn needs prompt evaluation (profile: prompt_cache)
+PROMPT_CACHE = {
+    "directory": os.path.join(CACHE_DIR, "prompt_states")
+}
+
+# Answers to repeated questions, keyed by language + normalized query. The
+# near-duplicate tier matches rephrasings by character trigram similarity;
+# it is off by default, as close scores also come from different questions
+# ("hepatitis b" / "hepatitis c"). Its size is set per profile
+# (response_cache_entries).
+RESPONSE_CACHE = {
+    "path": os.path.join(CACHE_DIR, "responses.sqlite3"),
+    "ttl_seconds": 7 * 24 * 3600,
+    "near_duplicate": False,
+    "similarity_threshold": 0.85
+}
+
+# Local knowledge index (knowledge.py) of curated condition records from
+# source, compiled to a memory-mapped index file (rebuilt when the source
+# changes). A question that just names a known condition is answered with its
+# record when serve_exact is set; one that mentions a condition among other
+# words gets the record in the prompt as reference notes, with up to
+# context_items entries per list. For that, one of the record's names must
+# cover min_name_coverage of its own terms and min_query_coverage of the
+# question's (after question words are dropped), so "gestational diabetes"
+# and "cold sore" are not taken for "diabetes" and "cold".
+KNOWLEDGE = {
+    "enabled": True,
+    "source": os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "conditions.jsonl"),
+    "index": os.path.join(CACHE_DIR, "knowledge.idx"),
+    "serve_exact": True,
+    "min_name_coverage": 1.0,
+    "min_query_coverage": 0.6,
+    "context_items": 4,
+    "bm25_k1": 1.2,
+    "bm25_b": 0.75
+}
+
+# Inference Scheduler: requests beyond max_queue are rejected instead of piling up
+SCHEDULER = {
+    "max_queue": 16
+}
+
+# Model worker processes for the HTTP server on multi-core CPU hosts.
+# workers = 0 keeps a single in-process model; "auto" uses the layout found by
+# `python src/worker_pool.py --autotune`. threads_per_worker = None sizes
+# n_threads to each worker's CPU slice. A worker that exits is noticed
+# within health_check_seconds, and its requests fail instead of hanging.
+WORKER_POOL = {
+    "workers": 0,
+    "threads_per_worker": None,
+    "health_check_seconds": 2.0,
+    "tuning_file": os.path.join(CACHE_DIR, "worker_pool_tuning.json")
+}
+
+# Batch mode (src/batch.py): answers are written to output in input order,
+# with in_flight_per_worker requests queued per decode slot or worker process
+# so none sits idle. The output file is synced (the SQLite table committed)
+# every sync_every answers; a resumed run skips everything synced.
+BATCH = {
+    "output": os.path.join(CACHE_DIR, "batch", "answers.jsonl"),
+    "in_flight_per_worker": 2,
+    "sync_every": 20,
+    "progress_every": 50
+}
 
 # Speech Recognition Settings
 SPEECH_TIMEOUT = 5  # seconds
 SPEECH_PHRASE_TIME_LIMIT = 10  # seconds
 SPEECH_AMBIENT_NOISE_DURATION = 0.5  # seconds
 
+# Speech Recognition: "google" (online) or "vosk" (offline, streams partial
+# transcripts and stops listening once the speaker pauses). Vosk models are
+# downloaded separately from https://alphacephei.com/vosk/models; a language
+# without a model falls back to "google". The ambient noise level is measured
+# once per microphone and reused for calibration_max_age seconds.
+ASR = {
+    "backend": "google",
+    "device_index": None,  # microphone; None for the system default
+    "timeout": SPEECH_TIMEOUT,
+    "phrase_time_limit": SPEECH_PHRASE_TIME_LIMIT,
+    "ambient_noise_duration": SPEECH_AMBIENT_NOISE_DURATION,
+    "end_silence": 0.8,  # seconds of silence that end an utterance
+    "sample_rate": 16000,
+    "vosk_models": {
+        "English": os.path.join(CACHE_DIR, "vosk", "vosk-model-small-en-in-0.4"),
+        "Marathi": None
+    },
+    "calibration_file": os.path.join(CACHE_DIR, "asr_calibration.json"),
+    "calibration_max_age": 7 * 24 * 3600,
+    "energy_multiplier": 1.5,  # speech must be this much louder than the ambient noise
+    # Start evaluating the question from stable partial transcripts while the
+    # user is still speaking (needs a streaming backend and a local model)
+    "speculative_prefill": True
+}
+
+# Chat history: the window shows the last visible_messages messages and the
+# app keeps max_messages in memory; older ones are appended to archive_path
+# (set it to None to discard them instead).
+TRANSCRIPT = {
+    "visible_messages": 40,
+    "max_messages": 200,
+    "archive_path": os.path.join(CACHE_DIR, "transcripts", "chat_history.jsonl")
+}
+
+# Generation limits per answer. With adaptive, max_tokens is predicted per
+# language from the lengths of the last `history` answers (the percentile
+# length times headroom, never below min_tokens or above the profile's
+# max_tokens); min_samples answers are needed before it is used. With
+# stop_after_final_section, generation ends once the "When to Consult a
+# Doctor" section is complete (or has run for final_section_tokens tokens).
+OUTPUT_LIMITS = {
+    "adaptive": True,
+    "history_file": os.path.join(CACHE_DIR, "output_lengths.json"),
+    "history": 50,
+    "min_samples": 5,
+    "percentile": 95,
+    "headroom": 1.25,
+    "min_tokens": 256,
+    "stop_after_final_section": True,
+    "final_section_tokens": 200
+}
+
+# Structured output: the model fills a JSON record (name, overview,
+# symptoms, treatments, remedies, when_to_consult) under a llama.cpp grammar,
+# shown as the usual numbered sections. Field lengths come from the answer's
+# max_tokens (see structured.field_limits): each string field may take its
+# share of it, and each list its "list" share, split among up to max_items
+# entries of at least min_item_chars. Characters are counted at
+# chars_per_token per token, the fewest a token holds in that language (a
+# Devanagari character can take a token of its own), so even the longest
+# record the grammar allows ends before max_tokens and when_to_consult is
+# never cut off. The adaptive output limit is not applied to structured answers.
+# Not available with continuous batching.
+STRUCTURED_OUTPUT = {
+    "enabled": False,
+    "max_items": 6,
+    "min_item_chars": 40,
+    "shares": {"name": 0.04, "overview": 0.24, "list": 0.18, "when_to_consult": 0.16},
+    "chars_per_token": {"English": 2.5, "Marathi": 1.0}
+}
+
+# Multi-turn conversations: earlier questions and answers of a session are
+# sent with each new question, within history_tokens (and whatever the
+# context window has left after the system prompt, question and answer).
+# Stored answers are cut to max_answer_tokens; when the history is over
+# budget the oldest evict_fraction of it is dropped at once, so the history
+# (and its KV cache) stays the same for the next few turns. With summarize,
+# dropped turns are remembered as a list of the topics they covered.
+# Only follow-ups that point back at the conversation ("is it contagious?")
+# bypass the response cache; standalone questions are cached at any turn.
+CONVERSATION = {
+    "enabled": True,
+    "history_tokens": 1536,
+    "max_answer_tokens": 256,
+    "reserve_tokens": 64,
+    "evict_fraction": 0.5,
+    "summarize": True,
+    "max_sessions": 256,
+    "idle_seconds": 3600
+}
+
+# Text-to-Speech: spoken answers are synthesized sentence by sentence while
+# the model is still generating. "gtts" needs internet access; "espeak" runs
+# offline but needs espeak-ng installed.
+# Synthesized sentences are cached on disk (least recently used deleted
+# first), and the disclaimers are synthesized at startup.
+TTS = {
+    "backend": "gtts",
+    "workers": 3,  # sentences synthesized in parallel
+    "max_sentence_chars": 200,
+    "cache_directory": os.path.join(CACHE_DIR, "tts"),
+    "cache_max_mb": 200,  # 0 disables the audio cache
+    "prewarm": True
+}
+
 # Language Settings
 SUPPORTED_LANGUAGES = {
     "English": {
@@ -65,6 +292,7 @@ RESPONSE_TEMPLATES = {
             "**Disclaimer:**",
             "**Overview:**",
             "**Common Symptoms:**",
+            "**Common Treatments:**",
             "**General Home Care & Guidance:**",
             "**When to Consult a Doctor:**"
         ],
@@ -86,6 +314,7 @@ RESPONSE_TEMPLATES = {
             "**अस्वीकरण:**",
             "**सर्वसाधारण माहिती:**",
             "**सामान्य लक्षणे:**",
+            "**सामान्य उपचार:**",
             "**सामान्य घरगुती काळजी आणि मार्गदर्शन:**",
             "**डॉक्टरांना कधी भेटावे:**"
         ],
@@ -114,16 +343,124 @@ SAFETY = {
         "surgery",
         "emergency procedures"
     ],
+    # Checked on every question by emergency.py (see EMERGENCY below). English
+    # and transliterated keywords match whole words, also with an inflection
+    # ("seizures", "chest pains"); Devanagari ones also match with a case
+    # ending ("बेशुद्धावस्था"). Apostrophes are ignored ("cant breathe").
     "emergency_keywords": [
         "chest pain",
+        "chest tightness",
         "difficulty breathing",
+        "shortness of breath",
+        "can't breathe",
+        "cannot breathe",
+        "not breathing",
+        "choking",
         "severe bleeding",
+        "heavy bleeding",
+        "vomiting blood",
+        "coughing blood",
         "unconscious",
+        "unresponsive",
+        "seizure",
+        "convulsion",
+        "choked",
         "stroke",
-        "heart attack"
+        "heatstroke",
+        "sunstroke",
+        "heart attack",
+        "cardiac arrest",
+        "severe allergic reaction",
+        "anaphylaxis",
+        "overdose",
+        "poisoning",
+        "snake bite",
+        "snakebite",
+        "severe burn",
+        "suicide",
+        "kill myself"
+    ],
+    "emergency_keywords_marathi": [
+        "छातीत दुख",
+        "छातीत वेदना",
+        "हृदयविकार",
+        "हार्ट अटॅक",
+        "श्वास घेण्यास त्रास",
+        "श्वास घ्यायला त्रास",
+        "श्वास घेता येत नाही",
+        "बेशुद्ध",
+        "शुद्ध हरपली",
+        "खूप रक्तस्त्राव",
+        "जास्त रक्तस्त्राव",
+        "रक्ताची उलटी",
+        "झटके येत",
+        "फेफरे",
+        "पक्षाघात",
+        "अर्धांगवायू",
+        "लकवा",
+        "विषबाधा",
+        "सर्पदंश",
+        "साप चावला",
+        "आत्महत्या",
+        # Transliterations
+        "chatit dukhat",
+        "chhatit dukhat",
+        "shwas ghenyas tras",
+        "swas gheta yet nahi",
+        "beshuddh",
+        "beshudh",
+        "pakshaghat",
+        "lakwa",
+        "vishbadha",
+        "sarpdansh",
+        "saap chavla",
+        "atmahatya"
     ]
 }
 
+# Emergency fast path: a question containing an emergency keyword is answered
+# at once with the fixed response below (plus the disclaimer), without
+# queueing for the model. With preempt, generation still queued or running
+# for the same conversation is cancelled as well.
+# A keyword right after a question_before phrase or right before a
+# question_after phrase is a question about the condition, not an emergency
+# ("what is a stroke", "how to prevent heart attack", "stroke risk factors");
+# articles between the phrase and the keyword are skipped.
+# A keyword inside one of the not_emergencies terms does not count either; keep
+# these to whole terms, so a phrase there can never hide a real emergency
+# ("heat stroke" is one).
+EMERGENCY = {
+    "enabled": True,
+    "preempt": True,
+    "question_before": [
+        "what is", "what are", "whats", "define", "meaning of", "types of", "causes of", "history of",
+        "prevent", "preventing", "prevention of", "avoid", "avoiding", "risk of", "risks of", "risk factors for",
+        "chances of", "information on", "information about", "facts about", "learn about"
+    ],
+    "question_after": [
+        "prevention", "risk", "risks", "risk factors", "meaning", "definition",
+        "म्हणजे", "टाळण्यासाठी", "कसा टाळावा", "कशी टाळावी", "कसे टाळावे", "होऊ नये म्हणून", "चा धोका", "चे धोके",
+        "mhanje"
+    ],
+    "not_emergencies": ["food poisoning"],
+    "responses": {
+        "English": (
+            "⚠️ This may be a medical emergency. Call 108 (ambulance) or 112 right now, "
+            "or go to the nearest hospital emergency department. Do not wait for an answer here.\n\n"
+            "While help is on the way: stay with the person, keep them still and comfortable, "
+            "loosen tight clothing and do not give them anything to eat or drink. If they stop "
+            "responding and are not breathing normally, start chest compressions (CPR) if you are trained."
+        ),
+        "Marathi": (
+            "⚠️ ही वैद्यकीय आपत्कालीन स्थिती असू शकते. आत्ताच 108 (रुग्णवाहिका) किंवा 112 वर कॉल करा, "
+            "किंवा जवळच्या रुग्णालयाच्या आपत्कालीन विभागात जा. येथे उत्तराची वाट पाहू नका.\n\n"
+            "मदत येईपर्यंत: रुग्णासोबत राहा, त्यांना शांत आणि आरामात ठेवा, घट्ट कपडे सैल करा आणि "
+            "काहीही खायला-प्यायला देऊ नका. रुग्ण प्रतिसाद देत नसेल आणि नीट श्वास घेत नसेल, तर "
+            "प्रशिक्षण असल्यास छातीवर दाब देणे (CPR) सुरू करा."
+        )
+    }
+}
+
 # Audio Settings
 AUDIO = {
     "sample_rate": 22050,
@@ -132,9 +469,30 @@ AUDIO = {
     "playback_volume": 0.8
 }
 
-# Logging Settings
+# Logging Settings (set file to None to log to the console)
 LOGGING = {
     "level": "INFO",
     "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    "file": "health_assistant.log"
+    "file": os.path.join(CACHE_DIR, "health_assistant.log")
+}
+
+# Pipeline tracing: every stage (listen, recognize, queue_wait, cache_lookup,
+# knowledge_lookup, construct_prompt, generate, parse_response,
+# tts_synthesize, audio_decode) is timed into the metrics served at /metrics.
+# sample_rate of the questions also have their spans appended to trace_file,
+# which is rotated once it exceeds max_trace_mb. Spans slower than
+# slow_span_ms (None: off) are logged. The sampling profiler (or
+# --sampling-profiler) writes collapsed stacks for flamegraph.pl or
+# speedscope when the app exits.
+TRACING = {
+    "enabled": True,
+    "trace_file": os.path.join(CACHE_DIR, "traces", "pipeline.jsonl"),
+    "sample_rate": 1.0,
+    "max_trace_mb": 50,
+    "slow_span_ms": None,
+    "sampling_profiler": {
+        "enabled": False,
+        "interval_ms": 5,
+        "output": os.path.join(CACHE_DIR, "profiles", "sampling_profile.folded")
+    }
 }
@@ -0,0 +1,197 @@
+"""
+Multi-turn conversation memory within a token budget.
+
+Each session (the desktop window, or a client of the HTTP server) keeps its
+earlier questions and answers, so follow-ups like "how is it treated?" have
+context. The history has to fit in the model's context next to the system
+prompt, the new question and the answer, so it is managed in three ways:
+
+- truncation: an earlier answer is stored cut to `max_answer_tokens` tokens.
+  The structured answers open with the disease name and an overview, which
+  is what a follow-up needs.
+- eviction: when the history exceeds the budget, the oldest turns are dropped
+  in blocks (`evict_fraction` of them at once), not one per turn. The history
+  then stays the same from one turn to the next, and llama.cpp's prefix
+  matching reuses its KV cache, so a follow-up only evaluates the new tokens.
+- summarization: evicted turns leave behind a short list of the topics they
+  covered, which is kept as the first exchange of the history.
+
+Tokens are counted with the model's own tokenizer when one is loaded.
+
+Only follow-ups depend on the history. refers_back() tells them apart by
+their text: a question that points back ("is it contagious?", "what about
+children?") or names nothing of its own ("how long?"). Any other question
+stands alone and is cached and looked up like a first question.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from response_cache import normalize_query
+
+# Structured answers name the condition on their first line
+TOPIC_LINE = re.compile(r'(?:Disease Name|रोगाचे नाव)\s*:\s*\**\s*(.+)')
+
+# Words that point back at something said earlier
+REFERENCES = {
+    "English": {"it", "its", "this", "that", "these", "those", "they", "them", "their", "he", "she", "him",
+                "her", "same", "above", "previous", "earlier"},
+    "Marathi": {"तो", "ती", "ते", "त्या", "त्याचा", "त्याची", "त्याचे", "त्याला", "त्यावर", "त्यात", "त्यांना",
+                "याचा", "याची", "याचे", "याला", "यावर", "यात", "हा", "ही", "हे", "ह्या", "वरील"}
+}
+
+# Openings that continue the previous question ("and in children?")
+CONTINUATIONS = {
+    "English": ("and", "also", "what about", "how about", "then", "but", "so", "more"),
+    "Marathi": ("आणि", "मग", "पण", "अजून", "आणखी")
+}
+
+# Words that ask something without naming a subject; a question made only of these needs the context
+GENERIC_WORDS = {
+    "English": {"what", "whats", "why", "how", "when", "where", "who", "which", "is", "are", "was", "do", "does",
+                "can", "should", "will", "i", "a", "an", "the", "of", "for", "to", "in", "long", "much", "many",
+                "more", "else", "other", "serious", "dangerous", "contagious", "common", "normal", "safe",
+                "symptoms", "treatment", "treatments", "cure", "causes", "prevention", "prevent", "medicine",
+                "medicines", "tell", "me", "about", "please", "explain", "again", "ok", "okay", "yes", "no"},
+    "Marathi": {"काय", "का", "कसा", "कशी", "कसे", "कधी", "किती", "कोणते", "कोणता", "आहे", "आहेत", "मला", "सांगा",
+                "अजून", "माहिती", "लक्षणे", "उपचार", "कारणे", "औषध", "गंभीर", "संसर्गजन्य", "कृपया", "हो", "नाही"}
+}
+
+def refers_back(query, language):
+    """Whether `query` only makes sense with the conversation before it."""
+    words = normalize_query(query).split()
+    if not words:
+        return False
+    references = REFERENCES.get(language, set()) | REFERENCES["English"]
+    if any(word in references for word in words):
+        return True
+    text = " ".join(words)
+    continuations = CONTINUATIONS.get(language, ()) + CONTINUATIONS["English"]
+    if any(text == opening or text.startswith(opening + " ") for opening in continuations):
+        return True
+    generic = GENERIC_WORDS.get(language, set()) | GENERIC_WORDS["English"]
+    return all(word in generic for word in words)
+
+# Chat template tokens around one user/assistant exchange
+TURN_OVERHEAD = 8
+
+SUMMARY_TEMPLATES = {
+    "English": ("Earlier in this conversation we discussed: {topics}.", "Understood."),
+    "Marathi": ("या संभाषणात आपण आधी यावर चर्चा केली: {topics}.", "समजले.")
+}
+
+class Tokenizer:
+    """Counts and truncates tokens with the model's tokenizer, or estimates without one."""
+
+    def __init__(self, model=None):
+        self.model = model
+
+    def count(self, text):
+        if self.model is None:
+            # About 3 bytes per token for English; Devanagari is 3 bytes per
+            # character and tokenizes longer, which this also reflects
+            return len(text.encode('utf-8')) // 3 + 1
+        return len(self.model.tokenize(text.encode('utf-8'), add_bos=False, special=False))
+
+    def truncate(self, text, max_tokens):
+        if self.model is None:
+            data = text.encode('utf-8')
+            return text if len(data) <= max_tokens * 3 else data[:max_tokens * 3].decode('utf-8', errors='ignore')
+        tokens = self.model.tokenize(text.encode('utf-8'), add_bos=False, special=False)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.model.detokenize(tokens[:max_tokens]).decode('utf-8', errors='ignore')
+
+def topic_of(query, answer):
+    match = TOPIC_LINE.search(answer)
+    topic = match.group(1) if match else query
+    topic = topic.strip().strip('*').strip()
+    return topic if len(topic) <= 60 else topic[:57] + "..."
+
+class Turn:
+    __slots__ = ("query", "answer", "tokens")
+
+    def __init__(self, query, answer, tokens):
+        self.query = query
+        self.answer = answer
+        self.tokens = tokens
+
+class Conversation:
+    def __init__(self, language):
+        self.language = language
+        self.turns = []
+        self.topics = [] # Topics of evicted turns, oldest first
+        self.summary_tokens = 0
+        self.last_used = time.time()
+
+    def add_turn(self, query, answer, tokenizer, max_answer_tokens):
+        answer = tokenizer.truncate(answer, max_answer_tokens)
+        tokens = tokenizer.count(query) + tokenizer.count(answer) + TURN_OVERHEAD
+        self.turns.append(Turn(query, answer, tokens))
+        self.last_used = time.time()
+
+    def history_tokens(self):
+        return self.summary_tokens + sum(turn.tokens for turn in self.turns)
+
+    def fit(self, budget, tokenizer, evict_fraction, summarize):
+        """Evict the oldest turns in blocks until the history fits in `budget` tokens."""
+        while self.turns and self.history_tokens() > budget:
+            count = max(1, int(len(self.turns) * evict_fraction))
+            evicted, self.turns = self.turns[:count], self.turns[count:]
+            if summarize:
+                self.topics.extend(topic_of(turn.query, turn.answer) for turn in evicted)
+                self.summary_tokens = TURN_OVERHEAD + sum(
+                    tokenizer.count(message["content"]) for message in self.summary_messages())
+        if self.summary_tokens > budget:
+            self.topics = []
+            self.summary_tokens = 0
+
+    def summary_messages(self):
+        if not self.topics:
+            return []
+        question, reply = SUMMARY_TEMPLATES[self.language]
+        return [
+            {"role": "user", "content": question.format(topics="; ".join(self.topics))},
+            {"role": "assistant", "content": reply}
+        ]
+
+    def messages(self):
+        """The history as chat messages, to go between the system prompt and the new question."""
+        messages = self.summary_messages()
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn.query})
+            messages.append({"role": "assistant", "content": turn.answer})
+        return messages
+
+class ConversationStore:
+    """Conversations by (session, language), the least recently used dropped first."""
+
+    def __init__(self, max_sessions=256, idle_seconds=3600):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.conversations = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session, language):
+        key = (session, language)
+        with self.lock:
+            conversation = self.conversations.get(key)
+            if conversation is None or time.time() - conversation.last_used > self.idle_seconds:
+                conversation = self.conversations[key] = Conversation(language)
+            self.conversations.move_to_end(key)
+            while len(self.conversations) > self.max_sessions:
+                self.conversations.popitem(last=False)
+            return conversation
+
+    def has_history(self, session, language):
+        with self.lock:
+            conversation = self.conversations.get((session, language))
+            return bool(conversation and (conversation.turns or conversation.topics)
+                        and time.time() - conversation.last_used <= self.idle_seconds)
+
+    def clear(self, session):
+        with self.lock:
+            for key in [key for key in self.conversations if key[0] == session]:
+                del self.conversations[key]
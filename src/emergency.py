@@ -0,0 +1,181 @@
+"""
+Emergency fast path: spot emergency keywords in a question in microseconds.
+
+Every typed or transcribed question is checked before it is queued for the
+model. KeywordMatcher is an Aho-Corasick automaton over the normalized
+keywords of config.SAFETY (English, Marathi and transliterations), built once,
+so a question is scanned in a single pass however many keywords there are.
+Apostrophes are dropped first, so "can't" and "cant" are the same word.
+Keywords match at the start of a word; English and transliterated keywords
+must also end at a word boundary, after an optional inflection ("seizures",
+"chest pains"), while Devanagari ones may carry any case ending.
+
+A keyword right after or before a phrase of config.EMERGENCY that makes it a
+question about the condition ("what is a stroke", "how to prevent heart
+attack"), or inside a term that is not an emergency ("food poisoning"), does
+not count.
+
+On a match the question gets the pre-rendered response of config.EMERGENCY
+at once instead of a generated answer.
+"""
+
+import time
+
+import config
+from response_cache import normalize_query
+
+# Endings an English or transliterated keyword may take ("seizure" -> "seizures")
+INFLECTIONS = ("s", "es", "d", "ed", "ing")
+
+# Left out between a question phrase and the keyword ("what is a stroke")
+ARTICLES = ("a", "an", "the")
+
+APOSTROPHES = str.maketrans("", "", "'’ʼ‘`")
+
+def fold(text):
+    """normalize_query() with apostrophes dropped rather than turned into word breaks."""
+    return normalize_query(text.translate(APOSTROPHES))
+
+def is_devanagari(char):
+    return 'ऀ' <= char <= 'ॿ'
+
+class KeywordMatcher:
+    def __init__(self, keywords):
+        self.keywords = []
+        self.goto = [{}] # state -> {char: state}
+        self.fail = [0]
+        self.outputs = [()] # state -> keywords ending here, including via fail links
+        for keyword in keywords:
+            self.add(fold(keyword))
+        self.link()
+
+    def add(self, keyword):
+        if not keyword or keyword in self.keywords:
+            return
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append(())
+            state = next_state
+        # Devanagari keywords may be followed by a case ending
+        whole_word = not is_devanagari(keyword[-1])
+        self.outputs[state] = ((len(keyword), whole_word, len(self.keywords)),)
+        self.keywords.append(keyword)
+
+    def link(self):
+        """Compute fail links breadth first and merge each state's outputs with its fail state's."""
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while char not in self.goto[fallback] and fallback:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.outputs[next_state] += self.outputs[self.fail[next_state]]
+
+    def search(self, text):
+        """Return the first keyword found in `text`, or None."""
+        for keyword, _, _ in self.matches(fold(text)):
+            return keyword
+        return None
+
+    def matches(self, text):
+        """Yield (keyword, start, end) for each keyword in folded `text`; `end` is past its ending, if any."""
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = 0
+        for end, char in enumerate(text, 1):
+            while char not in goto[state] and state:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, whole_word, keyword in outputs[state]:
+                start = end - length
+                if start and text[start - 1] != ' ':
+                    continue
+                word_end = word_end_at(text, end, whole_word)
+                if word_end is not None:
+                    yield self.keywords[keyword], start, word_end
+
+def word_end_at(text, end, whole_word):
+    """Where the word containing a keyword that ends at `end` ends, or None if the keyword ends mid-word."""
+    if end == len(text) or text[end] == ' ':
+        return end
+    if not whole_word:
+        space = text.find(' ', end)
+        return len(text) if space < 0 else space
+    for ending in INFLECTIONS:
+        after = end + len(ending)
+        if text.startswith(ending, end) and (after == len(text) or text[after] == ' '):
+            return after
+    return None
+
+class EmergencyDetector:
+    def __init__(self, keywords, responses, question_before=(), question_after=(), not_emergencies=()):
+        """`question_before`/`question_after`: phrases that, right before/after a keyword, make it a question about the condition.
+
+        `not_emergencies`: terms a keyword inside of does not count ("food poisoning").
+        """
+        self.matcher = KeywordMatcher(keywords)
+        self.question_before = tuple(fold(phrase) for phrase in question_before)
+        self.question_after = tuple(fold(phrase) for phrase in question_after)
+        self.not_emergencies = tuple(fold(term) for term in not_emergencies)
+        # Rendered once; an emergency answer costs no formatting either
+        self.responses = {
+            language: f"{response}\n\n{config.SUPPORTED_LANGUAGES[language]['disclaimer']}"
+            for language, response in responses.items()
+        }
+
+    def check(self, query):
+        """The emergency keyword in `query`, or None."""
+        text = fold(query)
+        for keyword, start, end in self.matcher.matches(text):
+            if not self.asks_about(text, start, end) and not self.within_term(text, start):
+                return keyword
+        return None
+
+    def within_term(self, text, start):
+        """Whether the keyword starting at text[start] is part of a not_emergencies term."""
+        for term in self.not_emergencies:
+            position = text.find(term, max(0, start - len(term)))
+            while 0 <= position <= start:
+                after = position + len(term)
+                if ((position == 0 or text[position - 1] == ' ') and word_end_at(text, after, True) is not None
+                        and start < after):
+                    return True
+                position = text.find(term, position + 1)
+        return False
+
+    def asks_about(self, text, start, end):
+        """Whether the keyword at text[start:end] is the subject of a question rather than happening now."""
+        before = text[:start].split()
+        while before and before[-1] in ARTICLES:
+            before.pop()
+        before = " ".join(before)
+        if any(before == phrase or before.endswith(" " + phrase) for phrase in self.question_before):
+            return True
+        after = text[end:].strip()
+        return any(after == phrase or after.startswith(phrase + " ") for phrase in self.question_after)
+
+    def response(self, language):
+        return self.responses.get(language) or self.responses["English"]
+
+    def event(self, keyword, language, start):
+        """The final answer event for an emergency question, shaped like HealthEngine's "done" event."""
+        stats = {"total_ms": (time.perf_counter() - start) * 1000}
+        return {"type": "done", "response": self.response(language), "cached": False,
+                "emergency": keyword, "stats": stats}
+
+def create_detector():
+    """The configured detector, or None when the fast path is disabled."""
+    if not config.EMERGENCY["enabled"]:
+        return None
+    settings = config.EMERGENCY
+    keywords = config.SAFETY["emergency_keywords"] + config.SAFETY["emergency_keywords_marathi"]
+    return EmergencyDetector(keywords, settings["responses"], settings["question_before"], settings["question_after"],
+                             settings["not_emergencies"])
@@ -0,0 +1,546 @@
+"""
+GUI-independent inference engine for the AI Health & Wellness Assistant.
+
+HealthEngine owns the loaded GGUF model and the prompt/response caches and
+turns a user query into an answer. The Tkinter app (main.py) and the HTTP
+server (server.py) are both thin layers on top of it, so one loaded model can
+serve many clients.
+"""
+
+import threading
+import time
+
+from llama_cpp import Llama
+
+import config
+import tracing
+from batching import BatchedGenerator
+from chat_format import render_chat_prompt
+from conversation import ConversationStore, Tokenizer, refers_back
+from knowledge import context_notes, open_index, render_answer
+from model_registry import ModelRegistry, PhaseTimer
+from output_limits import OutputLengthModel, SectionStop
+from prompt_cache import PromptPrefixCache
+from response_cache import ResponseCache
+from settings import load_profile
+from structured import AnswerRenderer, answer_grammar, field_limits
+
+# Fixed system prompts per language. They prefix every request, so their
+# evaluated llama.cpp state is cached (see prompt_cache.py).
+SYSTEM_PROMPTS = {
+    "English": """You are an AI Health Encyclopedia. Your goal is to provide a comprehensive, structured overview of any health condition. Your response must be factual, informative, and strictly follow this format:
+
+1. Disease Name: [Name of the disease or condition]
+
+2. Disclaimer: DISCLAIMER: I am an AI assistant, not a medical professional. This information is for general knowledge only. Please consult a qualified doctor for any health concerns.
+
+3. Overview: [A detailed but easy-to-understand explanation.]
+
+4. Common Symptoms:
+- [List of symptoms]
+
+5. Common Treatments:
+- [List of treatments]
+
+6. General Home Remedies & Management:
+- [List safe, non-prescriptive home care tips.]
+
+7. When to Consult a Doctor: [Provide clear signs for seeking professional medical help.]""",
+    "Marathi": """You are an AI Health Encyclopedia. Your goal is to provide a comprehensive, structured overview of any health condition IN MARATHI. Your response must be factual, informative, in MARATHI, and strictly follow this format:
+
+१. रोगाचे नाव: [Name of the disease or condition in Marathi]
+
+२. अस्वीकरण: अस्वीकरण: मी एक AI सहाय्यक आहे, वैद्यकीय व्यावसायिक नाही. ही माहिती केवळ सामान्य ज्ञानासाठी आहे. कृपया कोणत्याही आरोग्यविषयक समस्यांसाठी पात्र डॉक्टरांचा सल्ला घ्या.
+
+३. सर्वसाधारण माहिती: [A detailed but easy-to-understand explanation of the condition in Marathi.]
+
+४. सामान्य लक्षणे:
+- [List of symptoms in Marathi]
+
+५. सामान्य उपचार:
+- [List of treatments in Marathi]
+
+६. सामान्य घरगुती उपाय आणि व्यवस्थापन:
+- [List safe, non-prescriptive home care tips in Marathi.]
+
+७. डॉक्टरांना कधी भेटावे: [Provide clear signs for seeking medical help in Marathi.]"""
+}
+
+# System prompts for structured output (STRUCTURED_OUTPUT): the grammar fixes
+# the JSON layout, so these only describe what goes in each field
+STRUCTURED_SYSTEM_PROMPTS = {
+    "English": """You are an AI Health Encyclopedia. Give a factual, informative, easy-to-understand overview of the health condition the user asks about, as a JSON object with these fields:
+- name: the name of the disease or condition
+- overview: a detailed but easy-to-understand explanation
+- symptoms: common symptoms
+- treatments: common treatments
+- remedies: safe, non-prescriptive home care tips
+- when_to_consult: clear signs for seeking professional medical help""",
+    "Marathi": """You are an AI Health Encyclopedia. Give a factual, informative, easy-to-understand overview of the health condition the user asks about IN MARATHI, as a JSON object with these fields, every value written in MARATHI:
+- name: the name of the disease or condition in Marathi
+- overview: a detailed but easy-to-understand explanation in Marathi
+- symptoms: common symptoms in Marathi
+- treatments: common treatments in Marathi
+- remedies: safe, non-prescriptive home care tips in Marathi
+- when_to_consult: clear signs for seeking medical help in Marathi"""
+}
+
+# Marks where the user's text ends when rendering a partial prompt for prefill
+PREFILL_MARK = "\ufff0"
+
+FALLBACK_RESPONSES = {
+    "English": "I'm sorry, I couldn't generate a specific response for that topic. Could you please try rephrasing your question?",
+    "Marathi": "माफ करा, मी त्या विषयासाठी विशिष्ट प्रतिसाद तयार करू शकलो नाही. तुम्ही कृपया तुमचा प्रश्न पुन्हा मांडण्याचा प्रयत्न करू शकाल का?"
+}
+
+def strip_leading_whitespace(deltas):
+    """Drop empty deltas and leading whitespace, mirroring the strip() of the blocking path."""
+    started = False
+    for delta in deltas:
+        if not delta: continue
+        if not started:
+            delta = delta.lstrip()
+            if not delta: continue
+            started = True
+        yield delta
+
+def until_complete(deltas, stop):
+    """Pass deltas through until `stop` (a SectionStop, or None) sees the end of the answer."""
+    if stop is None:
+        yield from deltas
+        return
+    for delta in deltas:
+        if not delta: continue
+        yield stop.feed(delta)
+        if stop.done:
+            return
+    yield stop.flush()
+
+class HealthEngine:
+    def __init__(self, profile=None, use_response_cache=True):
+        """`profile` is a settings.InferenceProfile; defaults to the configured one."""
+        self.model = None # Llama object once load_model() has run
+        self.model_loaded = False
+        self.profile = profile or load_profile()
+        self.startup_timer = None
+        self.prompt_cache = None
+        self.batcher = None # BatchedGenerator when continuous batching is enabled
+        self.structured = config.STRUCTURED_OUTPUT["enabled"]
+        if self.structured and self.profile.batching:
+            print("Structured output is not available with batching; answering in plain text")
+            self.structured = False
+        self.system_prompts = STRUCTURED_SYSTEM_PROMPTS if self.structured else SYSTEM_PROMPTS
+        self.answer_grammars = {} # (language, max_tokens) -> grammar, built on first use
+        self.response_cache = self.open_response_cache() if use_response_cache else None
+        self.knowledge = self.open_knowledge()
+        self.conversations = ConversationStore(config.CONVERSATION["max_sessions"], config.CONVERSATION["idle_seconds"])
+        self.tokenizer = Tokenizer() # Estimates token counts until a model is loaded
+        self.output_lengths = self.open_output_lengths()
+        # A llama.cpp context is not thread-safe; only one generation runs at a time
+        self.lock = threading.Lock()
+
+    def load_model(self, progress=print):
+        """Load the GGUF-quantized Phi-3 model using llama-cpp-python.
+
+        `progress` is called with human-readable status messages. Time spent in
+        each phase (resolve, map, prompt cache, first token) is kept in
+        self.startup_timer.
+        """
+        settings = config.MODEL
+        registry = ModelRegistry(settings)
+        timer = self.startup_timer = PhaseTimer()
+        progress("Loading GGUF AI model... Please wait...")
+
+        with timer.phase("resolve"):
+            model_path = registry.resolve(progress)
+            fingerprint = registry.verify(model_path, progress)
+        progress("Mapping model into memory...")
+
+        # The profile's n_gpu_layers controls GPU offload (-1 offloads every layer)
+        options = dict(self.profile.llama_options(), verbose=False,
+                       use_mmap=settings["use_mmap"], use_mlock=settings["use_mlock"])
+        with timer.phase("map"):
+            self.model = Llama(model_path=model_path, **options)
+        self.tokenizer = Tokenizer(self.model)
+
+        with timer.phase("prompt_cache"):
+            self.load_prompt_cache(model_path, progress, fingerprint)
+        if self.profile.batching:
+            progress("Starting batched decoding...")
+            self.batcher = BatchedGenerator(
+                self.model,
+                n_parallel=self.profile.n_parallel,
+                n_ctx_per_sequence=self.profile.n_ctx,
+                n_batch=self.profile.n_batch,
+                shared_prefixes=self.system_prompts.values()
+            )
+        self.model_loaded = True
+        if settings["warmup"]:
+            # Pages of an mmap'd model are only read on first use; fault them in
+            # before the first real question instead of during it
+            threading.Thread(target=self.warm_up, daemon=True).start()
+
+    def warm_up(self):
+        """Generate a couple of tokens in the background and record time to first token."""
+        start = time.perf_counter()
+        try:
+            prompt = self.construct_prompt("Hello", "English")
+            for _ in self.generate_response_stream(prompt):
+                self.startup_timer.record("first_token", start)
+                break
+        except Exception as e:
+            print(f"Model warm-up error: {e}")
+
+    def parallelism(self):
+        """Number of requests this engine can decode at once (scheduler workers to start)."""
+        return self.batcher.n_parallel if self.batcher is not None else 1
+
+    def open_response_cache(self):
+        settings = config.RESPONSE_CACHE
+        if self.profile.response_cache_entries == 0:
+            return None
+        try:
+            return ResponseCache(
+                settings["path"],
+                max_entries=self.profile.response_cache_entries,
+                ttl_seconds=settings["ttl_seconds"],
+                near_duplicate=settings["near_duplicate"],
+                similarity_threshold=settings["similarity_threshold"]
+            )
+        except Exception as e:
+            print(f"Response cache error: {e}")
+            return None
+
+    def open_knowledge(self):
+        try:
+            return open_index()
+        except Exception as e:
+            print(f"Knowledge index error: {e}")
+            return None
+
+    def open_output_lengths(self):
+        settings = config.OUTPUT_LIMITS
+        if not settings["adaptive"]:
+            return None
+        return OutputLengthModel(
+            settings["history_file"],
+            history=settings["history"],
+            min_samples=settings["min_samples"],
+            percentile=settings["percentile"],
+            headroom=settings["headroom"],
+            min_tokens=settings["min_tokens"]
+        )
+
+    def load_prompt_cache(self, model_path, progress=print, fingerprint=None):
+        """Evaluate (or restore from disk) the system prompt state for each language."""
+        if not self.profile.prompt_cache:
+            return
+        try:
+            progress("Preparing system prompts...")
+            cache = PromptPrefixCache(self.model, model_path, config.PROMPT_CACHE["directory"], fingerprint)
+            for system_message in self.system_prompts.values():
+                cache.warm(system_message)
+            self.prompt_cache = cache
+        except Exception as e:
+            # Not fatal: every request just evaluates the full prompt again
+            print(f"Prompt cache error: {e}")
+
+    def construct_prompt(self, user_query, language, history=None, notes=None):
+        """Construct the chat prompt for the Llama.cpp model.
+
+        `history` is a list of earlier user/assistant messages to put between
+        the system prompt and the new question. Reference notes from the
+        knowledge index follow the question (`notes`, looked up unless given),
+        so a speculative prefill of the question still matches.
+        """
+        system_message = self.system_prompts[language]
+        if notes is None:
+            notes = self.knowledge_notes(user_query, language)
+
+        messages = [{"role": "system", "content": system_message}]
+        messages.extend(history or [])
+        messages.append({"role": "user", "content": f"{user_query}\n\n{notes}" if notes else user_query})
+        return messages
+
+    def knowledge_notes(self, user_query, language):
+        """Reference notes for a question that mentions a known condition, or ""."""
+        if self.knowledge is None:
+            return ""
+        with tracing.span("knowledge_lookup", language=language) as span:
+            match = self.knowledge.lookup(user_query, language)
+            span.set(hit=match[0] if match else None)
+        if match is None:
+            return ""
+        return context_notes(match[1], language, config.KNOWLEDGE["context_items"]) or ""
+
+    def knowledge_answer(self, query, language):
+        """The curated answer for a question that just names a known condition, or None."""
+        if self.knowledge is None or not config.KNOWLEDGE["serve_exact"]:
+            return None
+        with tracing.span("knowledge_lookup", language=language) as span:
+            match = self.knowledge.lookup(query, language)
+            span.set(hit=match[0] if match else None)
+        if match is None or match[0] != "exact":
+            return None
+        return render_answer(match[1], language)
+
+    def conversation_prompt(self, user_query, language, session=None):
+        """Construct the prompt for `user_query` with as much of the session's history as fits."""
+        settings = config.CONVERSATION
+        if session is None or not settings["enabled"]:
+            return self.construct_prompt(user_query, language)
+        conversation = self.conversations.get(session, language)
+        notes = self.knowledge_notes(user_query, language)
+        # The whole prompt and the answer have to fit in the context window
+        available = (self.profile.n_ctx - self.profile.max_tokens - settings["reserve_tokens"]
+                     - self.tokenizer.count(self.system_prompts[language]) - self.tokenizer.count(user_query)
+                     - self.tokenizer.count(notes))
+        budget = min(settings["history_tokens"], available)
+        conversation.fit(budget, self.tokenizer, settings["evict_fraction"], settings["summarize"])
+        return self.construct_prompt(user_query, language, conversation.messages(), notes)
+
+    def has_history(self, session, language):
+        return (session is not None and config.CONVERSATION["enabled"]
+                and self.conversations.has_history(session, language))
+
+    def is_follow_up(self, query, language, session):
+        """Whether `query` depends on earlier turns of the session, so its answer must not be cached.
+
+        Decided from the question itself: a standalone question asked later in
+        a conversation is cached and looked up like the first one.
+        """
+        return self.has_history(session, language) and refers_back(query, language)
+
+    def record_turn(self, session, language, query, response):
+        """Add a finished question and answer to the session's history."""
+        if session is None or not config.CONVERSATION["enabled"] or not response.strip():
+            return
+        self.conversations.get(session, language).add_turn(
+            query, response, self.tokenizer, config.CONVERSATION["max_answer_tokens"])
+
+    def generate_response(self, prompt_messages, max_tokens=None, language=None, structured=False):
+        """Generate response using the Llama.cpp model."""
+        return "".join(self.generate_response_stream(prompt_messages, max_tokens, language, structured)).strip()
+
+    def generate_response_stream(self, prompt_messages, max_tokens=None, language=None, structured=False):
+        """Generate a response with the Llama.cpp model, yielding text deltas as they are produced.
+
+        `max_tokens` defaults to the profile's. With a `language`, generation
+        stops once the answer's final section is complete. With `structured`,
+        the output is constrained to a JSON answer record (see structured.py).
+        """
+        options = self.sampling_options(max_tokens)
+        settings = config.OUTPUT_LIMITS
+        stop = None
+        if not structured and language is not None and settings["stop_after_final_section"]:
+            stop = SectionStop(language, settings["final_section_tokens"])
+        try:
+            if self.batcher is not None:
+                # Decoded together with other sessions in the shared batch; no lock needed
+                stream = self.batcher.stream(prompt_messages, **options)
+                try:
+                    yield from strip_leading_whitespace(until_complete(stream, stop))
+                finally:
+                    stream.close()
+                return
+            with self.lock:
+                self.restore_prompt_prefix(prompt_messages)
+                options["max_tokens"] = self.fit_context(prompt_messages, options["max_tokens"])
+                if structured:
+                    # Sized to the final max_tokens; the grammar itself ends the answer
+                    options["grammar"] = self.structured_grammar(language, options["max_tokens"])
+                stream = self.model.create_chat_completion(
+                    messages=prompt_messages,
+                    stream=True,
+                    **options
+                )
+                try:
+                    deltas = (chunk['choices'][0]['delta'].get('content') for chunk in stream)
+                    yield from strip_leading_whitespace(until_complete(deltas, stop))
+                finally:
+                    # Ends llama.cpp's generation while still holding the lock
+                    stream.close()
+        except Exception as e:
+            raise Exception(f"Model inference error: {str(e)}")
+
+    def structured_grammar(self, language, max_tokens):
+        """The answer grammar whose longest record fits in `max_tokens` tokens of `language`."""
+        key = (language, max_tokens)
+        if key not in self.answer_grammars:
+            settings = config.STRUCTURED_OUTPUT
+            chars_per_token = settings["chars_per_token"].get(language, 1.0)
+            max_items, max_chars = field_limits(max_tokens, settings["shares"], settings["max_items"],
+                                                settings["min_item_chars"], chars_per_token)
+            self.answer_grammars[key] = answer_grammar(max_items, max_chars)
+        return self.answer_grammars[key]
+
+    def sampling_options(self, max_tokens=None):
+        return {"temperature": self.profile.temperature, "max_tokens": max_tokens or self.profile.max_tokens}
+
+    def fit_context(self, prompt_messages, max_tokens):
+        """Limit max_tokens to what the context window has left after the prompt."""
+        text = render_chat_prompt(self.model, prompt_messages)
+        prompt_tokens = len(self.model.tokenize(text.encode('utf-8'), add_bos=True, special=True))
+        available = self.model.n_ctx() - prompt_tokens
+        if available <= 0:
+            raise Exception(f"Prompt of {prompt_tokens} tokens does not fit the {self.model.n_ctx()}-token context")
+        return min(max_tokens, available)
+
+    def output_limit(self, language):
+        """max_tokens for the next answer in `language`, predicted from recent answer lengths.
+
+        Structured answers always get the profile's: their grammar is sized to it.
+        """
+        if self.output_lengths is None or self.structured:
+            return self.profile.max_tokens
+        return self.output_lengths.predict(language, self.profile.max_tokens)
+
+    def record_output_length(self, language, tokens):
+        if self.output_lengths is not None and tokens:
+            self.output_lengths.record(language, tokens)
+
+    def restore_prompt_prefix(self, prompt_messages):
+        """Load the cached system prompt state so only the user's turn is evaluated."""
+        if self.prompt_cache is not None:
+            self.prompt_cache.restore(prompt_messages[0]["content"])
+
+    def prefill(self, partial_query, language, session=None):
+        """Evaluate the prompt up to `partial_query` ahead of time (speculative prefill).
+
+        Called with the confirmed words of a transcript while the user is still
+        speaking. Tokens already in the KV cache are kept, anything after the
+        point where the new text diverges is rolled back, and only the new
+        tokens are evaluated. When the final question is submitted,
+        llama.cpp's prefix matching reuses every token that still matches.
+        Returns the number of tokens evaluated, or None if the engine was busy
+        or cannot prefill.
+        """
+        if self.model is None or self.batcher is not None:
+            return None # The batcher decodes in its own context
+        if not self.lock.acquire(blocking=False):
+            return None # A real request is generating; never delay it
+        try:
+            prompt = self.conversation_prompt(partial_query + PREFILL_MARK, language, session)
+            text = render_chat_prompt(self.model, prompt)
+            text = text[:text.index(PREFILL_MARK)]
+            tokens = self.model.tokenize(text.encode('utf-8'), add_bos=True, special=True)
+            # The last token may merge with the next word once it is spoken
+            tokens = tokens[:-1]
+
+            self.restore_prompt_prefix(prompt)
+            cached = self.model.input_ids[:self.model.n_tokens]
+            common = 0
+            for a, b in zip(cached, tokens):
+                if a != b:
+                    break
+                common += 1
+            if common < self.model.n_tokens:
+                # Roll back the part of an earlier guess that the transcript no longer matches
+                self.model._ctx.kv_cache_seq_rm(-1, common, -1)
+                self.model.n_tokens = common
+            if common < len(tokens):
+                self.model.eval(tokens[common:])
+            return len(tokens) - common
+        finally:
+            self.lock.release()
+
+    def parse_response(self, response, language):
+        """This function primarily ensures the response is not empty."""
+        response = response.strip()
+        if not response:
+            return FALLBACK_RESPONSES[language]
+        return response
+
+    def stream_answer(self, query, language, check_cache=True, session=None):
+        """Answer `query`, yielding events as the response is produced.
+
+        Yields {"type": "delta", "text": ...} for each piece of generated text,
+        then one {"type": "done", "response": ..., "cached": ..., "stats": ...}.
+        Answers served from the response cache produce only the "done" event.
+        Pass check_cache=False when the caller has already looked the query up.
+        With a `session`, earlier turns of that session are part of the prompt
+        and the answer is added to them once it is complete.
+        """
+        start = time.perf_counter()
+        cached = self.cached_response(query, language, session) if check_cache else None
+        if cached is not None:
+            self.record_turn(session, language, query, cached)
+            yield self.done_event(cached, True, start)
+            return
+
+        follow_up = self.is_follow_up(query, language, session)
+        with tracing.span("construct_prompt", language=language, follow_up=follow_up) as span:
+            prompt = self.conversation_prompt(query, language, session)
+            span.set(messages=len(prompt))
+        renderer = AnswerRenderer(language) if self.structured else None
+        max_tokens = self.output_limit(language)
+        first_token_at = None
+        tokens = 0
+        chunks = []
+        with tracing.span("generate", language=language, max_tokens=max_tokens, structured=self.structured) as span:
+            for delta in self.generate_response_stream(prompt, max_tokens, language, self.structured):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    span.set(ttft_ms=(first_token_at - start) * 1000)
+                tokens += 1
+                span.set(tokens=tokens)
+                # Structured output arrives as JSON and is shown as the sections it fills
+                for section, text in renderer.feed(delta) if renderer else [(None, delta)]:
+                    chunks.append(text)
+                    yield dict(type="delta", text=text, **({"section": section} if section else {}))
+            for section, text in renderer.finish() if renderer and tokens else []:
+                chunks.append(text)
+                yield {"type": "delta", "text": text, "section": section}
+
+        with tracing.span("parse_response", language=language) as span:
+            response = "".join(chunks)
+            self.record_output_length(language, tokens)
+            if not follow_up:
+                self.store_response(query, language, response)
+            self.record_turn(session, language, query, response)
+            record = renderer.record() if renderer and tokens else None
+            final = self.parse_response(response, language)
+            span.set(chars=len(final))
+        yield self.done_event(final, False, start, first_token_at, tokens, record)
+
+    def cached_response(self, query, language, session=None):
+        # A follow-up question depends on the conversation, not just its text
+        if self.is_follow_up(query, language, session):
+            return None
+        # Curated records take precedence over earlier generated answers
+        answer = self.knowledge_answer(query, language)
+        if answer is not None or self.response_cache is None:
+            return answer
+        with tracing.span("cache_lookup", language=language) as span:
+            response = self.response_cache.get(language, query)
+            span.set(hit=response is not None)
+        return response
+
+    def store_response(self, query, language, response):
+        # Empty output is answered with the fallback text, which is not worth caching
+        if self.response_cache is not None and response.strip():
+            self.response_cache.put(language, query, response.strip())
+
+    def done_event(self, response, cached, start, first_token_at=None, tokens=None, record=None):
+        end = time.perf_counter()
+        stats = {"total_ms": (end - start) * 1000}
+        if first_token_at is not None:
+            decode_time = end - first_token_at
+            stats["ttft_ms"] = (first_token_at - start) * 1000
+            stats["tokens"] = tokens
+            # Each streamed chunk from llama.cpp carries one token
+            stats["tokens_per_sec"] = (tokens - 1) / decode_time if decode_time > 0 else 0.0
+        event = {"type": "done", "response": response, "cached": cached, "stats": stats}
+        if record is not None:
+            event["record"] = record # Structured answer fields
+        return event
+
+    def status(self):
+        status = {"model_loaded": self.model_loaded, "profile": self.profile.name}
+        if self.startup_timer is not None:
+            status["startup_ms"] = dict(self.startup_timer.phases)
+        if self.response_cache is not None:
+            status["response_cache"] = self.response_cache.stats()
+        if self.knowledge is not None:
+            status["knowledge"] = self.knowledge.stats()
+        return status
@@ -0,0 +1,79 @@
+"""
+Thin client for a running inference server (server.py).
+
+RemoteEngine exposes the same methods the Tkinter app uses on HealthEngine,
+so `python src/main.py --server http://host:8000` runs the GUI without
+loading a model locally.
+"""
+
+import json
+import time
+import urllib.error
+import urllib.request
+
+class RemoteEngine:
+    def __init__(self, base_url, timeout=600):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.model_loaded = False
+
+    def load_model(self, progress=print, poll_interval=2.0):
+        """Wait until the server reports its model as loaded."""
+        progress(f"Connecting to inference server at {self.base_url}...")
+        while True:
+            try:
+                status = self.status()
+            except urllib.error.URLError as e:
+                raise Exception(f"Inference server unreachable: {e.reason}")
+            if status.get("model_loaded"):
+                break
+            progress("Waiting for the server to finish loading the model...")
+            time.sleep(poll_interval)
+        self.model_loaded = True
+
+    def parallelism(self):
+        return 1 # The server schedules requests across its own workers
+
+    def status(self):
+        with urllib.request.urlopen(f"{self.base_url}/health", timeout=10) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def cached_response(self, query, language, session=None):
+        return None # The server consults its own response cache
+
+    def record_turn(self, session, language, query, response):
+        pass # The server keeps the conversation history
+
+    def answer(self, query, language, session=None):
+        with self.post("/v1/answer", query, language, session) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def stream_answer(self, query, language, check_cache=True, session=None):
+        """Yield the server's SSE events, same shape as HealthEngine.stream_answer."""
+        with self.post("/v1/answer/stream", query, language, session) as response:
+            for line in response:
+                line = line.decode('utf-8').strip()
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):])
+                if event["type"] == "error":
+                    raise Exception(event["error"])
+                yield event
+
+    def post(self, path, query, language, session=None):
+        payload = {"query": query, "language": language}
+        if session is not None:
+            payload["session"] = session
+        body = json.dumps(payload).encode('utf-8')
+        request = urllib.request.Request(
+            f"{self.base_url}{path}", data=body,
+            headers={"Content-Type": "application/json"}
+        )
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8'))["error"]
+            except Exception:
+                message = e.reason
+            raise Exception(f"Inference server error ({e.code}): {message}")
@@ -0,0 +1,303 @@
+"""
+Local knowledge index of curated condition records.
+
+Records (data/conditions.jsonl) hold, for one condition, its names and
+synonyms in English, Marathi and transliteration, plus the answer fields of
+structured.FIELDS per language. They are compiled into one index file:
+
+    magic | header length | header JSON | record JSON blobs
+
+The header (names, BM25 postings, record offsets) is small and read into
+memory; the file is memory-mapped and a record is only decoded when a query
+matches it. The index is rebuilt when the source file changes.
+
+lookup() normalizes the query as the response cache does, drops question
+words ("what is", "काय आहे") and Marathi case endings ("डेंग्यूची" ->
+"डेंग्यू"), then:
+
+- exact hit: what is left is one of a record's names. The record is served
+  as the answer without running the model.
+- near hit: BM25 over the names ranks the records, and the best one with a
+  name that covers at least min_name_coverage of its own terms (all of them,
+  by default) and min_query_coverage of the query's is used. A digit or
+  single letter in the query that the name lacks rules the name out, so
+  "type 1 diabetes" is not taken for "diabetes". The record goes into the
+  prompt as compact reference notes, so the model writes less from memory.
+
+    python src/knowledge.py --build
+    python src/knowledge.py "symptoms of dengue" --language English
+"""
+
+import argparse
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import Counter, defaultdict
+
+import config
+from response_cache import normalize_query
+from structured import FIELDS, SECTIONS, AnswerRenderer
+
+MAGIC = b"HAKIDX1\n"
+
+# Words that ask about a condition rather than name it
+STOPWORDS = {
+    "English": {
+        "what", "whats", "is", "are", "was", "the", "a", "an", "of", "for", "about", "on", "and", "to",
+        "i", "me", "my", "have", "has", "got", "do", "does", "can", "how", "tell", "please", "explain",
+        "symptoms", "symptom", "signs", "treatment", "treatments", "treat", "cure", "causes", "cause",
+        "information", "info", "disease", "condition", "in", "at", "with", "from", "it", "its", "this",
+        "treated", "home", "remedies", "remedy", "medicine", "medicines", "manage", "management"
+    },
+    "Marathi": {
+        "काय", "आहे", "आहेत", "म्हणजे", "मला", "माझ्या", "झाला", "झाली", "झाले", "कसा", "कशी", "कसे",
+        "करावे", "करायचे", "सांगा", "माहिती", "बद्दल", "विषयी", "लक्षणे", "उपचार", "कारणे", "रोग", "आजार",
+        "आणि", "की", "हा", "ही", "हे", "कृपया", "घरगुती", "उपाय", "औषध"
+    }
+}
+
+# Endings attached to Marathi nouns ("डेंग्यूची", "मलेरियाबद्दल") and English plurals
+SUFFIXES = ("च्या", "बद्दल", "विषयी", "साठी", "मध्ये", "ची", "चा", "चे", "ला", "ने", "त", "es", "s")
+
+CONTEXT_INTRO = {
+    "English": "Reference notes (use them in your answer):",
+    "Marathi": "संदर्भ माहिती (उत्तरात वापरा):"
+}
+
+def terms_of(text):
+    return normalize_query(text).split()
+
+class KnowledgeIndex:
+    def __init__(self, path, k1=1.2, b=0.75, min_name_coverage=1.0, min_query_coverage=0.6):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.min_name_coverage = min_name_coverage
+        self.min_query_coverage = min_query_coverage
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a knowledge index")
+        (length,) = struct.unpack_from("<I", self.data, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self.data[start:start + length])
+        self.body = start + length
+        self.source = header["source"]
+        self.offsets = header["offsets"] # record -> [offset, length] in the body
+        self.names = header["names"] # record -> list of name term lists
+        self.exact = header["exact"] # normalized name -> record
+        self.postings = header["postings"] # term -> [[record, term frequency], ...]
+        self.lengths = header["lengths"]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        self.records = {} # Decoded records, by number
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, source, path, **options):
+        """Open the index at `path`, (re)building it first if `source` has changed."""
+        if not os.path.exists(path) or cls.stale(source, path):
+            build_index(source, path)
+        return cls(path, **options)
+
+    @staticmethod
+    def stale(source, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return True
+            (length,) = struct.unpack("<I", f.read(4))
+            stamp = json.loads(f.read(length))["source"]
+        stat = os.stat(source)
+        return stamp != {"mtime": stat.st_mtime, "size": stat.st_size}
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def record(self, number):
+        with self.lock:
+            record = self.records.get(number)
+            if record is None:
+                offset, length = self.offsets[number]
+                record = self.records[number] = json.loads(self.data[self.body + offset:self.body + offset + length])
+            return record
+
+    def query_terms(self, query, language):
+        """Terms of `query` that could name a condition, with known endings removed."""
+        stopwords = STOPWORDS.get(language, set()) | STOPWORDS["English"]
+        terms = []
+        for term in terms_of(query):
+            if term not in self.postings:
+                for suffix in SUFFIXES:
+                    if term.endswith(suffix) and term[:-len(suffix)] in self.postings:
+                        term = term[:-len(suffix)]
+                        break
+            if term not in stopwords or term in self.postings:
+                terms.append(term)
+        return terms
+
+    def lookup(self, query, language):
+        """Return ("exact" | "near", record) for the best matching record, or None."""
+        terms = self.query_terms(query, language)
+        match = self.match(terms)
+        with self.lock:
+            self.counters[match[0] if match else "miss"] += 1
+        if match is None:
+            return None
+        kind, number = match
+        return kind, self.record(number)
+
+    def match(self, terms):
+        if not terms:
+            return None
+        number = self.exact.get(" ".join(terms))
+        if number is not None:
+            return "exact", number
+        scores = defaultdict(float)
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.lengths) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for number, frequency in postings:
+                norm = 1 - self.b + self.b * self.lengths[number] / self.average_length
+                scores[number] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+        for number in sorted(scores, key=scores.get, reverse=True):
+            if any(self.names_query(name, terms) for name in self.names[number]):
+                return "near", number
+        return None
+
+    def names_query(self, name, terms):
+        """Whether `name` (a list of terms) is what the query `terms` ask about."""
+        covered = [term for term in terms if term in name]
+        # "fever" alone is part of several names but names none of them
+        if len(set(covered)) / len(set(name)) < self.min_name_coverage:
+            return False
+        # "cold" is all of a name, but "cold sore" asks about something else
+        if len(covered) / len(terms) < self.min_query_coverage:
+            return False
+        return not any(len(term) == 1 or term.isdigit() for term in terms if term not in name)
+
+    def stats(self):
+        """Record count and lookup outcomes."""
+        with self.lock:
+            return {"records": len(self), "exact": self.counters["exact"],
+                    "near": self.counters["near"], "miss": self.counters["miss"]}
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+def build_index(source, path):
+    """Compile the JSON Lines records in `source` into the index file at `path`."""
+    names, exact, lengths, blobs = [], {}, [], []
+    postings = defaultdict(list)
+    with open(source, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            number = len(blobs)
+            record_names = []
+            for language_names in record["names"].values():
+                for name in language_names:
+                    terms = terms_of(name)
+                    if terms and terms not in record_names:
+                        record_names.append(terms)
+                        exact.setdefault(" ".join(terms), number)
+            if not record_names:
+                raise ValueError(f"{source}:{line_number}: record has no names")
+            frequencies = Counter(term for terms in record_names for term in terms)
+            for term, frequency in frequencies.items():
+                postings[term].append([number, frequency])
+            names.append(record_names)
+            lengths.append(sum(frequencies.values()))
+            blobs.append(json.dumps(record, ensure_ascii=False).encode('utf-8'))
+
+    offsets, offset = [], 0
+    for blob in blobs:
+        offsets.append([offset, len(blob)])
+        offset += len(blob)
+    stat = os.stat(source)
+    header = json.dumps({
+        "source": {"mtime": stat.st_mtime, "size": stat.st_size},
+        "offsets": offsets, "names": names, "exact": exact, "postings": postings, "lengths": lengths
+    }, ensure_ascii=False).encode('utf-8')
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(temporary, path)
+    return len(blobs)
+
+def open_index(settings=None):
+    """The configured knowledge index, or None if it is disabled or missing."""
+    settings = settings or config.KNOWLEDGE
+    if not settings["enabled"] or not os.path.exists(settings["source"]):
+        return None
+    return KnowledgeIndex.open(settings["source"], settings["index"], k1=settings["bm25_k1"],
+                               b=settings["bm25_b"], min_name_coverage=settings["min_name_coverage"],
+                               min_query_coverage=settings["min_query_coverage"])
+
+def render_answer(record, language):
+    """The record as a complete answer in `language`, or None if it has no content in that language."""
+    content = record.get(language)
+    if not content:
+        return None
+    renderer = AnswerRenderer(language)
+    renderer.feed(json.dumps({field: content[field] for field, _ in FIELDS if field in content}, ensure_ascii=False))
+    renderer.finish()
+    return renderer.text()
+
+def context_notes(record, language, max_items=4):
+    """The record as compact reference notes for the prompt, in `language` if it has that content."""
+    content = record.get(language) or record.get("English")
+    if not content:
+        return None
+    structure = config.RESPONSE_TEMPLATES[language]["structure"]
+    lines = [CONTEXT_INTRO[language]]
+    for field, kind in FIELDS:
+        value = content.get(field)
+        if not value:
+            continue
+        if kind == "list":
+            value = "; ".join(value[:max_items])
+        lines.append(f"{structure[SECTIONS.index(field)].strip('* ')} {value}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the local knowledge index")
+    parser.add_argument("query", nargs="?", help="question to look up")
+    parser.add_argument("--language", default="English", choices=sorted(CONTEXT_INTRO))
+    parser.add_argument("--build", action="store_true", help=f"rebuild {config.KNOWLEDGE['index']}")
+    args = parser.parse_args()
+    settings = config.KNOWLEDGE
+
+    if args.build:
+        count = build_index(settings["source"], settings["index"])
+        print(f"Indexed {count} records from {settings['source']} into {settings['index']}")
+    if args.query:
+        index = open_index(settings)
+        if index is None:
+            parser.exit(1, "The knowledge index is disabled or has no source file\n")
+        start = time.perf_counter()
+        match = index.lookup(args.query, args.language)
+        elapsed = (time.perf_counter() - start) * 1000
+        if match is None:
+            print(f"No match ({elapsed:.3f} ms)")
+            return
+        kind, record = match
+        print(f"{kind} hit: {record['id']} ({elapsed:.3f} ms)\n")
+        if kind == "exact":
+            print(render_answer(record, args.language))
+        else:
+            print(context_notes(record, args.language, settings["context_items"]))
+
+if __name__ == "__main__":
+    main()
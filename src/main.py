@@ -1,46 +1,95 @@
+import time
+LAUNCHED = time.perf_counter() # Start of the startup timeline
+
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import threading
-import speech_recognition as sr
-from gtts import gTTS
-import os
-import tempfile
-import pygame
 from datetime import datetime
-import queue
-
-# --- NEW IMPORTS FOR GGUF MODEL ---
-from llama_cpp import Llama
-from huggingface_hub import hf_hub_download
+import argparse
+import uuid
+from collections import deque
+
+# Only light modules are imported here. llama_cpp, pygame and
+# speech_recognition are imported by background startup tasks once the
+# window is shown (see startup.py).
+import config
+import tracing
+from scheduler import InferenceScheduler, QueueFullError
+from settings import ConfigError, add_profile_arguments, profile_from_args
+from speculation import SpeculativePrefill
+from audio_cache import AudioCache
+from startup import StartupTimeline
+from transcript import Transcript
+from tts import CachedBackend, SpeechPipeline, create_tts_backend
+from ui_bus import UIBus
 
 class HealthAssistantApp:
-    def __init__(self, root):
+    def __init__(self, root, create_engine, timeline=None):
+        """`create_engine()` returns a HealthEngine, or a RemoteEngine when running as a thin client.
+
+        It is called on a background thread, so importing llama_cpp does not
+        delay the window.
+        """
         self.root = root
-        self.root.title("AI Health & Wellness Assistant")
-        self.root.geometry("800x600")
+        self.create_engine = create_engine
+        self.timeline = timeline or StartupTimeline()
+        self.engine = None # Set by the "engine" startup task
+        # Every question goes through one scheduler, so the model is never driven by two threads.
+        # It gets its worker once the engine exists, but answers emergencies from the start.
+        self.scheduler = InferenceScheduler([], max_queue=config.SCHEDULER["max_queue"])
+        self.root.title(config.APP_NAME)
+        self.root.geometry(f"{config.WINDOW_WIDTH}x{config.WINDOW_HEIGHT}")
         self.root.configure(bg='#f0f0f0')
         
         self.current_language = "English"
+        self.session = uuid.uuid4().hex # Follow-up questions are answered in the context of this conversation
         self.is_listening = False
-        self.recognizer = sr.Recognizer()
-        self.microphone = sr.Microphone()
-        self.audio_queue = queue.Queue()
+        # Opened by startup tasks; None until then, or if unavailable
+        self.recognizer = None
+        self.player = None
+        self.speech = None
         
-        pygame.mixer.init()
-        
-        self.model = None # This will now be a Llama object
-        self.model_loaded = False
+        self.streaming_enabled = True # Show tokens in the chat pane as they are generated
+        self.transcript = Transcript(config.TRANSCRIPT["max_messages"], config.TRANSCRIPT["archive_path"])
+        self.visible_marks = deque() # Text marks at the start of each message shown in the chat pane
+        self.streaming_message = None # Transcript record of the answer being streamed
         
         self.setup_ui()
-        self.setup_audio_thread()
+        # Worker threads never touch Tk widgets; they post updates to this bus
+        self.ui = UIBus(root, {
+            "status": self.status_var.set,
+            "message": self.add_message,
+            "stream_begin": self.begin_stream_message,
+            "text": self.append_stream_text
+        }, interval_ms=config.UI_FRAME_INTERVAL)
+
+        self.tasks_started = False
+        self.root.bind("<Map>", self.on_first_map, add="+")
+        self.root.after(500, self.start_background_tasks) # In case the window is never mapped
+    
+    def on_first_map(self, event=None):
+        if event is not None and event.widget is not self.root:
+            return
+        self.timeline.mark("window_shown")
+        # Let Tk finish drawing the first frame before the imports start competing for the GIL
+        self.root.after(1, self.start_background_tasks)
 
-        threading.Thread(target=self.load_model, daemon=True).start()
+    def start_background_tasks(self):
+        """Import the heavy libraries and open the devices, each on its own thread."""
+        if self.tasks_started:
+            return
+        self.tasks_started = True
+        self.timeline.run_tasks({
+            "engine": self.load_model,
+            "audio": self.setup_audio,
+            "speech_recognition": self.setup_recognizer
+        })
     
     def setup_ui(self):
         main_frame = tk.Frame(self.root, bg='#f0f0f0')
         main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
-        title_label = tk.Label(main_frame, text="AI Health & Wellness Assistant", 
+        title_label = tk.Label(main_frame, text=config.APP_NAME, 
                                font=('Arial', 16, 'bold'), bg='#f0f0f0', fg='#2c3e50')
         title_label.pack(pady=(0, 20))
         
@@ -89,127 +138,70 @@ class HealthAssistantApp:
         
         self.add_message("System", "Welcome to your AI Health & Wellness Assistant! Please select your preferred language and ask me about common health concerns. Remember, I provide general information only - always consult a doctor for medical advice.", "system")
 
-    def setup_audio_thread(self):
-        def audio_worker():
-            while True:
-                audio_file = self.audio_queue.get()
-                if audio_file is None: break
-                try:
-                    if os.path.exists(audio_file):
-                        pygame.mixer.music.load(audio_file)
-                        pygame.mixer.music.play()
-                        while pygame.mixer.music.get_busy():
-                            pygame.time.wait(100)
-                        pygame.mixer.music.unload()
-                        os.remove(audio_file)
-                except Exception as e:
-                    print(f"Audio playback error: {e}")
-                finally:
-                    self.audio_queue.task_done()
-        threading.Thread(target=audio_worker, daemon=True).start()
-
-    # --- REFACTORED AI FUNCTIONS START HERE ---
-
-    def load_model(self):
-        """Load the GGUF-quantized Phi-3 model using llama-cpp-python."""
+    def setup_audio(self):
+        pygame = self.timeline.timed_import("pygame")
         try:
-            self.status_var.set("Loading GGUF AI model... Please wait...")
-            self.root.update_idletasks()
-            
-            model_repo = "second-state/Phi-3-mini-4k-instruct-GGUF"
-            model_filename = "Phi-3-mini-4k-instruct-Q4_0.gguf"
-
-            self.status_var.set(f"Downloading {model_filename} from {model_repo}...")
-            self.root.update_idletasks()
-            model_path = hf_hub_download(repo_id=model_repo, filename=model_filename)
-            self.status_var.set("Download complete. Loading model to GPU...")
-            self.root.update_idletasks()
-
-            # n_gpu_layers=-1 attempts to offload all layers to the GPU.
-            # This is the key for GPU acceleration.
-            self.model = Llama(
-                model_path=model_path,
-                n_gpu_layers=25, 
-                n_ctx=4096,
-                verbose=False
-            )
-            
-            self.model_loaded = True
-            self.status_var.set("GGUF AI model loaded successfully! Ready to assist.")
+            pygame.mixer.init()
+            AudioPlayer = self.timeline.timed_import("audio_player").AudioPlayer
+            self.player = AudioPlayer(volume=config.AUDIO["playback_volume"])
         except Exception as e:
-            error_message = f"Failed to load AI model: {str(e)}"
-            self.status_var.set("Error: Model failed to load. Please restart.")
-            messagebox.showerror("Critical Error", error_message)
-
-    def construct_prompt(self, user_query):
-        """Construct the chat prompt for the Llama.cpp model."""
-        if self.current_language == "English":
-            system_message = """You are an AI Health Encyclopedia. Your goal is to provide a comprehensive, structured overview of any health condition. Your response must be factual, informative, and strictly follow this format:
-
-1. Disease Name: [Name of the disease or condition]
-
-2. Disclaimer: DISCLAIMER: I am an AI assistant, not a medical professional. This information is for general knowledge only. Please consult a qualified doctor for any health concerns.
-
-3. Overview: [A detailed but easy-to-understand explanation.]
-
-4. Common Symptoms:
-- [List of symptoms]
-
-5. Common Treatments:
-- [List of treatments]
-
-6. General Home Remedies & Management:
-- [List safe, non-prescriptive home care tips.]
-
-7. When to Consult a Doctor: [Provide clear signs for seeking professional medical help.]"""
-        else: # Marathi
-            system_message = """You are an AI Health Encyclopedia. Your goal is to provide a comprehensive, structured overview of any health condition IN MARATHI. Your response must be factual, informative, in MARATHI, and strictly follow this format:
-
-१. रोगाचे नाव: [Name of the disease or condition in Marathi]
-
-२. अस्वीकरण: अस्वीकरण: मी एक AI सहाय्यक आहे, वैद्यकीय व्यावसायिक नाही. ही माहिती केवळ सामान्य ज्ञानासाठी आहे. कृपया कोणत्याही आरोग्यविषयक समस्यांसाठी पात्र डॉक्टरांचा सल्ला घ्या.
-
-३. सर्वसाधारण माहिती: [A detailed but easy-to-understand explanation of the condition in Marathi.]
-
-४. सामान्य लक्षणे:
-- [List of symptoms in Marathi]
-
-५. सामान्य उपचार:
-- [List of treatments in Marathi]
-
-६. सामान्य घरगुती उपाय आणि व्यवस्थापन:
-- [List safe, non-prescriptive home care tips in Marathi.]
+            print(f"Audio output unavailable: {e}")
+            return
+        self.speech = self.create_speech_pipeline()
 
-७. डॉक्टरांना कधी भेटावे: [Provide clear signs for seeking medical help in Marathi.]"""
+    def create_speech_pipeline(self):
+        settings = config.TTS
+        try:
+            backend = create_tts_backend(settings["backend"])
+        except Exception as e:
+            print(f"Text-to-speech unavailable: {e}")
+            return None
+        if settings["cache_max_mb"] > 0:
+            try:
+                cache = AudioCache(settings["cache_directory"], max_bytes=settings["cache_max_mb"] * 1024 * 1024)
+                backend = CachedBackend(backend, cache)
+            except Exception as e:
+                print(f"Audio cache error: {e}")
+        speech = SpeechPipeline(backend, self.player.play, workers=settings["workers"],
+                                max_sentence_chars=settings["max_sentence_chars"])
+        if settings["prewarm"] and isinstance(backend, CachedBackend):
+            # Every spoken answer includes the disclaimer; have it ready before the first one
+            speech.prewarm((language["code"], language["disclaimer"]) for language in config.SUPPORTED_LANGUAGES.values())
+        return speech
+
+    def stop_speaking(self):
+        """Silence the current spoken answer and drop its queued sentences."""
+        if self.speech is not None:
+            self.speech.stop()
+        if self.player is not None:
+            self.player.stop()
+
+    # --- AI FUNCTIONS (inference lives in engine.py) ---
 
-        messages = [
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": user_query}
-        ]
-        return messages
+    def load_model(self):
+        """Create the engine and load the model, reporting progress in the status bar."""
+        def progress(message):
+            self.ui.post("status", message)
 
-    def generate_response(self, prompt_messages):
-        """Generate response using the Llama.cpp model."""
         try:
-            response_object = self.model.create_chat_completion(
-                messages=prompt_messages,
-                temperature=0.7,
-                max_tokens=1024 
-            )
-            response = response_object['choices'][0]['message']['content']
-            return response.strip()
+            engine = self.create_engine()
+            self.scheduler.add_workers([engine])
+            self.engine = engine
+            self.timeline.mark("engine_created")
+            engine.load_model(progress)
+            # Like the server: one scheduler worker per decode slot, so a newer question
+            # does not wait for a cancelled one to release the model
+            self.scheduler.add_workers([engine] * (engine.parallelism() - 1))
+            self.timeline.mark("model_loaded")
+            timer = getattr(engine, "startup_timer", None)
+            if timer is not None:
+                self.timeline.extra["model_phases"] = dict(timer.phases)
+            timings = f" ({timer.summary()})" if timer else ""
+            self.ui.post("status", f"GGUF AI model loaded successfully! Ready to assist.{timings}")
         except Exception as e:
-            raise Exception(f"Model inference error: {str(e)}")
-
-    def parse_response(self, response):
-        """This function primarily ensures the response is not empty."""
-        response = response.strip()
-        if not response:
-            if self.current_language == "English":
-                return "I'm sorry, I couldn't generate a specific response for that topic. Could you please try rephrasing your question?"
-            else:
-                return "माफ करा, मी त्या विषयासाठी विशिष्ट प्रतिसाद तयार करू शकलो नाही. तुम्ही कृपया तुमचा प्रश्न पुन्हा मांडण्याचा प्रयत्न करू शकाल का?"
-        return response
+            error_message = f"Failed to load AI model: {str(e)}"
+            self.ui.post("status", "Error: Model failed to load. Please restart.")
+            self.ui.call(messagebox.showerror, "Critical Error", error_message)
 
     # --- UNCHANGED FUNCTIONS START HERE ---
 
@@ -227,9 +219,42 @@ class HealthAssistantApp:
         else: # system
             formatted_message = f"{prefix} {message}\n\n"
         
+        self.record_message(msg_type, message)
         self.chat_display.insert(tk.END, formatted_message)
         self.chat_display.see(tk.END)
-        self.root.update_idletasks()
+
+    def record_message(self, msg_type, text):
+        """Add a message to the transcript and mark where it starts in the chat pane.
+
+        Only the last TRANSCRIPT["visible_messages"] messages stay in the widget;
+        the oldest one is deleted from it as each new one arrives.
+        """
+        message = self.transcript.append(msg_type, text)
+        mark = f"message{message.id}"
+        self.chat_display.mark_set(mark, "end-1c")
+        self.chat_display.mark_gravity(mark, tk.LEFT)
+        self.visible_marks.append(mark)
+        if len(self.visible_marks) > config.TRANSCRIPT["visible_messages"]:
+            self.chat_display.delete("1.0", self.visible_marks[1])
+            self.chat_display.mark_unset(self.visible_marks.popleft())
+        return message
+
+    def begin_stream_message(self):
+        """Open an empty assistant message that streamed text is appended to."""
+        timestamp = datetime.now().strftime("%H:%M")
+        self.streaming_message = self.record_message("assistant", "")
+        self.chat_display.insert(tk.END, f"[{timestamp}] AI Assistant:\n\n\n")
+        # The mark sits before the trailing blank line, so messages added while
+        # streaming still land after the answer instead of inside it.
+        self.chat_display.mark_set("stream_end", "end-3c")
+        self.chat_display.mark_gravity("stream_end", tk.RIGHT)
+        self.chat_display.see(tk.END)
+
+    def append_stream_text(self, text):
+        if self.streaming_message is not None:
+            self.streaming_message.text += text
+        self.chat_display.insert("stream_end", text)
+        self.chat_display.see("stream_end")
     
     def send_message(self, event=None):
         message = self.input_field.get().strip()
@@ -245,21 +270,39 @@ class HealthAssistantApp:
         self.status_var.set("Listening... Please speak now!")
         threading.Thread(target=self.listen_for_speech, daemon=True).start()
     
+    def setup_recognizer(self):
+        try:
+            create_recognizer = self.timeline.timed_import("asr").create_recognizer
+            self.recognizer = create_recognizer(config.ASR, config.SUPPORTED_LANGUAGES)
+        except Exception as e:
+            print(f"Speech recognition unavailable: {e}")
+
     def listen_for_speech(self):
+        tracing.start_trace()
         try:
-            with self.microphone as source:
-                self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=10)
-            language = "en-IN" if self.current_language == "English" else "mr-IN"
-            text = self.recognizer.recognize_google(audio, language=language)
-            self.root.after(0, lambda: self.handle_speech_result(text))
-        except (sr.WaitTimeoutError, sr.UnknownValueError):
-            self.root.after(0, lambda: self.handle_speech_result(""))
+            if self.recognizer is None:
+                raise Exception("no speech recognition backend is available (yet)")
+            speculation = None
+            if (config.ASR["speculative_prefill"] and hasattr(self.engine, "prefill")
+                    and self.engine.model_loaded):
+                speculation = SpeculativePrefill(self.engine, self.current_language, self.session)
+            def on_partial(text):
+                self.ui.post("status", f"Listening... {text}")
+                if speculation is not None:
+                    speculation.update(text)
+            try:
+                with tracing.span("listen", language=self.current_language) as span:
+                    text = self.recognizer.listen(self.current_language, on_partial)
+                    span.set(chars=len(text))
+            finally:
+                if speculation is not None:
+                    speculation.close()
+            self.ui.call(self.handle_speech_result, text)
         except Exception as e:
             print(f"Speech recognition error: {e}")
-            self.root.after(0, lambda: self.handle_speech_result(""))
+            self.ui.call(self.handle_speech_result, "")
         finally:
-            self.root.after(0, self.reset_speech_ui)
+            self.ui.call(self.reset_speech_ui)
     
     def handle_speech_result(self, text):
         if text:
@@ -268,48 +311,144 @@ class HealthAssistantApp:
         else:
             self.add_message("System", "Could not understand speech. Please try again.", "system")
     
-    def reset_speech_ui(self):
+    def reset_speech_ui(self, status="Ready"):
         self.is_listening = False
         self.speak_button.config(text="🎤 Speak", bg='#e74c3c')
-        self.status_var.set("Ready")
+        self.status_var.set(status)
     
     def process_message(self, message, was_speech):
-        if not self.model_loaded:
-            self.root.after(0, lambda: self.add_message("System", "AI model is still loading. Please wait...", "system"))
+        tracing.start_trace() # Spans of this question, in every stage, share one trace
+        language = self.current_language
+        # Emergencies need no model and are answered while it is still loading too
+        request = self.scheduler.answer_emergency(message, language, self.session)
+        if request is None and (self.engine is None or not self.engine.model_loaded):
+            self.ui.post("message", "System", "AI model is still loading. Please wait...", "system")
             return
         
+        status = "Ready"
+        utterance = None
         try:
-            self.status_var.set("AI is thinking...")
-            prompt = self.construct_prompt(message)
-            response = self.generate_response(prompt)
-            formatted_response = self.parse_response(response)
-            self.root.after(0, lambda: self.add_message("AI Assistant", formatted_response, "assistant"))
-            if was_speech:
-                self.root.after(0, lambda: self.generate_audio_response(formatted_response))
+            # A newer question supersedes whatever is still queued, streaming or being spoken
+            self.scheduler.cancel_all()
+            self.stop_speaking()
+            if request is None:
+                request = self.scheduler.submit(message, language, session=self.session)
+            if was_speech and self.speech is not None:
+                # Spoken questions get spoken answers, starting with the first finished sentence
+                utterance = self.speech.start(config.SUPPORTED_LANGUAGES[language]["code"])
+            self.ui.post("status", "AI is thinking...")
+            if self.streaming_enabled:
+                result = self.stream_response(request, utterance)
+            else:
+                result = request.result()
+                self.ui.post("message", "AI Assistant", result["response"], "assistant")
+                if utterance is not None:
+                    utterance.feed(result["response"])
+            if result is None:
+                return # Cancelled; the newer request owns the status bar now
+            status = self.format_stats(result)
+            if utterance is not None:
+                utterance.finish()
+        except QueueFullError:
+            self.ui.post("message", "System", "The assistant is busy. Please try again in a moment.", "system")
         except Exception as e:
+            if utterance is not None:
+                utterance.cancel()
             error_msg = f"Error processing message: {str(e)}"
-            self.root.after(0, lambda: self.add_message("System", error_msg, "system"))
+            self.ui.post("message", "System", error_msg, "system")
         finally:
-             self.root.after(0, self.reset_speech_ui)
+            self.ui.call(self.reset_speech_ui, status)
+
+    def stream_response(self, request, utterance=None):
+        """Stream the answer into the chat pane as it is generated.
+
+        Each delta is posted to the UI bus, which joins everything that arrives
+        within a frame into one insert. Text is also fed to `utterance`, when
+        given, to be spoken as it arrives. Returns the engine's final "done"
+        event, or None if the request was cancelled.
+        """
+        start = time.perf_counter()
+        streamed = []
+        for event in request.events():
+            if event["type"] != "delta":
+                break
+            if not streamed:
+                self.ui.post("stream_begin")
+                self.ui.post("status", f"Answering... (first token in {time.perf_counter() - start:.2f}s)")
+            streamed.append(event["text"])
+            self.ui.post("text", event["text"])
+            if utterance is not None:
+                utterance.feed(event["text"])
+        if event["type"] == "cancelled" and streamed:
+            self.ui.post("text", "\n[Stopped: a newer question was asked]")
+        if event["type"] == "cancelled":
+            if utterance is not None:
+                utterance.cancel()
+            return None
+        if event["type"] == "error":
+            raise Exception(event["error"])
+
+        response = event["response"]
+        if not streamed:
+            # Cached answer, or nothing generated: show the final text in one go
+            self.ui.post("message", "AI Assistant", response, "assistant")
+        elif response != "".join(streamed).strip():
+            # Empty output: show the fallback message in place of the streamed answer
+            self.ui.post("text", response)
+        if utterance is not None and response != "".join(streamed).strip():
+            utterance.feed(response)
+        return event
+
+    def format_stats(self, result):
+        stats = result["stats"]
+        if result.get("emergency"):
+            return f"Possible emergency ({result['emergency']}) · please call 108 or 112 now"
+        if result["cached"]:
+            return f"Ready · answered from cache in {stats['total_ms']:.0f} ms"
+        if "ttft_ms" in stats:
+            return (f"Ready · waited {stats['queue_wait_ms'] / 1000:.2f}s · first token {stats['ttft_ms'] / 1000:.2f}s · "
+                    f"{stats['tokens_per_sec']:.1f} tokens/s · {stats['tokens']} tokens")
+        return f"Ready · answered in {stats['total_ms'] / 1000:.1f}s"
 
-    def generate_audio_response(self, text_response):
+def main():
+    parser = argparse.ArgumentParser(description=config.APP_NAME)
+    parser.add_argument("--server", metavar="URL",
+                        help="use a running inference server (see server.py) instead of loading the model locally")
+    parser.add_argument("--startup-report", metavar="PATH",
+                        help="print the startup timeline and save it as JSON to PATH once startup has finished")
+    parser.add_argument("--exit-when-ready", action="store_true",
+                        help="quit as soon as startup has finished (for startup benchmarks)")
+    add_profile_arguments(parser)
+    tracing.add_tracing_arguments(parser)
+    args = parser.parse_args()
+    profiler = tracing.start_from_args(args)
+    timeline = StartupTimeline(LAUNCHED)
+    timeline.mark("main_imported")
+
+    profile = None
+    if not args.server:
         try:
-            lines = text_response.split('\n')
-            audio_text = " ".join(line.strip() for line in lines if line.strip() and not line.startswith('**') and not line.startswith('-'))
-            if not audio_text: return
-            
-            language = "en" if self.current_language == "English" else "mr"
-            tts = gTTS(text=audio_text, lang=language, slow=False)
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-                tts.save(tmp_file.name)
-                self.audio_queue.put(tmp_file.name)
-        except Exception as e:
-            print(f"Audio generation error: {e}")
+            profile = profile_from_args(args)
+        except ConfigError as e:
+            parser.exit(2, f"Configuration error: {e}\n")
+
+    def create_engine():
+        if args.server:
+            from engine_client import RemoteEngine
+            return RemoteEngine(args.server)
+        return timeline.timed_import("engine").HealthEngine(profile)
 
-def main():
     root = tk.Tk()
-    app = HealthAssistantApp(root)
+    app = HealthAssistantApp(root, create_engine, timeline)
+    timeline.mark("window_built")
+
+    def on_ready(timeline):
+        if args.startup_report:
+            print(timeline.format_report())
+            timeline.save(args.startup_report)
+        if args.exit_when_ready:
+            app.ui.call(root.destroy)
+    timeline.on_ready(on_ready)
     
     root.update_idletasks()
     x = (root.winfo_screenwidth() // 2) - (root.winfo_width() // 2)
@@ -318,7 +457,12 @@ def main():
     
     def on_closing():
         if messagebox.askokcancel("Quit", "Do you want to quit?"):
-            app.audio_queue.put(None)
+            if app.player is not None:
+                app.player.close()
+            app.transcript.close()
+            tracing.tracer.close()
+            if profiler is not None:
+                profiler.stop()
             root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
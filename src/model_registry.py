@@ -0,0 +1,134 @@
+"""
+Offline-first model registry.
+
+Resolves the GGUF file without touching the network whenever possible:
+
+1. an explicit path (config.MODEL["path"]),
+2. the configured model directory,
+3. a copy already in the Hugging Face cache (looked up with local_files_only),
+
+and only downloads from the Hub into the model directory as a last resort,
+if config.MODEL["allow_download"] permits it.
+
+The SHA-256 of the resolved file is computed once and cached by path, size
+and mtime, so later starts don't rehash gigabytes. When an expected checksum
+is configured, the file is verified against it.
+"""
+
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+class PhaseTimer:
+    """Records how long each named startup phase took, in milliseconds."""
+    def __init__(self):
+        self.phases = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (time.perf_counter() - start) * 1000
+
+    def record(self, name, start):
+        """Record a phase that began at perf_counter() value `start` and ends now."""
+        self.phases[name] = (time.perf_counter() - start) * 1000
+
+    def summary(self):
+        return " · ".join(f"{name} {ms / 1000:.2f}s" for name, ms in self.phases.items())
+
+class ModelRegistry:
+    def __init__(self, settings):
+        self.settings = settings
+        self.checksum_cache_path = settings["checksum_cache"]
+
+    def resolve(self, progress=print):
+        """Return the local path of the configured GGUF file."""
+        explicit = self.settings.get("path")
+        if explicit:
+            if not os.path.isfile(explicit):
+                raise FileNotFoundError(f"Configured model file not found: {explicit}")
+            return explicit
+
+        filename = self.settings["filename"]
+        local_path = os.path.join(self.settings["directory"], filename)
+        if os.path.isfile(local_path):
+            return local_path
+
+        cached = self.find_in_hub_cache()
+        if cached:
+            return cached
+
+        if not self.settings["allow_download"]:
+            raise FileNotFoundError(
+                f"{filename} not found in {self.settings['directory']} or the Hugging Face cache, "
+                f"and downloads are disabled. Copy the model file into {self.settings['directory']}."
+            )
+        progress(f"Downloading {filename} from {self.settings['repo']}...")
+        from huggingface_hub import hf_hub_download
+        os.makedirs(self.settings["directory"], exist_ok=True)
+        return hf_hub_download(repo_id=self.settings["repo"], filename=filename, local_dir=self.settings["directory"])
+
+    def find_in_hub_cache(self):
+        """Look the model up in the Hugging Face cache without any network access."""
+        try:
+            from huggingface_hub import hf_hub_download
+        except ImportError:
+            return None
+        try:
+            return hf_hub_download(repo_id=self.settings["repo"], filename=self.settings["filename"],
+                                   local_files_only=True)
+        except Exception:
+            return None
+
+    def checksum(self, path, progress=print):
+        """SHA-256 of `path`, reusing the cached value while size and mtime are unchanged."""
+        real_path = os.path.realpath(path)
+        stat = os.stat(real_path)
+        cache = self.load_checksums()
+        entry = cache.get(real_path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+
+        progress(f"Computing checksum of {os.path.basename(path)} (first start only)...")
+        digest = hashlib.sha256()
+        with open(real_path, 'rb') as f:
+            for block in iter(lambda: f.read(8 << 20), b''):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+        cache[real_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+        self.save_checksums(cache)
+        return sha256
+
+    def verify(self, path, progress=print):
+        """Return the file's checksum, raising if it doesn't match the configured one."""
+        sha256 = self.checksum(path, progress)
+        expected = self.settings.get("sha256")
+        if expected and sha256.lower() != expected.lower():
+            raise Exception(f"Checksum mismatch for {path}: expected {expected}, got {sha256}. "
+                            f"The file may be corrupt or a different model.")
+        return sha256
+
+    def load_checksums(self):
+        try:
+            with open(self.checksum_cache_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_checksums(self, cache):
+        directory = os.path.dirname(self.checksum_cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.checksum_cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, indent=2)
+            os.replace(tmp_path, self.checksum_cache_path)
+        except OSError as e:
+            print(f"Could not write checksum cache: {e}")
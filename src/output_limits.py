@@ -0,0 +1,143 @@
+"""
+Per-query generation limits.
+
+Every answer follows the same seven-section template, so its length is
+predictable, but the profile's max_tokens is sized for the longest answer
+in the worst language. Two things keep decoding from running past the
+useful end of an answer:
+
+- OutputLengthModel remembers how many tokens recent answers took per
+  language (Devanagari text tokenizes to far more tokens than English) and
+  predicts a max_tokens for the next one: a high percentile of that history
+  plus headroom. An answer that hits its limit is recorded at the limit, so
+  the prediction grows again if answers get longer.
+- SectionStop watches the streamed text and ends generation once the final
+  "When to Consult a Doctor" section is complete, instead of letting the
+  model add notes, repeated disclaimers or new sections after it.
+"""
+
+import json
+import os
+import re
+import threading
+from collections import deque
+
+import config
+
+# The start of a line that begins a new section: "8. ", "८. ", "**Note:**", "# ..."
+HEADING_START = re.compile(r'\s*(?:[0-9०-९]+\.\s|\*\*|#)')
+LIST_ITEM_START = re.compile(r'\s*(?:[-•]\s|\*\s)')
+
+def final_heading(language):
+    """Title of the last section of the answer template, e.g. "When to Consult a Doctor"."""
+    return config.RESPONSE_TEMPLATES[language]["structure"][-1].strip("*: ")
+
+class SectionStop:
+    """Decides from streamed text when the final section of an answer is complete.
+
+    feed() returns the part of each delta that belongs to the answer; the
+    start of a line in the final section is held back until it shows whether
+    the line continues the section or starts something after it. Once `done`
+    is set, generation should stop. flush() returns any text still held back.
+    """
+
+    def __init__(self, language, max_section_tokens=200):
+        self.heading = final_heading(language).casefold()
+        self.max_section_tokens = max_section_tokens
+        self.text = ""
+        self.emitted = 0 # Length of self.text passed on so far
+        self.section_start = None # Offset just after the final heading
+        self.section_tokens = 0
+        self.judged_line = None # Start of the last line of the section already let through
+        self.done = False
+
+    def feed(self, delta):
+        if self.done:
+            return ""
+        self.text += delta
+        if self.section_start is None:
+            found = self.text.casefold().find(self.heading, max(0, self.emitted - len(self.heading)))
+            if found < 0:
+                return self.emit(len(self.text))
+            self.section_start = found + len(self.heading)
+        else:
+            self.section_tokens += 1
+            if self.section_tokens >= self.max_section_tokens:
+                self.done = True
+                return self.emit(len(self.text))
+        return self.emit(self.section_end())
+
+    def section_end(self):
+        """How far the text can be emitted; sets self.done if the section has ended."""
+        line_start = self.text.rfind("\n", self.section_start) + 1
+        if line_start == 0 or line_start == self.judged_line:
+            return len(self.text) # Still on the heading line, or this line was already judged
+        line = self.text[line_start:]
+        if len(line.strip()) < 3:
+            return line_start # Too little of the line to judge yet
+        self.judged_line = line_start
+        before = self.text[self.section_start:line_start]
+        has_content = bool(before.strip(" \t\n:*"))
+        after_blank_line = re.search(r'\n[ \t]*\n$', before) is not None
+        if has_content and (HEADING_START.match(line) or
+                            (after_blank_line and not LIST_ITEM_START.match(line))):
+            self.done = True
+            return line_start
+        return len(self.text)
+
+    def emit(self, end):
+        chunk = self.text[self.emitted:end]
+        self.emitted = max(self.emitted, end)
+        return chunk
+
+    def flush(self):
+        return "" if self.done else self.emit(len(self.text))
+
+class OutputLengthModel:
+    """Recent answer lengths in tokens per language, and max_tokens predicted from them."""
+
+    def __init__(self, path, history=50, min_samples=5, percentile=95, headroom=1.25, min_tokens=256):
+        self.path = path
+        self.history = history
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_tokens = min_tokens
+        self.lock = threading.Lock()
+        self.lengths = {language: deque(lengths, maxlen=history) for language, lengths in self.load().items()}
+
+    def load(self):
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def predict(self, language, limit):
+        """max_tokens for the next answer in `language`, at most `limit`."""
+        with self.lock:
+            lengths = sorted(self.lengths.get(language, ()))
+        if len(lengths) < self.min_samples:
+            return limit # Not enough history yet
+        typical = lengths[min(len(lengths) - 1, int(self.percentile / 100 * len(lengths)))]
+        return max(min(self.min_tokens, limit), min(limit, int(typical * self.headroom)))
+
+    def record(self, language, tokens):
+        with self.lock:
+            self.lengths.setdefault(language, deque(maxlen=self.history)).append(tokens)
+            snapshot = {language: list(lengths) for language, lengths in self.lengths.items()}
+        self.save(snapshot)
+
+    def save(self, snapshot):
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temporary = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            print(f"Output length history save error: {e}")
@@ -0,0 +1,130 @@
+"""
+Prompt-prefix cache for the fixed system prompts.
+
+Every request starts with the same large English or Marathi system message.
+Instead of letting llama.cpp re-evaluate it each time, the model state right
+after the system prompt is saved once per language and loaded back before a
+query. llama.cpp then only evaluates the tokens that differ from the restored
+state, i.e. the user's turn.
+
+States are pickled to disk, keyed by a fingerprint of the model file and the
+prompt text, so they survive process restarts and are discarded automatically
+when either the model or the prompt changes.
+"""
+
+import hashlib
+import os
+import pickle
+
+
+def model_fingerprint(model_path, sample_size=1 << 20):
+    """Hash a model file by its size plus its first and last `sample_size` bytes.
+
+    Hashing a full 2 GB GGUF on every start would cost seconds; the sampled
+    hash still changes whenever a different model file is dropped in.
+    """
+    size = os.path.getsize(model_path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(model_path, 'rb') as f:
+        digest.update(f.read(sample_size))
+        if size > sample_size:
+            f.seek(max(size - sample_size, sample_size))
+            digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+
+class PromptPrefixCache:
+    def __init__(self, model, model_path, cache_dir, fingerprint=None):
+        """`fingerprint` identifies the model file, e.g. its verified SHA-256; sampled from the file if omitted."""
+        self.model = model
+        self.cache_dir = cache_dir
+        self.fingerprint = fingerprint or model_fingerprint(model_path)
+        self.states = {}
+        self.active_key = None # Key of the prefix currently held in the model's KV cache
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, system_message):
+        return hashlib.sha256(f"{self.fingerprint}\0{system_message}".encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.state")
+
+    def warm(self, system_message):
+        """Make the state for `system_message` available, evaluating it only if no saved copy exists."""
+        key = self.key(system_message)
+        if key in self.states:
+            return self.states[key]
+
+        state = self.load(key)
+        if state is None:
+            state = self.evaluate(system_message)
+            self.save(key, state)
+        self.states[key] = state
+        return state
+
+    def restore(self, system_message):
+        """Load the saved prefix state into the model unless it is already resident.
+
+        Returns True if a state was loaded.
+        """
+        key = self.key(system_message)
+        if key == self.active_key:
+            # The previous request used the same system prompt, so llama.cpp
+            # will reuse the prefix already in its KV cache.
+            return False
+        state = self.warm(system_message)
+        self.model.load_state(state)
+        self.active_key = key
+        return True
+
+    def invalidate(self):
+        """Forget which prefix is resident, e.g. after the model was used for another prompt."""
+        self.active_key = None
+
+    def evaluate(self, system_message):
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": ""}
+        ]
+        self.model.reset()
+        # A one-token completion evaluates the chat-formatted prefix. The extra
+        # tokens after the system block are dropped by llama.cpp's prefix
+        # matching as soon as a real user turn diverges from them.
+        self.model.create_chat_completion(messages=messages, temperature=0.0, max_tokens=1)
+        self.active_key = self.key(system_message)
+        state = self.model.save_state()
+        # save_state copies scores[:n_tokens]: one n_vocab-wide logits row per
+        # evaluated token (tens of MB). Without logits_all, llama.cpp only fills
+        # the row of the last evaluated token, the next-token logits, and that
+        # row (scores[n_tokens - 1]) is the only one sampling reads. The slice
+        # keeps just that row as a (1, n_vocab) array; load_state assigns it to
+        # scores[:n_tokens], which broadcasts it into every row, so the row
+        # that matters comes back exact.
+        state.scores = state.scores[-1:].copy()
+        return state
+
+    def load(self, key):
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            # Truncated file or state written by an incompatible llama-cpp-python
+            print(f"Discarding prompt cache entry {path}: {e}")
+            os.remove(path)
+            return None
+
+    def save(self, key, state):
+        path = self.path(key)
+        # Per-process temp name: pool workers may warm the same entry at once
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write prompt cache entry {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,253 @@
+"""
+Response cache for repeated health questions.
+
+Answers are keyed by language plus a normalized form of the query, so
+"Symptoms of Dengue?" and "symptoms of dengue" share an entry. An optional
+near-duplicate tier (off by default) compares character trigram profiles of
+the normalized queries and reuses an answer when the cosine similarity clears
+a threshold. Trigrams barely notice the word that changes the question
+("type 1 diabetes" / "type 2 diabetes" score 0.96), so a near duplicate must
+also have the same digits, single letters and negations, and every other word
+it does not share must be a filler word or a one-letter typo of one it does.
+
+Entries are evicted least-recently-used beyond `max_entries` and expire after
+`ttl_seconds`. Everything is written through to a SQLite file so the cache
+survives restarts.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+
+def normalize_query(text):
+    """Fold case, punctuation and whitespace; keeps Devanagari vowel signs intact."""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    # Punctuation and symbols become spaces; marks (category M) are part of
+    # Devanagari syllables and must be kept.
+    chars = [' ' if unicodedata.category(ch)[0] in 'PSZ' else ch for ch in text]
+    return ' '.join(''.join(chars).split())
+
+
+# Words that turn a question into its opposite
+NEGATIONS = {"no", "not", "never", "without", "non", "cannot", "cant", "dont", "doesnt", "isnt", "arent",
+             "नाही", "नको", "न", "विना"}
+
+# Words a rephrasing may add or drop without changing the question
+FILLER_WORDS = {"what", "whats", "is", "are", "the", "of", "about", "for", "please", "tell", "me", "explain",
+                "काय", "आहे", "आहेत", "कृपया", "सांगा", "बद्दल", "विषयी"}
+
+
+def trigram_profile(normalized):
+    """Character trigram counts of a normalized query, padded at word edges."""
+    profile = defaultdict(int)
+    for word in normalized.split():
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            profile[padded[i:i + 3]] += 1
+    return dict(profile)
+
+
+def cosine_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(count * b.get(gram, 0) for gram, count in a.items())
+    norm = math.sqrt(sum(c * c for c in a.values())) * math.sqrt(sum(c * c for c in b.values()))
+    return dot / norm
+
+
+def distinguishing_words(words):
+    """Digits, single letters and negations: words that make two similar questions different ones."""
+    return {word for word in words
+            if len(word) == 1 or word in NEGATIONS or any(ch.isdigit() for ch in word)}
+
+
+def one_edit_apart(a, b):
+    """Whether `a` and `b` differ by at most one inserted, deleted or replaced character."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+
+def same_question(a, b):
+    """Whether normalized queries `a` and `b` may share an answer, beyond their trigram similarity."""
+    words_a, words_b = set(a.split()), set(b.split())
+    if distinguishing_words(words_a) != distinguishing_words(words_b):
+        return False
+    only_a, only_b = words_a - words_b - FILLER_WORDS, words_b - words_a - FILLER_WORDS
+    # Short words are too easily one edit from another word ("men" / "mean")
+    return (all(len(word) >= 4 and any(one_edit_apart(word, other) for other in only_b) for word in only_a)
+            and all(len(word) >= 4 and any(one_edit_apart(word, other) for other in only_a) for word in only_b))
+
+
+class ResponseCache:
+    def __init__(self, path, max_entries=2000, ttl_seconds=7 * 24 * 3600,
+                 near_duplicate=False, similarity_threshold=0.85):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.near_duplicate = near_duplicate
+        self.similarity_threshold = similarity_threshold
+
+        self.entries = OrderedDict() # (language, normalized) -> [response, created], oldest use first
+        self.profiles = {} # (language, normalized) -> trigram profile
+        self.index = defaultdict(set) # (language, trigram) -> keys containing it
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "language TEXT, query TEXT, response TEXT, created REAL, last_used REAL, "
+            "PRIMARY KEY (language, query))"
+        )
+        self.db.commit()
+        self.load()
+
+    def load(self):
+        self.purge_expired_rows()
+        rows = self.db.execute(
+            "SELECT language, query, response, created FROM responses ORDER BY last_used"
+        ).fetchall()
+        for language, query, response, created in rows:
+            self.insert((language, query), response, created)
+        while len(self.entries) > self.max_entries:
+            self.evict_oldest()
+        self.db.commit()
+
+    def get(self, language, query):
+        """Return a cached response for `query`, or None on a miss."""
+        normalized = normalize_query(query)
+        if not normalized:
+            return None
+        key = (language, normalized)
+        with self.lock:
+            response = self.lookup(key)
+            if response is not None:
+                self.hits += 1
+                return response
+            if self.near_duplicate:
+                match = self.find_similar(language, normalized)
+                if match is not None:
+                    response = self.lookup(match)
+                    if response is not None:
+                        self.near_hits += 1
+                        return response
+            self.misses += 1
+            return None
+
+    def put(self, language, query, response):
+        normalized = normalize_query(query)
+        if not normalized or not response.strip():
+            return
+        key = (language, normalized)
+        now = time.time()
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.insert(key, response, now)
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (language, normalized, response, now, now)
+            )
+            while len(self.entries) > self.max_entries:
+                self.evict_oldest()
+            self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.profiles.clear()
+            self.index.clear()
+            self.db.execute("DELETE FROM responses")
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    # --- Internal helpers; callers hold self.lock ---
+
+    def lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        response, created = entry
+        if self.ttl_seconds and time.time() - created > self.ttl_seconds:
+            self.remove(key)
+            self.db.execute("DELETE FROM responses WHERE language = ? AND query = ?", key)
+            self.db.commit()
+            return None
+        self.entries.move_to_end(key)
+        self.db.execute(
+            "UPDATE responses SET last_used = ? WHERE language = ? AND query = ?",
+            (time.time(),) + key
+        )
+        self.db.commit()
+        return response
+
+    def find_similar(self, language, normalized):
+        profile = trigram_profile(normalized)
+        candidates = set()
+        for gram in profile:
+            candidates.update(self.index.get((language, gram), ()))
+        best_key, best_score = None, self.similarity_threshold
+        for key in candidates:
+            score = cosine_similarity(profile, self.profiles[key])
+            if score >= best_score and same_question(normalized, key[1]):
+                best_key, best_score = key, score
+        return best_key
+
+    def insert(self, key, response, created):
+        self.entries[key] = [response, created]
+        profile = trigram_profile(key[1])
+        self.profiles[key] = profile
+        for gram in profile:
+            self.index[(key[0], gram)].add(key)
+
+    def remove(self, key):
+        self.entries.pop(key, None)
+        for gram in self.profiles.pop(key, {}):
+            keys = self.index.get((key[0], gram))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.index[(key[0], gram)]
+
+    def evict_oldest(self):
+        key = next(iter(self.entries))
+        self.remove(key)
+        self.db.execute("DELETE FROM responses WHERE language = ? AND query = ?", key)
+
+    def purge_expired_rows(self):
+        if self.ttl_seconds:
+            self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
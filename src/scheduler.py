@@ -0,0 +1,259 @@
+"""
+Inference scheduler: a bounded priority queue in front of the engine.
+
+All generation goes through one InferenceScheduler instead of ad-hoc threads,
+so a llama.cpp context is only ever driven by its own worker thread. When the
+queue is full, submit() raises QueueFullError instead of piling up work
+(backpressure). Every request can be cancelled, whether it is still queued or
+already streaming tokens.
+
+Questions that mention an emergency are answered on the spot with the fixed
+emergency response (see emergency.py) and never wait for the model.
+"""
+
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+
+import config
+import tracing
+from emergency import create_detector
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+TERMINAL_EVENTS = ("done", "error", "cancelled")
+
+class QueueFullError(Exception):
+    pass
+
+class InferenceRequest:
+    def __init__(self, query, language, priority, session=None):
+        self.query = query
+        self.language = language
+        self.session = session # Conversation the question belongs to, if any
+        self.trace_id = tracing.current_trace() or tracing.new_trace_id()
+        self.priority = priority
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self.cancelled = threading.Event()
+        self.event_queue = queue.Queue()
+
+    def cancel(self):
+        """Stop the request: it is dropped if still queued, or stopped at the next token.
+
+        Consumers of events() see the "cancelled" event right away rather than
+        when the worker gets to it, even if text is still queued before it.
+        """
+        if not self.cancelled.is_set():
+            self.cancelled.set()
+            self.event_queue.put({"type": "cancelled"})
+
+    def events(self, timeout=None):
+        """Yield engine events until the request is done, fails or is cancelled."""
+        while True:
+            event = self.event_queue.get(timeout=timeout)
+            if self.cancelled.is_set() and event["type"] != "cancelled":
+                # Deltas queued before cancel() are not shown
+                event = {"type": "cancelled"}
+            yield event
+            if event["type"] in TERMINAL_EVENTS:
+                return
+
+    def result(self, timeout=None):
+        """Block until the request finishes and return its final event."""
+        for event in self.events(timeout):
+            pass
+        if event["type"] == "error":
+            raise Exception(event["error"])
+        return event
+
+    def wait_ms(self):
+        if self.started_at is None:
+            return None
+        return (self.started_at - self.submitted_at) * 1000
+
+class InferenceScheduler:
+    def __init__(self, engines, max_queue=16, history=200):
+        """Start one worker thread per engine; all workers share one queue.
+
+        `engines` may be empty until an engine has been created (see add_workers()).
+        """
+        self.engines = []
+        self.max_queue = max_queue
+        self.emergency = create_detector()
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count() # FIFO order within a priority level
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.running = set()
+        self.counters = {"submitted": 0, "completed": 0, "cancelled": 0, "rejected": 0, "failed": 0,
+                         "cache_hits": 0, "emergencies": 0}
+        self.wait_times = deque(maxlen=history)
+        self.run_times = deque(maxlen=history)
+
+        self.add_workers(engines if isinstance(engines, (list, tuple)) else [engines])
+
+    def add_workers(self, engines):
+        """Start a worker thread for each of `engines`, e.g. for the decode slots of an engine that has just loaded."""
+        for engine in engines:
+            self.engines.append(engine)
+            threading.Thread(target=self.worker, args=(engine,), daemon=True).start()
+
+    def submit(self, query, language, priority=PRIORITY_NORMAL, session=None, emergency=True):
+        """Queue `query` for an answer; with `emergency`, a question mentioning one gets the fixed response.
+
+        Batch pre-generation passes emergency=False: "stroke" there is a topic to answer, not a call for help.
+        """
+        if emergency:
+            request = self.answer_emergency(query, language, session)
+            if request is not None:
+                return request
+        request = InferenceRequest(query, language, priority, session)
+
+        # Cached answers take milliseconds; don't make them wait behind generation
+        with tracing.trace(request.trace_id):
+            cached = self.engines[0].cached_response(query, language, session)
+        if cached is not None:
+            self.engines[0].record_turn(session, language, query, cached)
+            request.started_at = request.finished_at = time.perf_counter()
+            request.event_queue.put(self.engines[0].done_event(cached, True, request.submitted_at))
+            with self.lock:
+                self.counters["submitted"] += 1
+                self.counters["cache_hits"] += 1
+            return request
+
+        with self.lock:
+            if self.pending >= self.max_queue:
+                self.counters["rejected"] += 1
+                raise QueueFullError(f"Inference queue is full ({self.max_queue} requests waiting)")
+            self.pending += 1
+            self.counters["submitted"] += 1
+        self.queue.put((priority, next(self.sequence), request))
+        return request
+
+    def answer_emergency(self, query, language, session=None):
+        """A finished request with the emergency response if `query` mentions an emergency, else None.
+
+        Needs no model: callers may use it before the engine has loaded.
+        """
+        keyword = self.emergency.check(query) if self.emergency is not None else None
+        if keyword is None:
+            return None
+        request = InferenceRequest(query, language, PRIORITY_HIGH, session)
+        if config.EMERGENCY["preempt"] and session is not None:
+            self.cancel_session(session) # Nothing else this user asked matters now
+        event = self.emergency.event(keyword, language, request.submitted_at)
+        tracing.record("emergency", event["stats"]["total_ms"], request.trace_id, keyword=keyword)
+        if self.engines:
+            self.engines[0].record_turn(session, language, query, event["response"])
+        request.started_at = request.finished_at = time.perf_counter()
+        request.event_queue.put(event)
+        with self.lock:
+            self.counters["submitted"] += 1
+            self.counters["emergencies"] += 1
+        return request
+
+    def cancel_all(self):
+        """Cancel everything queued or running, e.g. when a newer question supersedes them."""
+        for request in self.outstanding():
+            request.cancel()
+
+    def cancel_session(self, session):
+        """Cancel the requests of one conversation that are queued or running."""
+        for request in self.outstanding():
+            if request.session == session:
+                request.cancel()
+
+    def outstanding(self):
+        with self.queue.mutex:
+            waiting = [item[2] for item in self.queue.queue if item[2] is not None]
+        with self.lock:
+            running = list(self.running)
+        return waiting + running
+
+    def worker(self, engine):
+        while True:
+            _, _, request = self.queue.get()
+            with self.lock:
+                self.pending -= 1
+            if request is None:
+                break
+            request.started_at = time.perf_counter()
+            self.wait_times.append(request.wait_ms())
+            tracing.record("queue_wait", request.wait_ms(), request.trace_id, priority=request.priority)
+            if request.cancelled.is_set():
+                self.finish(request, {"type": "cancelled"}, "cancelled")
+                continue
+            with self.lock:
+                self.running.add(request)
+            try:
+                with tracing.trace(request.trace_id):
+                    self.run(engine, request)
+            finally:
+                with self.lock:
+                    self.running.discard(request)
+
+    def run(self, engine, request):
+        # submit() already consulted the response cache
+        stream = engine.stream_answer(request.query, request.language, check_cache=False,
+                                     session=request.session)
+        try:
+            for event in stream:
+                if request.cancelled.is_set():
+                    self.finish(request, {"type": "cancelled"}, "cancelled")
+                    return
+                if event["type"] == "done":
+                    event["stats"]["queue_wait_ms"] = request.wait_ms()
+                    event["trace"] = request.trace_id
+                    self.finish(request, event, "completed")
+                    return
+                request.event_queue.put(event)
+            self.finish(request, {"type": "error", "error": "Generation ended without a result"}, "failed")
+        except Exception as e:
+            self.finish(request, {"type": "error", "error": str(e)}, "failed")
+        finally:
+            # Stops llama.cpp generation and releases the engine immediately on cancel
+            stream.close()
+
+    def finish(self, request, event, outcome):
+        request.finished_at = time.perf_counter()
+        with self.lock:
+            self.counters[outcome] += 1
+            self.run_times.append((request.finished_at - request.started_at) * 1000)
+        request.event_queue.put(event)
+
+    def shutdown(self):
+        for _ in self.engines:
+            self.queue.put((PRIORITY_LOW + 1, next(self.sequence), None))
+            with self.lock:
+                self.pending += 1
+
+    def metrics(self):
+        with self.lock:
+            waits = sorted(self.wait_times)
+            runs = sorted(self.run_times)
+            metrics = dict(self.counters)
+            metrics["queue_depth"] = self.pending
+            metrics["max_queue"] = self.max_queue
+        metrics["wait_ms"] = summarize(waits)
+        metrics["run_ms"] = summarize(runs)
+        return metrics
+
+def summarize(sorted_values):
+    if not sorted_values:
+        return {"count": 0}
+    def percentile(p):
+        return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+    return {
+        "count": len(sorted_values),
+        "mean": sum(sorted_values) / len(sorted_values),
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": sorted_values[-1]
+    }
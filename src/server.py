@@ -0,0 +1,292 @@
+"""
+Headless HTTP inference server for the AI Health & Wellness Assistant.
+
+Loads one HealthEngine and serves it to any number of clients:
+
+    GET  /health             -> {"status": "ok", "model_loaded": ..., ...}
+    GET  /metrics            -> per-stage latency and scheduler metrics (Prometheus text)
+    POST /v1/answer          -> {"response": ..., "cached": ..., "stats": {...}}
+    POST /v1/answer/stream   -> text/event-stream of engine events
+
+POST bodies are JSON: {"query": "...", "language": "English" | "Marathi"},
+plus an optional "session" string: questions with the same session are
+answered as one conversation, with the earlier turns as context.
+Each streamed event is sent as one SSE `data:` line holding the JSON event
+produced by HealthEngine.stream_answer. With STRUCTURED_OUTPUT enabled,
+delta events name the answer section they belong to and the final event
+carries the parsed "record". A question that mentions an emergency is
+answered at once with the fixed emergency response; its final event names
+the matched keyword as "emergency". The server listens while the model is
+loading: emergencies are answered then too, other questions get 503.
+
+Requests are queued on an InferenceScheduler; when its queue is full the
+server answers 503 with Retry-After, and a client that disconnects mid-stream
+has its request cancelled.
+
+Run with:  python src/server.py --host 127.0.0.1 --port 8000
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+
+import config
+import tracing
+from engine import HealthEngine, SYSTEM_PROMPTS
+from scheduler import InferenceScheduler, QueueFullError
+from settings import ConfigError, add_profile_arguments, profile_from_args
+
+MAX_BODY_BYTES = 64 * 1024
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable"
+}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class InferenceServer:
+    def __init__(self, engine, scheduler, host="127.0.0.1", port=8000):
+        self.engine = engine
+        self.scheduler = scheduler
+        self.host = host
+        self.port = port
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        print(f"Serving on http://{self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            method, path, body = await self.read_request(reader)
+            if path == "/health":
+                self.require_method(method, "GET")
+                status = dict(status="ok", **self.engine.status())
+                status["scheduler"] = self.scheduler.metrics()
+                self.send_json(writer, 200, status)
+            elif path == "/metrics":
+                self.require_method(method, "GET")
+                self.send_text(writer, 200, tracing.tracer.prometheus() + self.scheduler_metrics())
+            elif path == "/v1/answer":
+                self.require_method(method, "POST")
+                request = self.submit(body)
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(None, request.result)
+                self.send_json(writer, 200, result)
+            elif path == "/v1/answer/stream":
+                self.require_method(method, "POST")
+                request = self.submit(body)
+                await self.stream(writer, request)
+            else:
+                raise HTTPError(404, f"Unknown path {path}")
+        except HTTPError as e:
+            self.send_json(writer, e.status, {"error": e.message})
+        except QueueFullError as e:
+            self.send_json(writer, 503, {"error": str(e)}, {"Retry-After": "5"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            self.send_json(writer, 500, {"error": str(e)})
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def read_request(self, reader):
+        request_line = await reader.readline()
+        try:
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0) or 0)
+        except ValueError:
+            raise HTTPError(400, "Content-Length must be a number")
+        if length < 0:
+            raise HTTPError(400, "Content-Length must not be negative")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target.split('?', 1)[0], body
+
+    def require_method(self, method, expected):
+        if method != expected:
+            raise HTTPError(405, f"Use {expected}")
+
+    def submit(self, body):
+        query, language, session = self.parse_query(body)
+        # An emergency needs no model, so it is answered while the model is still loading too
+        request = self.scheduler.answer_emergency(query, language, session)
+        if request is not None:
+            return request
+        if not self.engine.model_loaded:
+            raise HTTPError(503, "AI model is still loading")
+        return self.scheduler.submit(query, language, session=session)
+
+    def parse_query(self, body):
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except (UnicodeDecodeError, ValueError):
+            raise HTTPError(400, "Body must be JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "Body must be a JSON object")
+        query = payload.get("query", "")
+        language = payload.get("language", "English")
+        session = payload.get("session")
+        if not isinstance(query, str):
+            raise HTTPError(400, "Query must be a string")
+        query = query.strip()
+        if not query:
+            raise HTTPError(400, "Missing query")
+        if not isinstance(language, str):
+            raise HTTPError(400, "Language must be a string")
+        if language not in SYSTEM_PROMPTS:
+            raise HTTPError(400, f"Unsupported language {language!r}")
+        if session is not None and not isinstance(session, str):
+            raise HTTPError(400, "Session must be a string")
+        return query, language, session
+
+    async def stream(self, writer, request):
+        """Relay a scheduled request's events to the client as server-sent events."""
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+
+        def relay():
+            try:
+                for event in request.events():
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, None)
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        relay_done = loop.run_in_executor(None, relay)
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                writer.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+                await writer.drain()
+        except ConnectionError:
+            # Client went away: stop generating tokens nobody will read
+            request.cancel()
+            raise
+        finally:
+            await relay_done
+
+    def scheduler_metrics(self, prefix="health_assistant_scheduler"):
+        metrics = self.scheduler.metrics()
+        lines = []
+        for name in ("submitted", "completed", "cancelled", "rejected", "failed", "cache_hits", "emergencies"):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {metrics[name]}")
+        for name in ("queue_depth", "max_queue"):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {metrics[name]}")
+        return "\n".join(lines) + "\n"
+
+    def send_json(self, writer, status, payload, extra_headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_body(writer, status, body, "application/json; charset=utf-8", extra_headers)
+
+    def send_text(self, writer, status, text):
+        self.send_body(writer, status, text.encode('utf-8'), "text/plain; version=0.0.4; charset=utf-8")
+
+    def send_body(self, writer, status, body, content_type, extra_headers=None):
+        headers = "".join(f"{name}: {value}\r\n" for name, value in (extra_headers or {}).items())
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"{headers}"
+            f"Connection: close\r\n\r\n".encode('latin-1') + body
+        )
+
+def create_engine(workers, threads, profile, use_response_cache=True):
+    """An in-process engine, or a ModelPool of worker processes when `workers` is set."""
+    if workers == "auto":
+        from worker_pool import load_tuning
+        tuning = load_tuning()
+        if tuning is None:
+            print("No worker pool tuning for this host; run `python src/worker_pool.py --autotune`. Using one model.")
+            return HealthEngine(profile, use_response_cache)
+        workers, threads = tuning["workers"], threads or tuning["threads"]
+    workers = int(workers)
+    if workers <= 0:
+        return HealthEngine(profile, use_response_cache)
+    from worker_pool import ModelPool
+    return ModelPool(workers, threads, profile, use_response_cache)
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless inference server for the AI Health & Wellness Assistant")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", default=config.WORKER_POOL["workers"],
+                        help='model worker processes: 0 for one in-process model, or "auto" for the tuned layout')
+    parser.add_argument("--threads", type=int, default=config.WORKER_POOL["threads_per_worker"],
+                        help="llama.cpp threads per worker (default: the worker's CPU share)")
+    add_profile_arguments(parser)
+    tracing.add_tracing_arguments(parser)
+    args = parser.parse_args()
+    try:
+        profile = profile_from_args(args)
+    except ConfigError as e:
+        parser.exit(2, f"Configuration error: {e}\n")
+    print(f"Using inference profile '{profile.name}'")
+    profiler = tracing.start_from_args(args)
+
+    engine = create_engine(args.workers, args.threads, profile)
+    scheduler = InferenceScheduler(engine, max_queue=config.SCHEDULER["max_queue"])
+
+    def load_model():
+        try:
+            engine.load_model()
+        except Exception as e:
+            print(f"Model loading error: {e}")
+            return
+        # One scheduler worker per decode slot or worker process, so each can run a request
+        scheduler.add_workers([engine] * (engine.parallelism() - 1))
+
+    # Serve /health, and emergencies, while the model loads
+    threading.Thread(target=load_model, daemon=True).start()
+    server = InferenceServer(engine, scheduler, args.host, args.port)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        tracing.tracer.close()
+        if profiler is not None:
+            profiler.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Typed inference settings and named performance profiles.
+
+config.PROFILES holds plain dicts so they stay easy to edit; this module turns
+the selected one into an InferenceProfile, applies overrides and validates the
+result once at startup. Precedence, lowest to highest:
+
+    config.PROFILES[name]  <  HEALTH_ASSISTANT_<FIELD> env vars  <  command line
+
+The profile itself is chosen by --profile, then HEALTH_ASSISTANT_PROFILE, then
+config.DEFAULT_PROFILE.
+"""
+
+import dataclasses
+import os
+from dataclasses import dataclass, fields
+from typing import Optional
+
+import config
+
+ENV_PREFIX = "HEALTH_ASSISTANT_"
+
+class ConfigError(ValueError):
+    pass
+
+@dataclass(frozen=True)
+class InferenceProfile:
+    name: str
+    n_ctx: int = 4096
+    n_batch: int = 512
+    n_threads: Optional[int] = None        # None lets llama.cpp pick
+    n_threads_batch: Optional[int] = None
+    n_gpu_layers: int = 0                   # -1 offloads every layer
+    max_tokens: int = config.MAX_OUTPUT_LENGTH
+    temperature: float = config.GENERATION_TEMPERATURE
+    response_cache_entries: int = 2000      # 0 disables the response cache
+    prompt_cache: bool = True
+    batching: bool = False                  # continuous batching (batching.py)
+    n_parallel: int = 4                     # sequences decoded together when batching
+
+    def llama_options(self):
+        """Keyword arguments for llama_cpp.Llama()."""
+        options = dict(n_ctx=self.n_ctx, n_batch=self.n_batch, n_gpu_layers=self.n_gpu_layers)
+        if self.n_threads is not None:
+            options["n_threads"] = self.n_threads
+        if self.n_threads_batch is not None:
+            options["n_threads_batch"] = self.n_threads_batch
+        return options
+
+    def replace(self, **changes):
+        return dataclasses.replace(self, **changes)
+
+    def validate(self):
+        """Raise ConfigError listing every invalid setting."""
+        errors = []
+        if not 512 <= self.n_ctx <= 131072:
+            errors.append(f"n_ctx must be between 512 and 131072, got {self.n_ctx}")
+        if not 1 <= self.n_batch <= self.n_ctx:
+            errors.append(f"n_batch must be between 1 and n_ctx ({self.n_ctx}), got {self.n_batch}")
+        for name in ("n_threads", "n_threads_batch"):
+            value = getattr(self, name)
+            if value is not None and value < 1:
+                errors.append(f"{name} must be at least 1, got {value}")
+        if self.n_gpu_layers < -1:
+            errors.append(f"n_gpu_layers must be -1 (all) or more, got {self.n_gpu_layers}")
+        if not 1 <= self.max_tokens < self.n_ctx:
+            errors.append(f"max_tokens must be between 1 and n_ctx - 1 ({self.n_ctx - 1}), got {self.max_tokens}")
+        if not 0.0 <= self.temperature <= 2.0:
+            errors.append(f"temperature must be between 0 and 2, got {self.temperature}")
+        if self.response_cache_entries < 0:
+            errors.append(f"response_cache_entries must be 0 or more, got {self.response_cache_entries}")
+        if self.n_parallel < 1:
+            errors.append(f"n_parallel must be at least 1, got {self.n_parallel}")
+        if errors:
+            raise ConfigError(f"Invalid inference profile '{self.name}':\n  " + "\n  ".join(errors))
+        return self
+
+def field_type(field):
+    """The concrete type of a profile field, unwrapping Optional[...]."""
+    args = getattr(field.type, "__args__", None)
+    return args[0] if args else field.type
+
+def parse_value(field, text):
+    text = str(text).strip()
+    kind = field_type(field)
+    if text.lower() in ("none", "auto", "") and kind is int and field.default is None:
+        return None
+    try:
+        if kind is bool:
+            if text.lower() in ("1", "true", "yes", "on"):
+                return True
+            if text.lower() in ("0", "false", "no", "off"):
+                return False
+            raise ValueError(text)
+        return kind(text)
+    except ValueError:
+        raise ConfigError(f"Invalid value for {field.name}: {text!r}")
+
+def tunable_fields():
+    return [field for field in fields(InferenceProfile) if field.name != "name"]
+
+def load_profile(name=None, overrides=None, environ=None):
+    """Build and validate the active profile.
+
+    `overrides` maps field names to values (already typed, or strings as given
+    on the command line); None values are ignored.
+    """
+    environ = os.environ if environ is None else environ
+    name = name or environ.get(ENV_PREFIX + "PROFILE") or config.DEFAULT_PROFILE
+    if name not in config.PROFILES:
+        raise ConfigError(f"Unknown profile '{name}'. Available: {', '.join(config.PROFILES)}")
+
+    values = dict(config.PROFILES[name])
+    unknown = set(values) - {field.name for field in tunable_fields()}
+    if unknown:
+        raise ConfigError(f"Profile '{name}' has unknown settings: {', '.join(sorted(unknown))}")
+
+    for field in tunable_fields():
+        env_value = environ.get(ENV_PREFIX + field.name.upper())
+        if env_value is not None:
+            values[field.name] = parse_value(field, env_value)
+    for field in tunable_fields():
+        value = (overrides or {}).get(field.name)
+        if value is not None:
+            values[field.name] = parse_value(field, value) if isinstance(value, str) else value
+
+    return InferenceProfile(name=name, **values).validate()
+
+def add_profile_arguments(parser):
+    """Add --profile and one --<field> option per profile setting to an argparse parser."""
+    group = parser.add_argument_group("inference profile")
+    group.add_argument("--profile", choices=sorted(config.PROFILES),
+                       help=f"performance profile (default: {config.DEFAULT_PROFILE}, or ${ENV_PREFIX}PROFILE)")
+    for field in tunable_fields():
+        group.add_argument(f"--{field.name.replace('_', '-')}", dest=f"profile_{field.name}",
+                           metavar=field_type(field).__name__.upper(),
+                           help=f"override the profile's {field.name}")
+
+def profile_from_args(args):
+    overrides = {field.name: getattr(args, f"profile_{field.name}") for field in tunable_fields()}
+    return load_profile(args.profile, overrides)
@@ -0,0 +1,65 @@
+"""
+Speculative prefill from partial speech transcripts.
+
+A streaming recognizer revises the last word or two of its partial
+transcript as the user keeps talking, but earlier words rarely change. The
+words that two consecutive partials agree on are treated as stable and handed
+to HealthEngine.prefill, which evaluates that much of the prompt while the
+user is still speaking. If the final transcript differs, the engine rolls the
+KV cache back to the point of divergence, so a wrong guess costs nothing but
+idle CPU time.
+"""
+
+import threading
+
+def stable_prefix(previous, current):
+    """The leading words of `current` that `previous` already had, minus the last one."""
+    stable = []
+    for a, b in zip(previous.split(), current.split()):
+        if a != b:
+            break
+        stable.append(a)
+    # The last agreed word may still be growing ("fever" -> "feverish")
+    return " ".join(stable[:-1])
+
+class SpeculativePrefill:
+    """Feeds stable parts of partial transcripts to engine.prefill on a background thread."""
+
+    def __init__(self, engine, language, session=None):
+        self.engine = engine
+        self.language = language
+        self.session = session # The prompt includes this conversation's history
+        self.previous = ""
+        self.latest = "" # Most recent stable prefix, waiting to be evaluated
+        self.evaluated = ""
+        self.wake = threading.Event()
+        self.closed = False
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def update(self, partial):
+        """Called with each partial transcript."""
+        stable = stable_prefix(self.previous, partial)
+        self.previous = partial
+        if stable and stable != self.latest:
+            self.latest = stable
+            self.wake.set()
+
+    def run(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            if self.closed:
+                break
+            text = self.latest
+            if text == self.evaluated:
+                continue
+            try:
+                # Only the newest prefix matters; intermediate ones are skipped
+                if self.engine.prefill(text, self.language, self.session) is not None:
+                    self.evaluated = text
+            except Exception as e:
+                print(f"Speculative prefill error: {e}")
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
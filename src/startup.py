@@ -0,0 +1,105 @@
+"""
+Startup timeline for the desktop app.
+
+The window comes up before anything slow happens. The heavy libraries
+(llama_cpp, pygame, speech_recognition, numpy) are imported, and the audio
+mixer and microphone opened, by background startup tasks that begin once
+the window is on screen. StartupTimeline records when each milestone is
+reached, how long each task took and, like `python -X importtime`, how long
+each deferred import took, so a slow start can be pinned to one phase.
+
+With --startup-report the timeline is printed and saved as JSON once every
+task has finished. scripts/test_startup.py uses it as a regression test.
+"""
+
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+class StartupTimeline:
+    def __init__(self, start=None):
+        """Times are in milliseconds since `start` (a time.perf_counter() value)."""
+        self.start = start if start is not None else time.perf_counter()
+        self.marks = {} # milestone -> ms
+        self.imports = {} # module -> ms spent importing it
+        self.tasks = {} # task -> {"started", "duration", "error"}
+        self.extra = {} # Further details for the report, e.g. model load phases
+        self.pending = 0
+        self.ready_callbacks = []
+        self.lock = threading.Lock()
+
+    def elapsed(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def mark(self, name):
+        """Record the first time milestone `name` is reached."""
+        with self.lock:
+            self.marks.setdefault(name, self.elapsed())
+
+    def timed_import(self, name):
+        """Import module `name`, recording the time if this is its first import."""
+        if name in sys.modules:
+            return sys.modules[name]
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        with self.lock:
+            self.imports.setdefault(name, (time.perf_counter() - started) * 1000)
+        return module
+
+    def run_tasks(self, tasks):
+        """Run each function of {name: function} on its own background thread.
+
+        Startup is ready once all of them have finished.
+        """
+        with self.lock:
+            self.pending += len(tasks)
+        for name, function in tasks.items():
+            threading.Thread(target=self.task, args=(name, function), daemon=True).start()
+
+    def task(self, name, function):
+        started = self.elapsed()
+        error = None
+        try:
+            function()
+        except Exception as e:
+            error = str(e)
+            print(f"Startup task {name} failed: {e}")
+        with self.lock:
+            self.tasks[name] = {"started": started, "duration": self.elapsed() - started, "error": error}
+            self.pending -= 1
+            ready = self.pending == 0
+        if ready:
+            self.mark("ready")
+            for callback in self.ready_callbacks:
+                callback(self)
+
+    def on_ready(self, callback):
+        """Call callback(timeline) once every startup task has finished."""
+        self.ready_callbacks.append(callback)
+
+    def report(self):
+        with self.lock:
+            return {"marks": dict(self.marks), "tasks": dict(self.tasks),
+                    "imports": dict(self.imports), **self.extra}
+
+    def format_report(self):
+        report = self.report()
+        lines = ["Startup timeline (ms since launch):"]
+        for name, at in sorted(report["marks"].items(), key=lambda item: item[1]):
+            lines.append(f"  {at:8.1f}  {name}")
+        lines.append("Startup tasks (ms):")
+        for name, task in sorted(report["tasks"].items(), key=lambda item: item[1]["started"]):
+            status = f"  FAILED: {task['error']}" if task["error"] else ""
+            lines.append(f"  {task['started']:8.1f} +{task['duration']:8.1f}  {name}{status}")
+        lines.append("Deferred imports (ms):")
+        for name, duration in sorted(report["imports"].items(), key=lambda item: -item[1]):
+            lines.append(f"  {duration:8.1f}  {name}")
+        return "\n".join(lines)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
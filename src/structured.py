@@ -0,0 +1,272 @@
+"""
+Structured answers: the model fills in a typed record instead of free text.
+
+With STRUCTURED_OUTPUT enabled, generation is constrained by a llama.cpp
+grammar built from answer_schema(), so the model can only produce a JSON
+object with the fields below, in order. Nothing has to be re-generated
+because a section is missing or mislabelled, and the fixed disclaimer is
+inserted from config instead of being generated token by token.
+
+AnswerParser reads the JSON incrementally as tokens arrive, and
+AnswerRenderer turns each field into its numbered section (labels from
+config.RESPONSE_TEMPLATES) as soon as it starts, so the chat pane and speech
+fill in section by section exactly as for plain answers. An answer cut off by
+max_tokens still renders every section it got to. field_limits() sizes the
+fields from max_tokens so that even the longest record the grammar allows
+is complete before the limit.
+"""
+
+import json
+
+import config
+
+# (field, type) in the order the model writes them; the disclaimer comes from config
+FIELDS = [
+    ("name", "string"),
+    ("overview", "string"),
+    ("symptoms", "list"),
+    ("treatments", "list"),
+    ("remedies", "list"),
+    ("when_to_consult", "string")
+]
+
+# Position of each field's heading in RESPONSE_TEMPLATES[language]["structure"]
+SECTIONS = ["name", "disclaimer", "overview", "symptoms", "treatments", "remedies", "when_to_consult"]
+
+DEVANAGARI_DIGITS = str.maketrans("0123456789", "०१२३४५६७८९")
+
+ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+# Tokens of JSON around the field text: the keys, braces and brackets, and the quotes and comma of each item
+RECORD_OVERHEAD_TOKENS = 48
+ITEM_OVERHEAD_TOKENS = 3
+
+def answer_schema(max_items=8, max_chars=None):
+    """JSON schema of the record the model generates.
+
+    `max_chars` bounds the length of each string field, and of each item of
+    the list fields under "item", so a runaway string cannot use up the
+    token budget and leave the record unparseable.
+    """
+    max_chars = max_chars or {}
+    properties = {}
+    for field, kind in FIELDS:
+        if kind == "list":
+            item = string_schema(max_chars.get("item"))
+            properties[field] = {"type": "array", "items": item, "minItems": 1, "maxItems": max_items}
+        else:
+            properties[field] = string_schema(max_chars.get(field))
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": [field for field, _ in FIELDS],
+        "additionalProperties": False
+    }
+
+def field_limits(max_tokens, shares, max_items, min_item_chars, chars_per_token=1.0):
+    """(max_items, max_chars) for answer_schema() such that the longest record fits in `max_tokens`.
+
+    Each string field gets its share of the tokens left after the JSON
+    syntax, and each list its "list" share, split among as many items (up to
+    `max_items`) as leave every item `min_item_chars`. `chars_per_token` is
+    the fewest characters a token may hold in the answer's language: 1 for
+    Devanagari, where a character can take a token of its own.
+    """
+    total = sum(shares["list"] if kind == "list" else shares[field] for field, kind in FIELDS)
+    if total > 1:
+        raise ValueError(f"Structured output shares add up to {total:.2f}, more than all of max_tokens")
+    budget = max(0, max_tokens - RECORD_OVERHEAD_TOKENS)
+    max_chars = {field: max(1, int(budget * shares[field] * chars_per_token))
+                 for field, kind in FIELDS if kind != "list"}
+    list_tokens = budget * shares["list"]
+    items = max_items
+    while items > 1 and (list_tokens / items - ITEM_OVERHEAD_TOKENS) * chars_per_token < min_item_chars:
+        items -= 1
+    max_chars["item"] = max(1, int((list_tokens / items - ITEM_OVERHEAD_TOKENS) * chars_per_token))
+    return items, max_chars
+
+def string_schema(max_length=None):
+    return {"type": "string", "maxLength": max_length} if max_length else {"type": "string"}
+
+def answer_grammar(max_items=8, max_chars=None):
+    """llama.cpp grammar that only accepts answer_schema() records."""
+    from llama_cpp import LlamaGrammar
+    return LlamaGrammar.from_json_schema(json.dumps(answer_schema(max_items, max_chars)), verbose=False)
+
+class AnswerParser:
+    """Incremental parser for the flat JSON records of answer_schema().
+
+    feed() returns (field, index, text) pieces as string values grow; `index`
+    is the item number for list fields and None otherwise. `record` holds
+    everything parsed so far, and `complete` is set at the closing brace.
+    """
+
+    def __init__(self):
+        self.record = {}
+        self.state = "start"
+        self.key = ""
+        self.index = None
+        self.escape = None # Characters of an escape sequence after the backslash
+        self.high_surrogate = None
+        self.complete = False
+
+    def feed(self, text):
+        pieces = []
+        for char in text:
+            self.step(char, pieces)
+        # Join consecutive characters of the same value into one piece
+        merged = []
+        for field, index, value in pieces:
+            if merged and merged[-1][:2] == (field, index):
+                merged[-1] = (field, index, merged[-1][2] + value)
+            else:
+                merged.append((field, index, value))
+        return merged
+
+    def step(self, char, pieces):
+        state = self.state
+        if state == "string":
+            value = self.string_char(char)
+            if value is None:
+                return
+            if value is False:
+                self.state = "array" if self.index is not None else "object"
+                return
+            if self.index is None:
+                self.record[self.key] = self.record.get(self.key, "") + value
+            else:
+                self.record[self.key][self.index] += value
+            pieces.append((self.key, self.index, value))
+        elif state == "key":
+            value = self.string_char(char)
+            if value is False:
+                self.state = "colon"
+            elif value is not None:
+                self.key += value
+        elif char.isspace() or self.complete:
+            return
+        elif state == "start":
+            if char == "{":
+                self.state = "object"
+        elif state == "object":
+            if char == '"':
+                self.key = ""
+                self.index = None
+                self.state = "key"
+            elif char == "}":
+                self.complete = True
+        elif state == "colon":
+            if char == ":":
+                self.state = "value"
+        elif state == "value":
+            if char == '"':
+                self.record[self.key] = ""
+                self.state = "string"
+            elif char == "[":
+                self.record[self.key] = []
+                self.state = "array"
+            else:
+                self.state = "scalar" # Not part of the schema; skipped
+        elif state == "scalar":
+            if char in ",}":
+                self.state = "object"
+                if char == "}":
+                    self.complete = True
+        elif state == "array":
+            if char == '"':
+                self.record[self.key].append("")
+                self.index = len(self.record[self.key]) - 1
+                self.state = "string"
+            elif char == "]":
+                self.index = None
+                self.state = "object"
+
+    def string_char(self, char):
+        """Decoded text for `char` inside a string, None while an escape is incomplete, False at the end."""
+        if self.escape is None:
+            if char == "\\":
+                self.escape = ""
+                return None
+            if char == '"':
+                return False
+            return char
+        self.escape += char
+        if self.escape[0] != "u":
+            escape, self.escape = self.escape, None
+            return ESCAPES.get(escape, escape)
+        if len(self.escape) < 5:
+            return None
+        code = int(self.escape[1:], 16)
+        self.escape = None
+        if 0xD800 <= code < 0xDC00:
+            self.high_surrogate = code
+            return None
+        if 0xDC00 <= code < 0xE000 and self.high_surrogate is not None:
+            code = 0x10000 + ((self.high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self.high_surrogate = None
+        return chr(code)
+
+class AnswerRenderer:
+    """Renders a streamed record as the numbered sections of a plain answer."""
+
+    def __init__(self, language):
+        self.language = language
+        self.parser = AnswerParser()
+        self.section = None
+        self.item = None
+        self.disclaimer_shown = False
+        self.parts = []
+
+    def heading(self, field):
+        structure = config.RESPONSE_TEMPLATES[self.language]["structure"]
+        position = SECTIONS.index(field)
+        number = f"{position + 1}."
+        if self.language == "Marathi":
+            number = number.translate(DEVANAGARI_DIGITS)
+        return f"{number} {structure[position].strip('* ')}"
+
+    def feed(self, text):
+        """Add raw model output; returns (section, rendered text) pieces."""
+        pieces = []
+        for field, index, value in self.parser.feed(text):
+            prefix = ""
+            if field != self.section:
+                if field not in SECTIONS:
+                    continue
+                prefix = self.open_section(field)
+                self.section = field
+                self.item = None
+            if index is not None and index != self.item:
+                prefix += "\n- "
+                self.item = index
+            pieces.append((field, prefix + value))
+        self.parts.extend(piece for _, piece in pieces)
+        return pieces
+
+    def open_section(self, field):
+        opening = "" if self.section is None else "\n\n"
+        if field != "name" and not self.disclaimer_shown:
+            self.disclaimer_shown = True
+            opening += f"{self.heading('disclaimer')} {self.disclaimer()}\n\n"
+        separator = "" if dict(FIELDS)[field] == "list" else " "
+        return opening + self.heading(field) + separator
+
+    def disclaimer(self):
+        return config.SUPPORTED_LANGUAGES[self.language]["disclaimer"]
+
+    def finish(self):
+        """Pieces still owed once generation has ended: the disclaimer, if no section after the name arrived."""
+        if self.disclaimer_shown:
+            return []
+        self.disclaimer_shown = True
+        opening = "" if self.section is None else "\n\n"
+        piece = f"{opening}{self.heading('disclaimer')} {self.disclaimer()}"
+        self.parts.append(piece)
+        return [("disclaimer", piece)]
+
+    def text(self):
+        return "".join(self.parts)
+
+    def record(self):
+        """The parsed record, with the disclaimer filled in."""
+        return dict(self.parser.record, disclaimer=self.disclaimer())
@@ -0,0 +1,301 @@
+"""
+Per-stage tracing and metrics for the question/answer pipeline.
+
+Each stage of the pipeline (listening, recognition, queue wait, prompt
+construction, generation, response parsing, speech synthesis, audio
+playback) runs inside a span:
+
+    with tracing.span("generate", max_tokens=512) as span:
+        ...
+        span.set(tokens=n)
+
+Spans of the same question share a trace id. It is held in a context
+variable; threads that continue a question's work enter
+`tracing.trace(trace_id)`. Every finished span updates in-process
+Prometheus metrics: a duration histogram per stage, span counts by outcome,
+and counters for the token, character and byte attributes. Spans are also
+appended to a JSON Lines trace file, for the sampled fraction of traces, by a
+background writer, so the hot path never waits for the disk.
+
+SamplingProfiler is an opt-in, low-overhead profiler. It samples every
+thread's Python stack at a fixed interval and writes them in the collapsed
+format read by flamegraph.pl and speedscope.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+import config
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Numeric span attributes that are summed into <name>_total counters
+COUNTED_ATTRIBUTES = ("tokens", "prompt_tokens", "chars", "bytes")
+
+current_trace_id = contextvars.ContextVar("trace_id", default=None)
+
+logger = logging.getLogger("health_assistant.trace")
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+def current_trace():
+    return current_trace_id.get()
+
+def start_trace():
+    """Begin a new trace on this thread (for threads that handle one question)."""
+    trace_id = new_trace_id()
+    current_trace_id.set(trace_id)
+    return trace_id
+
+@contextmanager
+def trace(trace_id):
+    """Attribute spans started in this block (on this thread) to `trace_id`."""
+    token = current_trace_id.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        current_trace_id.reset(token)
+
+class Span:
+    __slots__ = ("name", "trace_id", "started", "duration_ms", "outcome", "attributes")
+
+    def __init__(self, name, trace_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.started = time.time()
+        self.duration_ms = None
+        self.outcome = "ok"
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {"name": self.name, "trace": self.trace_id, "start": self.started,
+                "duration_ms": self.duration_ms, "outcome": self.outcome, **self.attributes}
+
+def label_text(labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+class Tracer:
+    def __init__(self, trace_file=None, sample_rate=1.0, slow_span_ms=None, max_trace_bytes=None):
+        self.trace_file = trace_file
+        self.sample_rate = sample_rate
+        self.slow_span_ms = slow_span_ms
+        self.max_trace_bytes = max_trace_bytes
+        self.lock = threading.Lock()
+        self.histograms = {} # stage -> [bucket counts..., +Inf count, sum of seconds]
+        self.counters = Counter() # (metric, labels) -> value
+        self.pending = None
+        self.writer = None
+        if trace_file is not None:
+            self.pending = queue.SimpleQueue()
+            self.writer = threading.Thread(target=self.write_spans, daemon=True)
+            self.writer.start()
+
+    @contextmanager
+    def span(self, name, trace_id=None, **attributes):
+        span = Span(name, trace_id or current_trace_id.get(), attributes)
+        start = time.perf_counter()
+        try:
+            yield span
+        except GeneratorExit:
+            span.outcome = "cancelled" # A streaming consumer stopped early
+            raise
+        except Exception as e:
+            span.outcome = "error"
+            span.attributes["error"] = str(e)
+            raise
+        finally:
+            span.duration_ms = (time.perf_counter() - start) * 1000
+            self.finish(span)
+
+    def record(self, name, duration_ms, trace_id=None, **attributes):
+        """Add a span measured elsewhere, e.g. a queue wait."""
+        span = Span(name, trace_id or current_trace_id.get(), attributes)
+        span.started -= duration_ms / 1000 # It ended now
+        span.duration_ms = duration_ms
+        self.finish(span)
+
+    def finish(self, span):
+        seconds = span.duration_ms / 1000
+        with self.lock:
+            histogram = self.histograms.setdefault(span.name, [0] * (len(DURATION_BUCKETS) + 2))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+            self.counters[("spans_total", (("stage", span.name), ("outcome", span.outcome)))] += 1
+            for attribute in COUNTED_ATTRIBUTES:
+                value = span.attributes.get(attribute)
+                if isinstance(value, (int, float)):
+                    self.counters[(f"{attribute}_total", (("stage", span.name),))] += value
+        if self.slow_span_ms is not None and span.duration_ms > self.slow_span_ms:
+            logger.warning("Slow %s: %.0f ms %s", span.name, span.duration_ms, span.attributes)
+        if span.outcome == "error":
+            logger.error("%s failed: %s", span.name, span.attributes.get("error"))
+        if self.pending is not None and self.sampled(span.trace_id):
+            self.pending.put(span.to_dict())
+
+    def sampled(self, trace_id):
+        """Keep or drop whole traces, so a kept trace has all of its stages."""
+        if self.sample_rate >= 1.0:
+            return True
+        if trace_id is None:
+            return random.random() < self.sample_rate
+        return int(trace_id[:8], 16) / 0xFFFFFFFF < self.sample_rate
+
+    def write_spans(self):
+        while True:
+            spans = [self.pending.get()]
+            while True:
+                try:
+                    spans.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            if None in spans:
+                spans = spans[:spans.index(None)]
+                self.append(spans)
+                break
+            self.append(spans)
+
+    def append(self, spans):
+        if not spans:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.trace_file), exist_ok=True)
+            if (self.max_trace_bytes and os.path.exists(self.trace_file)
+                    and os.path.getsize(self.trace_file) > self.max_trace_bytes):
+                os.replace(self.trace_file, self.trace_file + ".1") # Keep one older file
+            with open(self.trace_file, 'a', encoding='utf-8') as f:
+                for span in spans:
+                    f.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"Trace file error: {e}")
+
+    def prometheus(self, prefix="health_assistant"):
+        """Metrics in the Prometheus text exposition format."""
+        with self.lock:
+            histograms = {stage: list(values) for stage, values in self.histograms.items()}
+            counters = dict(self.counters)
+        lines = [
+            f"# HELP {prefix}_stage_duration_seconds Time spent in each pipeline stage",
+            f"# TYPE {prefix}_stage_duration_seconds histogram"
+        ]
+        for stage, values in sorted(histograms.items()):
+            for bound, count in zip(DURATION_BUCKETS, values):
+                lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {values[-2]}')
+            lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{stage}"}} {values[-1]}')
+            lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{stage}"}} {values[-2]}')
+        for metric in sorted({metric for metric, _ in counters}):
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f"{prefix}_{metric}{{{label_text(labels)}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        """Write out the spans still queued for the trace file."""
+        if self.writer is not None:
+            self.pending.put(None)
+            self.writer.join(timeout=5)
+
+# The process-wide tracer; configure() replaces it
+tracer = Tracer()
+
+def span(name, trace_id=None, **attributes):
+    return tracer.span(name, trace_id, **attributes)
+
+def record(name, duration_ms, trace_id=None, **attributes):
+    tracer.record(name, duration_ms, trace_id, **attributes)
+
+def configure(trace_file=None, settings=None):
+    """Set up logging from config.LOGGING and the tracer from config.TRACING.
+
+    `trace_file` overrides the configured trace file. Returns the tracer.
+    """
+    global tracer
+    settings = settings or config.TRACING
+    logging_settings = config.LOGGING
+    if logging_settings["file"]:
+        os.makedirs(os.path.dirname(logging_settings["file"]) or ".", exist_ok=True)
+    logging.basicConfig(level=logging_settings["level"], format=logging_settings["format"],
+                        filename=logging_settings["file"])
+    if not settings["enabled"]:
+        return tracer
+    tracer = Tracer(
+        trace_file or settings["trace_file"],
+        sample_rate=settings["sample_rate"],
+        slow_span_ms=settings["slow_span_ms"],
+        max_trace_bytes=settings["max_trace_mb"] * 1024 * 1024 if settings["max_trace_mb"] else None
+    )
+    return tracer
+
+class SamplingProfiler:
+    """Samples the Python stacks of all threads every `interval_ms` milliseconds."""
+
+    def __init__(self, output, interval_ms=5):
+        self.output = output
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        """Stop sampling and write the collapsed stacks to self.output."""
+        self.stopped.set()
+        self.thread.join()
+        os.makedirs(os.path.dirname(self.output) or ".", exist_ok=True)
+        with open(self.output, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Sampling profile ({self.samples} samples) written to {self.output}")
+
+def add_tracing_arguments(parser):
+    group = parser.add_argument_group("tracing")
+    group.add_argument("--trace-file", help="append pipeline spans to this JSON Lines file")
+    group.add_argument("--sampling-profiler", nargs="?", const=config.TRACING["sampling_profiler"]["output"],
+                       metavar="OUTPUT", help="sample Python stacks while running and write them to OUTPUT")
+
+def start_from_args(args):
+    """Configure tracing from parsed arguments; returns a started SamplingProfiler or None."""
+    configure(args.trace_file)
+    profiler_settings = config.TRACING["sampling_profiler"]
+    output = args.sampling_profiler or (profiler_settings["output"] if profiler_settings["enabled"] else None)
+    if output is None:
+        return None
+    return SamplingProfiler(output, profiler_settings["interval_ms"]).start()
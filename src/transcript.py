@@ -0,0 +1,68 @@
+"""
+Bounded chat transcript.
+
+The app keeps at most `max_messages` messages in memory, in a ring buffer of
+compact records. Older messages are appended to a JSON Lines archive file
+(when archiving is enabled) instead of piling up for the whole session. The
+chat widget shows an even shorter tail, so memory use and redraw cost stay
+flat however long the app runs.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+class Message:
+    __slots__ = ("id", "created", "kind", "text")
+
+    def __init__(self, message_id, kind, text):
+        self.id = message_id
+        self.created = time.time()
+        self.kind = kind # "user", "assistant" or "system"
+        self.text = text
+
+    def to_dict(self):
+        return {"id": self.id, "created": self.created, "kind": self.kind, "text": self.text}
+
+class Transcript:
+    def __init__(self, max_messages=200, archive_path=None):
+        """Messages beyond `max_messages` go to `archive_path`, or are dropped if it is None."""
+        self.max_messages = max_messages
+        self.archive_path = archive_path
+        self.messages = deque()
+        self.next_id = 1
+        self.archived = 0
+        self.lock = threading.Lock()
+
+    def append(self, kind, text):
+        with self.lock:
+            message = Message(self.next_id, kind, text)
+            self.next_id += 1
+            self.messages.append(message)
+            evicted = []
+            while len(self.messages) > self.max_messages:
+                evicted.append(self.messages.popleft())
+        if evicted:
+            self.archive(evicted)
+        return message
+
+    def archive(self, messages):
+        if self.archive_path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.archive_path), exist_ok=True)
+            with open(self.archive_path, 'a', encoding='utf-8') as f:
+                for message in messages:
+                    f.write(json.dumps(message.to_dict(), ensure_ascii=False) + "\n")
+            self.archived += len(messages)
+        except OSError as e:
+            print(f"Transcript archive error: {e}")
+
+    def close(self):
+        """Archive the messages still in memory, so the archive holds the whole session."""
+        with self.lock:
+            remaining = list(self.messages)
+            self.messages.clear()
+        self.archive(remaining)
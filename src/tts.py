@@ -0,0 +1,249 @@
+"""
+Streaming text-to-speech for spoken answers.
+
+Instead of waiting for the whole answer and synthesizing it in one call, the
+generated text is cut into sentences as the tokens arrive (SentenceSplitter).
+Each sentence is synthesized on a small thread pool while the model keeps
+generating, and the audio clips are handed to the player strictly in order,
+so the first sentence starts playing while the rest is still being written.
+
+Backends are interchangeable: "gtts" uses Google's online service and
+"espeak" runs espeak-ng locally, with no network access needed. Either can be
+wrapped in a CachedBackend so repeated sentences (the disclaimer, section
+headings, repeated answers) are read from the audio cache instead.
+"""
+
+import io
+import queue
+import re
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+
+# A sentence ends at ., ! or ? (not after a digit, so "1." list numbers don't
+# count) or at the Devanagari danda, followed by whitespace
+SENTENCE_END = re.compile(r'(?:(?<=[^\d\s][.!?])|(?<=[।॥]))\s+')
+# A numbered section label at the start of a line ("2. Disclaimer: ", "४. सामान्य लक्षणे: ")
+# is spoken as its own chunk, so it and the sentence after it are reusable clips
+SECTION_HEADING = re.compile(r'\s*\d+\.\s*[^:.!?।\n]{1,40}:\s+')
+
+def is_spoken_line(line):
+    """Headings (**...**) and bullet points (- ...) are shown but not read aloud."""
+    line = line.lstrip()
+    return not line.startswith('**') and not line.startswith('-')
+
+def clean_for_speech(text):
+    return " ".join(text.replace('*', '').split())
+
+class SentenceSplitter:
+    """Cut streamed text into speakable chunks as soon as each one is complete."""
+
+    def __init__(self, max_chars=200):
+        self.max_chars = max_chars
+        self.line = "" # Unspoken text of the current line
+        self.line_spoken = None # Whether the current line is read aloud; None until known
+        self.line_started = False # Whether part of the current line has been emitted
+
+    def feed(self, text):
+        """Add generated text; returns the sentences it completed."""
+        sentences = []
+        self.line += text
+        while '\n' in self.line:
+            line, self.line = self.line.split('\n', 1)
+            if self.decide(line):
+                sentences.extend(self.split(line)[0])
+            self.line_spoken = None
+            self.line_started = False
+        if self.decide(self.line, partial=True):
+            complete, self.line = self.split(self.line, final=False)
+            sentences.extend(complete)
+        return sentences
+
+    def flush(self):
+        """Return whatever is left once generation has finished."""
+        sentences = self.split(self.line)[0] if self.decide(self.line) else []
+        self.line = ""
+        self.line_spoken = None
+        self.line_started = False
+        return sentences
+
+    def decide(self, line, partial=False):
+        if self.line_spoken is None:
+            stripped = line.lstrip()
+            if partial and len(stripped) < 2:
+                return False # Too short to tell a heading or bullet apart yet
+            self.line_spoken = is_spoken_line(stripped)
+        return self.line_spoken
+
+    def split(self, line, final=True):
+        """Return (complete sentences, text still waiting for its sentence end)."""
+        parts = []
+        heading = None if self.line_started else SECTION_HEADING.match(line)
+        if heading:
+            parts.append(heading.group())
+            line = line[heading.end():]
+        parts.extend(SENTENCE_END.split(line))
+        # Unless the line is complete, the last part may still be growing
+        rest = "" if final else parts.pop()
+        if len(rest) > self.max_chars:
+            # A very long sentence is spoken in pieces, cut at a comma or space
+            cut = max(rest.rfind(', ', 0, self.max_chars), rest.rfind(' ', 0, self.max_chars))
+            if cut > 0:
+                parts.append(rest[:cut + 1])
+                rest = rest[cut + 1:]
+        sentences = [sentence for sentence in map(clean_for_speech, parts) if sentence]
+        if sentences:
+            self.line_started = True
+        return sentences, rest
+
+class GTTSBackend:
+    """Google Text-to-Speech (online)."""
+    name = "gtts"
+    format = "mp3"
+
+    def __init__(self):
+        from gtts import gTTS
+        self.gTTS = gTTS
+
+    def synthesize(self, text, language):
+        buffer = io.BytesIO()
+        self.gTTS(text=text, lang=language, slow=False).write_to_fp(buffer)
+        return buffer.getvalue()
+
+class EspeakBackend:
+    """espeak-ng running locally (offline); has English and Marathi voices."""
+    name = "espeak"
+    format = "wav"
+
+    def __init__(self):
+        self.executable = shutil.which("espeak-ng") or shutil.which("espeak")
+        if self.executable is None:
+            raise Exception("espeak-ng is not installed")
+
+    def synthesize(self, text, language):
+        result = subprocess.run([self.executable, "-v", language, "--stdout", text],
+                                capture_output=True, check=True, timeout=60)
+        return result.stdout
+
+class CachedBackend:
+    """Wraps a backend with an AudioCache keyed by (backend, language, sentence)."""
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+        self.name = backend.name
+        self.format = backend.format
+
+    def synthesize(self, text, language):
+        key = self.cache.key(self.name, language, text)
+        audio = self.cache.get(key, self.format)
+        if audio is None:
+            audio = self.backend.synthesize(text, language)
+            self.cache.put(key, self.format, audio)
+        return audio
+
+TTS_BACKENDS = {
+    "gtts": GTTSBackend,
+    "espeak": EspeakBackend
+}
+
+def create_tts_backend(name):
+    if name not in TTS_BACKENDS:
+        raise Exception(f"Unknown TTS backend '{name}'. Available: {', '.join(TTS_BACKENDS)}")
+    return TTS_BACKENDS[name]()
+
+def report_prewarm_error(future):
+    if future.exception() is not None:
+        print(f"Audio prewarm error: {future.exception()}")
+
+class Utterance:
+    """One spoken answer: sentences go in as they are generated, audio comes out in order."""
+
+    def __init__(self, pipeline, language):
+        self.pipeline = pipeline
+        self.language = language
+        self.splitter = SentenceSplitter(pipeline.max_sentence_chars)
+        self.clips = queue.Queue() # Futures in sentence order; None marks the end
+        self.cancelled = False
+        self.thread = None
+        self.trace_id = tracing.current_trace() # The question this answer belongs to
+
+    def feed(self, text):
+        for sentence in self.splitter.feed(text):
+            self.submit(sentence)
+
+    def finish(self):
+        for sentence in self.splitter.flush():
+            self.submit(sentence)
+        self.clips.put(None)
+
+    def submit(self, sentence):
+        if self.cancelled:
+            return
+        self.clips.put(self.pipeline.executor.submit(self.synthesize, sentence))
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.deliver, daemon=True)
+            self.thread.start()
+
+    def synthesize(self, sentence):
+        with tracing.span("tts_synthesize", self.trace_id, backend=self.pipeline.backend.name, chars=len(sentence)) as span:
+            audio = self.pipeline.backend.synthesize(sentence, self.language)
+            span.set(bytes=len(audio))
+        return audio
+
+    def deliver(self):
+        """Hand finished clips to the player in sentence order."""
+        tracing.current_trace_id.set(self.trace_id)
+        while True:
+            clip = self.clips.get()
+            if clip is None or self.cancelled:
+                break
+            try:
+                audio = clip.result()
+            except Exception as e:
+                print(f"Audio generation error: {e}")
+                continue
+            if not self.cancelled:
+                self.pipeline.play(audio, self.pipeline.backend.format)
+
+    def cancel(self):
+        self.cancelled = True
+        self.clips.put(None)
+        while True:
+            try:
+                clip = self.clips.get_nowait()
+            except queue.Empty:
+                break
+            if clip is not None:
+                clip.cancel()
+
+class SpeechPipeline:
+    def __init__(self, backend, play, workers=3, max_sentence_chars=200):
+        """`play(audio_bytes, format)` is called with each clip, in order, from a background thread."""
+        self.backend = backend
+        self.play = play
+        self.max_sentence_chars = max_sentence_chars
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        self.current = None
+
+    def prewarm(self, texts):
+        """Synthesize (language, text) pairs in the background so their clips are cached before first use."""
+        for language, text in texts:
+            splitter = SentenceSplitter(self.max_sentence_chars)
+            for sentence in splitter.feed(text) + splitter.flush():
+                future = self.executor.submit(self.backend.synthesize, sentence, language)
+                future.add_done_callback(report_prewarm_error)
+
+    def start(self, language):
+        """Begin a new spoken answer, silencing any previous one."""
+        self.stop()
+        self.current = Utterance(self, language)
+        return self.current
+
+    def stop(self):
+        if self.current is not None:
+            self.current.cancel()
+            self.current = None
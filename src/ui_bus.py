@@ -0,0 +1,65 @@
+"""
+Thread-safe UI update bus for the Tkinter app.
+
+Tk widgets may only be touched from the main thread. Worker threads (model
+loading, generation, speech) post events here instead; the Tk main loop
+drains the queue once per frame and applies everything that arrived in one
+pass. Consecutive streamed text is joined into a single insert and a run of
+status updates collapses to its last one, so the cost per frame stays the
+same whether the model produces ten or a thousand tokens per second.
+Events are applied in the order they were posted: a status set by a later
+call is never overwritten by an earlier one.
+"""
+
+import queue
+
+class UIBus:
+    def __init__(self, root, handlers, interval_ms=33):
+        """`handlers` maps event kinds to functions run on the Tk thread.
+
+        Runs of consecutive "text" events are joined and runs of "status"
+        events collapse to the latest; everything is applied in order.
+        """
+        self.root = root
+        self.handlers = handlers
+        self.interval_ms = interval_ms
+        self.events = queue.SimpleQueue()
+        self.root.after(interval_ms, self.drain)
+
+    def post(self, kind, *args):
+        """Queue an update; safe to call from any thread."""
+        self.events.put((kind, args))
+
+    def call(self, function, *args):
+        """Run function(*args) on the Tk thread at the next frame."""
+        self.events.put((None, (function,) + args))
+
+    def drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+
+        for kind, args in coalesce(batch):
+            try:
+                if kind is None:
+                    args[0](*args[1:])
+                else:
+                    self.handlers[kind](*args)
+            except Exception as e:
+                print(f"UI update error: {e}")
+        self.root.after(self.interval_ms, self.drain)
+
+def coalesce(events):
+    """Join runs of consecutive "text" events into one and keep the last of consecutive "status" events."""
+    merged = []
+    for kind, args in events:
+        if kind == "text" and merged and merged[-1][0] == "text":
+            merged[-1][1].append(args[0])
+        elif kind == "status" and merged and merged[-1][0] == "status":
+            merged[-1] = (kind, args)
+        else:
+            merged.append((kind, [args[0]] if kind == "text" else args))
+    return [(kind, ("".join(args),) if kind == "text" else args) for kind, args in merged]
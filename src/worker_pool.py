@@ -0,0 +1,350 @@
+"""
+Pool of model worker processes for multi-core CPU servers.
+
+A single llama.cpp context stops scaling well past a handful of threads, so
+on large CPU-only hosts ModelPool starts N worker processes instead. Each one
+loads its own Llama instance (the GGUF weights are memory-mapped, so the page
+cache is shared between them; only the KV caches are per process), is pinned
+to its own slice of CPUs and runs with n_threads sized to that slice.
+
+ModelPool is a HealthEngine, so the scheduler and the HTTP server drive it
+exactly like an in-process engine: the parent keeps the response cache and
+prompt construction, and each generate_response_stream call is dispatched to
+the least busy worker.
+
+A worker that dies (crash, OOM kill) fails the requests it was serving
+within health_check_seconds instead of leaving their callers waiting, and
+gets no new ones. Cancelled request ids are sent to the worker on its own
+queue, so a request cancelled while still queued on a worker is skipped
+when its turn comes.
+
+The auto-tuner tries several workers x threads layouts on the current host and
+records the one with the best aggregate tokens/sec:
+
+    python src/worker_pool.py --autotune
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import config
+from engine import HealthEngine
+from settings import load_profile
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def cpu_subsets(n_workers, cpus=None):
+    """Split the CPUs into `n_workers` contiguous, equally sized slices."""
+    cpus = cpus or available_cpus()
+    per_worker = max(1, len(cpus) // n_workers)
+    return [cpus[i * per_worker:(i + 1) * per_worker] or cpus for i in range(n_workers)]
+
+def worker_main(worker_id, cpus, profile, tasks, results, cancels):
+    """Entry point of a worker process: load a model, then serve prompts from `tasks`."""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    engine = HealthEngine(
+        profile,
+        use_response_cache=False # The parent process owns the response cache
+    )
+    try:
+        engine.load_model(progress=lambda message: results.put(("progress", worker_id, message)))
+    except Exception as e:
+        results.put(("failed", worker_id, str(e)))
+        return
+    results.put(("ready", worker_id, None))
+
+    cancelled = set()
+
+    def is_cancelled(request_id):
+        while True:
+            try:
+                cancelled.add(cancels.get_nowait())
+            except queue.Empty:
+                return request_id in cancelled
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        request_id, prompt_messages, max_tokens, language, structured = task
+        if is_cancelled(request_id):
+            # Cancelled while it waited in this worker's queue
+            results.put(("end", request_id, None))
+            results.put(("idle", worker_id, request_id))
+            cancelled.discard(request_id)
+            continue
+        stream = engine.generate_response_stream(prompt_messages, max_tokens, language, structured)
+        try:
+            for delta in stream:
+                if is_cancelled(request_id):
+                    break
+                results.put(("delta", request_id, delta))
+            results.put(("end", request_id, None))
+        except Exception as e:
+            results.put(("error", request_id, str(e)))
+        finally:
+            stream.close()
+            # Tasks are queued in id order (see generate_response_stream), so no
+            # cancel for this or an earlier id is still needed
+            cancelled = {other for other in cancelled if other > request_id}
+            results.put(("idle", worker_id, request_id))
+
+class Worker:
+    def __init__(self, worker_id, process, tasks, cancels, cpus, n_threads):
+        self.worker_id = worker_id
+        self.process = process
+        self.tasks = tasks
+        self.cancels = cancels
+        self.cpus = cpus
+        self.n_threads = n_threads
+        self.outstanding = 0
+        self.served = 0
+
+class ModelPool(HealthEngine):
+    def __init__(self, n_workers, n_threads=None, profile=None, use_response_cache=True):
+        # Each worker decodes one request at a time, so the pool never batches
+        profile = (profile or load_profile()).replace(batching=False)
+        super().__init__(profile, use_response_cache=use_response_cache)
+        self.n_workers = n_workers
+        self.n_threads = n_threads or self.profile.n_threads
+        # llama.cpp state and threads don't survive fork(); start workers fresh
+        self.mp = multiprocessing.get_context("spawn")
+        self.results = self.mp.Queue()
+        self.workers = []
+        self.outputs = {} # request id -> queue.Queue of (kind, payload)
+        self.request_ids = itertools.count(1)
+        self.dispatch_lock = threading.Lock()
+
+    def load_model(self, progress=print):
+        """Start the worker processes and wait until every one has loaded its model."""
+        subsets = cpu_subsets(self.n_workers)
+        for worker_id, cpus in enumerate(subsets):
+            n_threads = self.n_threads or len(cpus)
+            profile = self.profile.replace(n_threads=n_threads, n_threads_batch=n_threads)
+            tasks = self.mp.Queue()
+            cancels = self.mp.Queue()
+            process = self.mp.Process(
+                target=worker_main,
+                args=(worker_id, cpus, profile, tasks, self.results, cancels),
+                daemon=True
+            )
+            process.start()
+            self.workers.append(Worker(worker_id, process, tasks, cancels, cpus, n_threads))
+        progress(f"Starting {self.n_workers} model workers...")
+
+        ready = 0
+        while ready < self.n_workers:
+            try:
+                kind, worker_id, payload = self.results.get(timeout=config.WORKER_POOL["health_check_seconds"])
+            except queue.Empty:
+                dead = [w for w in self.workers if not w.process.is_alive()]
+                if dead:
+                    self.close()
+                    raise Exception(f"Model worker {dead[0].worker_id} exited while loading "
+                                    f"(exit code {dead[0].process.exitcode})")
+                continue
+            if kind == "ready":
+                ready += 1
+                progress(f"Model worker {worker_id} ready ({ready}/{self.n_workers})")
+            elif kind == "failed":
+                self.close()
+                raise Exception(f"Model worker {worker_id} failed to load: {payload}")
+            elif kind == "progress" and worker_id == 0:
+                progress(payload) # One worker's progress is representative
+
+        threading.Thread(target=self.route_results, daemon=True).start()
+        self.model_loaded = True
+
+    def parallelism(self):
+        return self.n_workers
+
+    def generate_response(self, prompt_messages, max_tokens=None, language=None, structured=False):
+        return "".join(self.generate_response_stream(prompt_messages, max_tokens, language, structured)).strip()
+
+    def generate_response_stream(self, prompt_messages, max_tokens=None, language=None, structured=False):
+        """Run the prompt on the least busy live worker, yielding its text deltas.
+
+        Raises if the worker dies before the answer is complete.
+        """
+        output = queue.Queue()
+        with self.dispatch_lock:
+            alive = [w for w in self.workers if w.process.is_alive()]
+            if not alive:
+                raise Exception("Model inference error: no model worker is running")
+            worker = min(alive, key=lambda w: w.outstanding)
+            worker.outstanding += 1
+            request_id = next(self.request_ids)
+            self.outputs[request_id] = output
+            # Queued under the lock, so each worker receives its tasks in id order
+            worker.tasks.put((request_id, prompt_messages, max_tokens, language, structured))
+
+        finished = False
+        try:
+            while True:
+                try:
+                    kind, payload = output.get(timeout=config.WORKER_POOL["health_check_seconds"])
+                except queue.Empty:
+                    if worker.process.is_alive():
+                        continue
+                    finished = True
+                    self.forget(worker, request_id)
+                    raise Exception(f"Model inference error: worker {worker.worker_id} exited "
+                                    f"(exit code {worker.process.exitcode})")
+                if kind == "delta":
+                    yield payload
+                elif kind == "error":
+                    finished = True
+                    raise Exception(f"Model inference error: {payload}")
+                else:
+                    finished = True
+                    return
+        finally:
+            if not finished:
+                # Abandoned (cancelled), queued or mid-stream: tell the worker to skip or stop it
+                worker.cancels.put(request_id)
+
+    def forget(self, worker, request_id):
+        """Drop a request whose worker died; its "idle" message will never come."""
+        with self.dispatch_lock:
+            worker.outstanding -= 1
+            self.outputs.pop(request_id, None)
+
+    def route_results(self):
+        """Deliver results from all workers to the generator waiting for them."""
+        while True:
+            try:
+                kind, key, payload = self.results.get()
+            except (EOFError, OSError):
+                return
+            if kind == "idle":
+                with self.dispatch_lock:
+                    worker = self.workers[key]
+                    worker.outstanding -= 1
+                    worker.served += 1
+                    self.outputs.pop(payload, None)
+                continue
+            output = self.outputs.get(key)
+            if output is not None:
+                output.put((kind, payload))
+
+    def status(self):
+        status = super().status()
+        with self.dispatch_lock:
+            status["workers"] = [
+                {"id": w.worker_id, "cpus": len(w.cpus), "n_threads": w.n_threads,
+                 "outstanding": w.outstanding, "served": w.served, "alive": w.process.is_alive()}
+                for w in self.workers
+            ]
+        return status
+
+    def close(self):
+        for worker in self.workers:
+            worker.tasks.put(None)
+        for worker in self.workers:
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+def measure_throughput(pool, concurrency, queries):
+    """Aggregate tokens/sec of `concurrency` simultaneous requests on a loaded pool."""
+    tokens = [0] * concurrency
+
+    def user(i):
+        language, query = queries[i % len(queries)]
+        for _ in pool.generate_response_stream(pool.construct_prompt(query, language)):
+            tokens[i] += 1
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return sum(tokens) / elapsed if elapsed > 0 else 0.0
+
+TUNING_QUERIES = [
+    ("English", "What are the symptoms of dengue?"),
+    ("Marathi", "मला डोकेदुखी आहे, काय करावे?"),
+    ("English", "How is malaria treated?"),
+    ("English", "What is a common cold?")
+]
+
+def candidate_layouts(n_cpus):
+    """workers x threads layouts that use every CPU, from one big worker to many small ones."""
+    layouts = []
+    workers = 1
+    while workers <= n_cpus and n_cpus // workers >= 2:
+        layouts.append((workers, n_cpus // workers))
+        workers *= 2
+    return layouts or [(1, n_cpus)]
+
+def host_key():
+    return f"{len(available_cpus())}cpu:{config.MODEL['filename']}"
+
+def autotune(layouts=None, requests_per_worker=2, max_tokens=64, progress=print):
+    """Benchmark each layout and save the fastest to config.WORKER_POOL["tuning_file"]."""
+    layouts = layouts or candidate_layouts(len(available_cpus()))
+    profile = load_profile().replace(max_tokens=max_tokens)
+    results = []
+    for n_workers, n_threads in layouts:
+        progress(f"Trying {n_workers} workers x {n_threads} threads...")
+        pool = ModelPool(n_workers, n_threads, profile, use_response_cache=False)
+        try:
+            pool.load_model(progress=lambda message: None)
+            measure_throughput(pool, n_workers, TUNING_QUERIES) # Warm-up
+            tokens_per_sec = measure_throughput(pool, n_workers * requests_per_worker, TUNING_QUERIES)
+        finally:
+            pool.close()
+        progress(f"  {tokens_per_sec:.1f} tokens/s")
+        results.append({"workers": n_workers, "threads": n_threads, "tokens_per_sec": tokens_per_sec})
+
+    best = max(results, key=lambda r: r["tokens_per_sec"])
+    save_tuning(best, results)
+    return best
+
+def save_tuning(best, results):
+    path = config.WORKER_POOL["tuning_file"]
+    tuning = load_all_tuning()
+    tuning[host_key()] = {"best": best, "results": results, "tuned_at": time.time()}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(tuning, f, indent=2)
+
+def load_all_tuning():
+    try:
+        with open(config.WORKER_POOL["tuning_file"], encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def load_tuning():
+    """Return the tuned {"workers", "threads"} layout for this host, or None if never tuned."""
+    entry = load_all_tuning().get(host_key())
+    return entry["best"] if entry else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the model worker pool for this host")
+    parser.add_argument("--autotune", action="store_true", help="benchmark workers x threads layouts and save the best")
+    parser.add_argument("--max-tokens", type=int, default=64, help="tokens generated per tuning request")
+    args = parser.parse_args()
+
+    if args.autotune:
+        best = autotune(max_tokens=args.max_tokens)
+        print(f"Best layout: {best['workers']} workers x {best['threads']} threads "
+              f"({best['tokens_per_sec']:.1f} tokens/s), saved to {config.WORKER_POOL['tuning_file']}")
+    else:
+        print(json.dumps(load_tuning(), indent=2))
+
+if __name__ == "__main__":
+    main()